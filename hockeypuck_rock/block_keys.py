@@ -3,25 +3,46 @@
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 
-"""This script adds fingerprints to the deleted_keys table in the Hockeypuck's database."""
+"""This script adds fingerprints to the deleted_keys table in the Hockeypuck's database.
+
+With --delete, the keys are also removed from the Hockeypuck key tables in the same transaction,
+without going through the signed HKP delete requests.
+
+With --job, the script manages the checkpoints of a resumable block keys job stored in the
+block_keys_progress table, and blocks the keys the job deleted. The checkpoints of a job are
+removed once it finished, and those of the jobs left unfinished expire after JOB_EXPIRY.
+
+The cached lookups of the deleted keys are invalidated when the lookup cache is enabled.
+"""
 
 import argparse
+import json
 import logging
 import os
-from typing import List
+import sys
+from typing import IO, List
 
+import lookup_cache
 import psycopg2
 
 logger = logging.getLogger(__name__)
 
+# Digests of the keys deleted directly from the database, pending removal from the prefix tree
+PTREE_REMOVALS_FILE = "/hockeypuck/data/ptree-removals"
+# the checkpoints of the unfinished jobs are kept for resumption during this interval
+JOB_EXPIRY = "30 days"
+
 
 class KeyBlockError(Exception):
     """Exception raised for errors in the key blocking operation."""
 
 
-def _get_db_connection() -> psycopg2.extensions.connection:
+def _get_db_connection(autocommit: bool = True) -> psycopg2.extensions.connection:
     """Connect to the Postgres database.
 
+    Args:
+        autocommit: whether each statement is committed on its own.
+
     Returns:
         psycopg2.extensions.connection: the database connection.
 
@@ -35,7 +56,7 @@ def _get_db_connection() -> psycopg2.extensions.connection:
     dsn = f"dbname={db_name} user={db_user} password={db_password} host={db_host}"
     try:
         conn = psycopg2.connect(dsn)
-        conn.autocommit = True
+        conn.autocommit = autocommit
         return conn
     except psycopg2.OperationalError as e:
         raise KeyBlockError(f"Failed to connect to database: {e}") from e
@@ -70,6 +91,247 @@ def _insert_fingerprints_to_table(
         raise KeyBlockError(f"Error executing SQL commands: {e}") from e
 
 
+def _copy_fingerprints_to_table(
+    cursor: psycopg2.extensions.cursor, stream: IO[str], comment: str
+) -> dict[str, int]:
+    """Stream newline separated fingerprints into the deleted_keys table.
+
+    The fingerprints are loaded into a temporary staging table with COPY and then merged into
+    the deleted_keys table with a single statement, so that the size of the list is not limited
+    by the size of a SQL statement. Empty lines, lines starting with '#' and malformed
+    fingerprints are skipped. An optional '0x' prefix is accepted.
+
+    Args:
+        cursor: the database cursor.
+        stream: the text stream to read the fingerprints from.
+        comment: the comment associated with blocking.
+
+    Returns:
+        The number of lines read, fingerprints newly blocked and lines skipped.
+
+    Raises:
+        KeyBlockError: if any SQL command fails.
+    """
+    try:
+        cursor.execute("CREATE TEMPORARY TABLE blocklist_import (fingerprint TEXT);")
+        cursor.copy_expert("COPY blocklist_import (fingerprint) FROM STDIN;", stream)
+        cursor.execute("SELECT COUNT(*) FROM blocklist_import;")
+        read = cursor.fetchone()[0]
+        cursor.execute(
+            "INSERT INTO deleted_keys (fingerprint, comment) "
+            "SELECT DISTINCT fingerprint, %s FROM ("
+            "SELECT REGEXP_REPLACE(LOWER(TRIM(fingerprint)), '^0x', '') AS fingerprint "
+            "FROM blocklist_import) AS staged "
+            "WHERE fingerprint ~ '^([0-9a-f]{40}|[0-9a-f]{64})$' "
+            "ON CONFLICT DO NOTHING;",
+            (comment,),
+        )
+        blocked = cursor.rowcount
+        cursor.execute(
+            "SELECT COUNT(*) FROM blocklist_import WHERE "
+            "REGEXP_REPLACE(LOWER(TRIM(fingerprint)), '^0x', '') "
+            "!~ '^([0-9a-f]{40}|[0-9a-f]{64})$';"
+        )
+        skipped = cursor.fetchone()[0]
+        cursor.execute("DROP TABLE blocklist_import;")
+        logging.info("Imported %d fingerprints, skipped %d lines.", blocked, skipped)
+        return {"read": read, "blocked": blocked, "skipped": skipped}
+    except psycopg2.Error as e:
+        raise KeyBlockError(f"Error executing SQL commands: {e}") from e
+
+
+def _delete_keys_from_tables(
+    cursor: psycopg2.extensions.cursor, fingerprints: List[str], comment: str
+) -> dict[str, str]:
+    """Delete keys from the Hockeypuck tables and add their fingerprints to deleted_keys.
+
+    The caller is responsible for running this function in a single transaction. Fingerprints
+    that are not present in the database are not blocked.
+
+    Args:
+        cursor: the database cursor.
+        fingerprints: list of fingerprints to delete and block.
+        comment: the comment associated with blocking.
+
+    Returns:
+        The MD5 digest of each deleted key, keyed by fingerprint.
+
+    Raises:
+        KeyBlockError: if any SQL command fails.
+    """
+    rfingerprints = [fingerprint.lower()[::-1] for fingerprint in fingerprints]
+    try:
+        cursor.execute("DELETE FROM subkeys WHERE rfingerprint = ANY(%s);", (rfingerprints,))
+        cursor.execute("SELECT TO_REGCLASS('userids') IS NOT NULL;")
+        if cursor.fetchone()[0]:
+            cursor.execute("DELETE FROM userids WHERE rfingerprint = ANY(%s);", (rfingerprints,))
+        cursor.execute(
+            "DELETE FROM keys WHERE rfingerprint = ANY(%s) RETURNING REVERSE(rfingerprint), md5;",
+            (rfingerprints,),
+        )
+        deleted = dict(cursor.fetchall())
+    except psycopg2.Error as e:
+        raise KeyBlockError(f"Error executing SQL commands: {e}") from e
+    if deleted:
+        _insert_fingerprints_to_table(cursor, list(deleted), comment)
+    return deleted
+
+
+def _record_ptree_removals(digests: List[str]) -> None:
+    """Record the digests of keys deleted from the database for removal from the prefix tree.
+
+    Args:
+        digests: MD5 digests of the deleted keys.
+    """
+    with open(PTREE_REMOVALS_FILE, "a", encoding="utf-8") as removals:
+        removals.writelines(f"{digest}\n" for digest in digests)
+
+
+def _invalidate_lookup_cache(fingerprints: List[str]) -> None:
+    """Invalidate the cached lookups of the deleted keys, if the lookup cache is enabled.
+
+    Args:
+        fingerprints: the fingerprints of the deleted keys.
+    """
+    client = lookup_cache.connect_redis()
+    if client is not None and fingerprints:
+        lookup_cache.invalidate(client, fingerprints)
+
+
+def _checkpoint_job(
+    cursor: psycopg2.extensions.cursor, job: str, outcomes: dict[str, str]
+) -> None:
+    """Record the outcome of the fingerprints processed by a block keys job.
+
+    Args:
+        cursor: the database cursor.
+        job: the job identifier.
+        outcomes: the outcome of each processed fingerprint, keyed by fingerprint.
+
+    Raises:
+        KeyBlockError: if any SQL command fails.
+    """
+    if not outcomes:
+        return
+    try:
+        insert_args = ",".join(
+            cursor.mogrify("(%s, LOWER(%s), %s)", (job, fingerprint, outcome)).decode("utf-8")
+            for fingerprint, outcome in outcomes.items()
+        )
+        cursor.execute(
+            "INSERT INTO block_keys_progress (job_id, fingerprint, outcome) VALUES "
+            f"{insert_args} ON CONFLICT (job_id, fingerprint) "
+            "DO UPDATE SET outcome = EXCLUDED.outcome, updated_at = NOW();"
+        )
+    except psycopg2.Error as e:
+        raise KeyBlockError(f"Error executing SQL commands: {e}") from e
+
+
+def _get_job_progress(cursor: psycopg2.extensions.cursor, job: str) -> dict[str, str]:
+    """Get the outcome of the fingerprints already processed by a block keys job.
+
+    Args:
+        cursor: the database cursor.
+        job: the job identifier.
+
+    Returns:
+        The outcome of each processed fingerprint, keyed by fingerprint.
+
+    Raises:
+        KeyBlockError: if any SQL command fails.
+    """
+    try:
+        cursor.execute(
+            "SELECT fingerprint, outcome FROM block_keys_progress WHERE job_id = %s;", (job,)
+        )
+        return dict(cursor.fetchall())
+    except psycopg2.Error as e:
+        raise KeyBlockError(f"Error executing SQL commands: {e}") from e
+
+
+def _prune_jobs(cursor: psycopg2.extensions.cursor, finished_job: str | None) -> None:
+    """Remove the checkpoints of a finished job and of the expired jobs.
+
+    Args:
+        cursor: the database cursor.
+        finished_job: the identifier of the finished job, if any.
+
+    Raises:
+        KeyBlockError: if any SQL command fails.
+    """
+    try:
+        cursor.execute(
+            "DELETE FROM block_keys_progress "
+            "WHERE job_id = %s OR updated_at < NOW() - %s::INTERVAL;",
+            (finished_job, JOB_EXPIRY),
+        )
+    except psycopg2.Error as e:
+        raise KeyBlockError(f"Error executing SQL commands: {e}") from e
+
+
+def _run_job(args: argparse.Namespace) -> None:
+    """Manage the checkpoints of a block keys job, or block the keys it deleted.
+
+    Args:
+        args: the parsed command line arguments.
+
+    Raises:
+        KeyBlockError: if any SQL command fails.
+    """
+    with _get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if args.checkpoint:
+                outcomes = json.load(sys.stdin)
+                _checkpoint_job(cursor, args.job, outcomes)
+                _invalidate_lookup_cache(
+                    [fp for fp, outcome in outcomes.items() if outcome == "deleted"]
+                )
+            elif args.progress:
+                print(json.dumps(_get_job_progress(cursor, args.job)))
+            elif args.reset:
+                try:
+                    cursor.execute(
+                        "DELETE FROM block_keys_progress WHERE job_id = %s;", (args.job,)
+                    )
+                except psycopg2.Error as e:
+                    raise KeyBlockError(f"Error executing SQL commands: {e}") from e
+            else:
+                deleted = [
+                    fingerprint
+                    for fingerprint, outcome in _get_job_progress(cursor, args.job).items()
+                    if outcome == "deleted"
+                ]
+                if deleted:
+                    _insert_fingerprints_to_table(cursor, deleted, args.comment)
+                _prune_jobs(cursor, args.job if args.finished else None)
+
+
+def _block(args: argparse.Namespace) -> None:
+    """Block the fingerprints given on the command line.
+
+    Args:
+        args: the parsed command line arguments.
+    """
+    comment = args.comment
+    if args.delete:
+        with _get_db_connection(autocommit=False) as conn:
+            with conn.cursor() as cursor:
+                deleted = _delete_keys_from_tables(cursor, args.fingerprints.split(","), comment)
+        # Only record the prefix tree removals once the transaction is committed
+        _record_ptree_removals(list(deleted.values()))
+        _invalidate_lookup_cache(list(deleted))
+        print(json.dumps({"deleted": list(deleted)}))
+        return
+    with _get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if args.file:
+                with open(args.file, encoding="utf-8") as stream:
+                    summary = _copy_fingerprints_to_table(cursor, stream, comment)
+                print(json.dumps(summary))
+            else:
+                _insert_fingerprints_to_table(cursor, args.fingerprints.split(","), comment)
+
+
 def main() -> None:
     """Block list of fingerprints.
 
@@ -77,17 +339,48 @@ def main() -> None:
         KeyBlockError: if the key blocking operation fails.
     """
     parser = argparse.ArgumentParser(description="Block keys in the Hockeypuck Postgres database.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--fingerprints", help="Comma-separated list of fingerprints to block")
+    source.add_argument(
+        "--file", help="Path to a file containing one fingerprint to block per line"
+    )
+    source.add_argument(
+        "--job", help="Identifier of a resumable job whose deleted keys should be blocked"
+    )
+    parser.add_argument("--comment", help="Comment associated with the blocking")
     parser.add_argument(
-        "--fingerprints", required=True, help="Comma-separated list of fingerprints to block"
+        "--delete",
+        action="store_true",
+        help="Also delete the keys from the database in the same transaction",
+    )
+    job_operation = parser.add_mutually_exclusive_group()
+    job_operation.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Record the job outcomes read from stdin as a JSON object keyed by fingerprint",
+    )
+    job_operation.add_argument(
+        "--progress", action="store_true", help="Print the recorded job outcomes as JSON"
+    )
+    job_operation.add_argument("--reset", action="store_true", help="Forget the job outcomes")
+    parser.add_argument(
+        "--finished",
+        action="store_true",
+        help="Forget the job outcomes once its deleted keys are blocked",
     )
-    parser.add_argument("--comment", required=True, help="Comment associated with the blocking")
     args = parser.parse_args()
-    fingerprints = args.fingerprints.split(",")
-    comment = args.comment
+    is_job_operation = args.checkpoint or args.progress or args.reset
+    if args.delete and not args.fingerprints:
+        parser.error("--delete requires --fingerprints")
+    if is_job_operation and not args.job:
+        parser.error("--checkpoint, --progress and --reset require --job")
+    if not is_job_operation and args.comment is None:
+        parser.error("--comment is required to block keys")
     try:
-        with _get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                _insert_fingerprints_to_table(cursor, fingerprints, comment)
+        if args.job:
+            _run_job(args)
+        else:
+            _block(args)
     except KeyBlockError as e:
         logging.error("Unable to block keys: %s", e)
         raise KeyBlockError(f"Unable to block keys: {e}") from e
@@ -3,16 +3,73 @@
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 
-# Retrieve blocklisted keys from the Hockeypuck postgres database and start the hockeypuck binary
+# Synchronise the blocklisted keys from the Hockeypuck postgres database, render them into the
+# configuration file, repair the prefix tree if needed and start the hockeypuck binary
 
 set -euo pipefail
 
-export PGPASSWORD=${POSTGRESQL_DB_PASSWORD}
+BLOCKLIST_FILE=/hockeypuck/data/blocklist/fingerprints
+CONFIG_TEMPLATE=/hockeypuck/etc/hockeypuck.conf
+CONFIG_FILE=/hockeypuck/data/hockeypuck.conf
+PTREE_DIR=/hockeypuck/data/ptree
+PTREE_REMOVALS_FILE=/hockeypuck/data/ptree-removals
+# Written on clean shutdown with the last key modification time of the database, from which the
+# changes are applied on the next start
+PTREE_CLEAN_FILE=/hockeypuck/data/ptree.clean
 
-SQLCMD="psql -t -A -d ${POSTGRESQL_DB_NAME} -h ${POSTGRESQL_DB_HOSTNAME} -U ${POSTGRESQL_DB_USERNAME}"
+/hockeypuck/bin/sync_blocklist.sh
 
-BLOCKLIST_FINGERPRINTS=$($SQLCMD -c "SELECT STRING_AGG(fingerprint, ',') FROM deleted_keys;")
+# Stream the blocklist into the blacklist array in place of the marker comment
+awk -v blocklist="$BLOCKLIST_FILE" '
+    /# @BLOCKLIST_FINGERPRINTS@/ {
+        while ((getline fingerprint < blocklist) > 0) {
+            printf "        \"%s\",\n", fingerprint
+        }
+        close(blocklist)
+        next
+    }
+    { print }
+' "$CONFIG_TEMPLATE" > "${CONFIG_FILE}.new"
+mv "${CONFIG_FILE}.new" "$CONFIG_FILE"
 
-export APP_BLOCKLIST_FINGERPRINTS="$BLOCKLIST_FINGERPRINTS"
+db_marker() {
+    PGPASSWORD="${POSTGRESQL_DB_PASSWORD}" psql -t -A -d "${POSTGRESQL_DB_NAME}" \
+        -h "${POSTGRESQL_DB_HOSTNAME}" -p "${POSTGRESQL_DB_PORT:-5432}" -U "${POSTGRESQL_DB_USERNAME}" \
+        -c "SELECT COALESCE(MAX(mtime)::TEXT, '') FROM keys;"
+}
 
-/hockeypuck/bin/hockeypuck -config /hockeypuck/etc/hockeypuck.conf
+# The prefix tree is kept on the data storage across pod reschedules. It is only fully repaired
+# when it is empty or when hockeypuck did not shut down cleanly. Since the database is shared by
+# every unit and the reconciliation peers, it keeps changing while this unit is stopped, so a
+# prefix tree closed cleanly is otherwise kept: the keys deleted from the database pending removal
+# are removed and the keys modified since the clean shutdown are inserted, without diffing the
+# whole database against the prefix tree, and the reconciliation catches up on the rest.
+if [ -z "$(ls -A "$PTREE_DIR" 2>/dev/null)" ] || [ ! -f "$PTREE_CLEAN_FILE" ]; then
+    echo "Prefix tree empty or not closed cleanly, repairing it"
+    /hockeypuck/bin/hockeypuck-ptree-repair -config "$CONFIG_FILE" -removals "$PTREE_REMOVALS_FILE"
+else
+    echo "Applying the database changes since the clean shutdown to the prefix tree"
+    # an empty marker was written from an empty database, so every key is modified since
+    /hockeypuck/bin/hockeypuck-ptree-repair -config "$CONFIG_FILE" -removals "$PTREE_REMOVALS_FILE" \
+        -removals-only -since "$(grep . "$PTREE_CLEAN_FILE" || echo -infinity)"
+fi
+rm -f "$PTREE_CLEAN_FILE"
+
+/hockeypuck/bin/hockeypuck -config "$CONFIG_FILE" &
+HOCKEYPUCK_PID=$!
+trap 'kill -TERM "$HOCKEYPUCK_PID"' TERM INT
+status=0
+wait "$HOCKEYPUCK_PID" || status=$?
+if kill -0 "$HOCKEYPUCK_PID" 2>/dev/null; then
+    # Interrupted by the trap, wait for hockeypuck to close the prefix tree
+    status=0
+    wait "$HOCKEYPUCK_PID" || status=$?
+fi
+if [ "$status" -eq 0 ] || [ "$status" -eq 143 ]; then
+    # the prefix tree is only marked clean once the marker was read from the database
+    if marker=$(db_marker); then
+        echo "$marker" > "${PTREE_CLEAN_FILE}.new"
+        mv "${PTREE_CLEAN_FILE}.new" "$PTREE_CLEAN_FILE"
+    fi
+fi
+exit "$status"
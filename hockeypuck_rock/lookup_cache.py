@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""This script serves the HTTP requests of Hockeypuck through caches of the key lookups.
+
+The responses of the op=get, op=index and op=hget lookups are cached in Redis with a TTL, keyed by
+the normalized query. The entries of the searches by key ID or fingerprint are tagged with the
+searched hexadecimal ID, so that they are invalidated when a key is added, replaced or deleted.
+The entries of the text searches are invalidated by bumping a generation counter on any change.
+Every entry is stored with the TTL, so that the cache does not outgrow the entries of the
+last TTL, whatever the eviction policy of the shared Redis server.
+
+Every other request is passed through to Hockeypuck, as are the lookups when the redis
+integration is missing or Redis is unavailable.
+
+The lookups recently confirmed absent are answered by the negative cache, which does not store
+its entries in Redis but is only enabled with the redis integration, the lookups being routed to
+Hockeypuck directly otherwise.
+
+The requests rejected by the Traefik rate limits are reported by Traefik to the rate limited
+path, so that they are counted alongside the hits and misses, written to the metrics directory
+served by the charm-metrics service. The path holds a token derived from the application secret
+key, so that the requests reaching it through the ingress are dropped.
+"""
+
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import os
+import re
+import threading
+import time
+import typing
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import redis
+from negative_cache import DEFAULT_TTL as NEGATIVE_CACHE_DEFAULT_TTL
+from negative_cache import NegativeCache
+
+logger = logging.getLogger(__name__)
+
+BACKEND_HOST = "127.0.0.1"
+BACKEND_PORT = 11371
+LISTEN_PORT = 11372
+DEFAULT_TTL = 300  # seconds
+CACHED_OPS = frozenset(("get", "index", "hget"))
+# requests changing the keys of the database
+WRITE_PATHS = frozenset(("/pks/add", "/pks/replace", "/pks/delete"))
+KEY_PREFIX = "hockeypuck:lookup:"
+GENERATION_KEY = f"{KEY_PREFIX}generation"
+TEXT_GENERATION_KEY = f"{KEY_PREFIX}text-generation"
+TAG_PREFIX = f"{KEY_PREFIX}tag:"
+HEX_SEARCH_REGEX = re.compile(r"0x([0-9a-f]{8,64})")
+NOT_FOUND = b"Not Found\n"
+# path the Traefik rate limits report their rejected requests to, by token and endpoint
+RATE_LIMITED_PATH = "/_hockeypuck/rate-limited/"
+# must match the context the charm derives the token of the Traefik errors middleware with
+RATE_LIMITED_TOKEN_CONTEXT = b"hockeypuck-rate-limited"
+RATE_LIMITED_ENDPOINTS = ("add", "hashquery", "lookup")
+TOO_MANY_REQUESTS = b"Too Many Requests\n"
+METRICS_FILE = "/hockeypuck/data/metrics/lookup_cache.prom"
+METRICS_INTERVAL = 15  # seconds between two writes of the metrics file
+# headers of a single connection, not forwarded by the proxy
+HOP_BY_HOP_HEADERS = frozenset(
+    (
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailers",
+        "transfer-encoding",
+        "upgrade",
+    )
+)
+
+
+def normalize_lookup(query: str) -> tuple[str, str | None] | None:
+    """Normalize the query of a lookup into its cache key.
+
+    Args:
+        query: The query string of the /pks/lookup request.
+
+    Returns:
+        The cache key suffix of the lookup and the searched hexadecimal ID, if any, or None if
+        the lookup is not cached.
+    """
+    params = urllib.parse.parse_qs(query, keep_blank_values=True)
+    op = params.pop("op", [""])[0].lower()
+    search = " ".join(params.pop("search", [""])[0].lower().split())
+    if op not in CACHED_OPS or not search:
+        return None
+    options = sorted(
+        {option for value in params.pop("options", []) for option in value.split(",")}
+    )
+    normalized = json.dumps(
+        [op, search, options, sorted((name, values) for name, values in params.items())]
+    )
+    match = HEX_SEARCH_REGEX.fullmatch(search)
+    digest = hashlib.sha256(normalized.encode()).hexdigest()
+    return f"{op}:{digest}", match.group(1) if match else None
+
+
+def invalidation_tags(fingerprint: str) -> list[str]:
+    """Get the tags of the cache entries of the searches matching a fingerprint.
+
+    Args:
+        fingerprint: The fingerprint of the changed key.
+
+    Returns:
+        The tags of the searches by fingerprint, long and short key ID.
+    """
+    fingerprint = fingerprint.lower().removeprefix("0x")
+    lengths = sorted({len(fingerprint), 16, 8})
+    return [f"{TAG_PREFIX}{fingerprint[-length:]}" for length in lengths]
+
+
+class LookupCache:
+    """Cache of the lookup responses in Redis."""
+
+    def __init__(self, client: redis.Redis, ttl: int) -> None:
+        """Initialize the cache.
+
+        Args:
+            client: The Redis client.
+            ttl: The time to live of the entries, in seconds.
+        """
+        self._client = client
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self.counts = {"hit": 0, "miss": 0, "error": 0}
+
+    def _count(self, result: str) -> None:
+        """Count the result of a lookup.
+
+        Args:
+            result: The result of the lookup.
+        """
+        with self._lock:
+            self.counts[result] += 1
+
+    def _key(self, suffix: str, hex_search: str | None) -> str:
+        """Get the cache key of a lookup for the current generations.
+
+        Args:
+            suffix: The cache key suffix of the normalized lookup.
+            hex_search: The searched hexadecimal ID, if any.
+
+        Returns:
+            The cache key.
+        """
+        generations = [
+            int(value or 0) for value in self._client.mget(GENERATION_KEY, TEXT_GENERATION_KEY)
+        ]
+        if hex_search:
+            return f"{KEY_PREFIX}{generations[0]}:{suffix}"
+        return f"{KEY_PREFIX}{generations[0]}.{generations[1]}:{suffix}"
+
+    def get(self, suffix: str, hex_search: str | None) -> tuple[str | None, bytes | None]:
+        """Get a cached response.
+
+        Args:
+            suffix: The cache key suffix of the normalized lookup.
+            hex_search: The searched hexadecimal ID, if any.
+
+        Returns:
+            The cache key and the cached response, if any. The key is None if Redis is
+            unavailable.
+        """
+        try:
+            key = self._key(suffix, hex_search)
+            value = typing.cast(bytes | None, self._client.get(key))
+        except redis.RedisError as e:
+            logger.warning("Lookup cache unavailable: %s", e)
+            self._count("error")
+            return None, None
+        self._count("hit" if value is not None else "miss")
+        return key, value
+
+    def set(self, key: str, hex_search: str | None, value: bytes) -> None:
+        """Cache a response.
+
+        Args:
+            key: The cache key.
+            hex_search: The searched hexadecimal ID, if any, tagging the entry.
+            value: The response.
+        """
+        try:
+            with self._client.pipeline(transaction=False) as pipeline:
+                pipeline.set(key, value, ex=self._ttl)
+                if hex_search:
+                    pipeline.sadd(f"{TAG_PREFIX}{hex_search}", key)
+                    pipeline.expire(f"{TAG_PREFIX}{hex_search}", self._ttl)
+                pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning("Unable to cache the lookup: %s", e)
+
+    def invalidate(self, fingerprints: typing.Iterable[str] | None) -> None:
+        """Invalidate the entries of the changed keys.
+
+        Args:
+            fingerprints: The fingerprints of the changed keys, None to invalidate every entry.
+        """
+        invalidate(self._client, fingerprints)
+
+
+def invalidate(client: redis.Redis, fingerprints: typing.Iterable[str] | None) -> None:
+    """Invalidate the cache entries of the changed keys.
+
+    The entries of the searches by ID of the keys are deleted, and the generation of the text
+    searches is bumped since any of them may match the keys.
+
+    Args:
+        client: The Redis client.
+        fingerprints: The fingerprints of the changed keys, None to invalidate every entry.
+    """
+    try:
+        if fingerprints is None:
+            client.incr(GENERATION_KEY)
+            return
+        tags = [tag for fingerprint in fingerprints for tag in invalidation_tags(fingerprint)]
+        keys = [key for tag in tags for key in client.smembers(tag)] if tags else []
+        with client.pipeline(transaction=False) as pipeline:
+            if keys or tags:
+                pipeline.delete(*keys, *tags)
+            pipeline.incr(TEXT_GENERATION_KEY)
+            pipeline.execute()
+    except redis.RedisError as e:
+        logger.warning("Unable to invalidate the lookup cache: %s", e)
+
+
+def changed_fingerprints(body: bytes) -> list[str] | None:
+    """Get the fingerprints of the keys changed by a Hockeypuck add or replace request.
+
+    Args:
+        body: The response of Hockeypuck.
+
+    Returns:
+        The fingerprints of the inserted and updated keys, or None if they are unknown.
+    """
+    try:
+        response = json.loads(body)
+        return [*(response.get("inserted") or []), *(response.get("updated") or [])]
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+def rate_limited_token(secret_key: str | None) -> str | None:
+    """Derive the token of the rate limited path from the application secret key.
+
+    Args:
+        secret_key: the application secret key, None if unset.
+
+    Returns:
+        The token of the rate limited path, None without secret key.
+    """
+    if not secret_key:
+        return None
+    return hmac.new(secret_key.encode(), RATE_LIMITED_TOKEN_CONTEXT, hashlib.sha256).hexdigest()
+
+
+def connect_redis() -> redis.Redis | None:
+    """Connect to the Redis server of the redis integration.
+
+    The server configuration is left untouched, the server being shared with the other
+    applications integrated with it.
+
+    Returns:
+        The Redis client, or None if the redis integration is missing.
+    """
+    url = os.getenv("REDIS_DB_CONNECT_STRING")
+    if not url:
+        return None
+    return redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    """Handler caching the lookups and passing through the other requests."""
+
+    protocol_version = "HTTP/1.1"
+    cache: LookupCache | None = None
+    negative_cache: NegativeCache | None = None
+    rate_limited = dict.fromkeys(RATE_LIMITED_ENDPOINTS, 0)
+    rate_limited_token: str | None = None
+    _rate_limited_lock = threading.Lock()
+    _local = threading.local()
+
+    def _backend(self) -> http.client.HTTPConnection:
+        """Get the connection to Hockeypuck of the handler thread.
+
+        Returns:
+            The persistent connection to Hockeypuck.
+        """
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = http.client.HTTPConnection(
+                BACKEND_HOST, BACKEND_PORT, timeout=60
+            )
+        return self._local.connection
+
+    def _forward(self) -> tuple[int, list[tuple[str, str]], bytes]:
+        """Forward the request to Hockeypuck.
+
+        Returns:
+            The status, headers and body of the response.
+        """
+        body = self._read_body()
+        headers = {
+            name: value
+            for name, value in self.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS | {"content-length"}
+        }
+        if body is not None:
+            headers["Content-Length"] = str(len(body))
+        forwarded_for = self.headers.get("X-Forwarded-For")
+        headers["X-Forwarded-For"] = (
+            f"{forwarded_for}, {self.client_address[0]}"
+            if forwarded_for
+            else self.client_address[0]
+        )
+        for attempt in range(2):
+            connection = self._backend()
+            try:
+                connection.request(self.command, self.path, body=body, headers=headers)
+                response = connection.getresponse()
+                # the response to a HEAD request has no body, but the length of the GET one
+                skipped = HOP_BY_HOP_HEADERS
+                if self.command != "HEAD":
+                    skipped = skipped | {"content-length"}
+                return (
+                    response.status,
+                    [
+                        (name, value)
+                        for name, value in response.getheaders()
+                        if name.lower() not in skipped
+                    ],
+                    response.read(),
+                )
+            except (http.client.HTTPException, OSError):
+                # the persistent connection may have been closed by Hockeypuck, retry once
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def _read_body(self) -> bytes | None:
+        """Read the body of the request, sent with a length or in chunks.
+
+        Returns:
+            The body of the request, or None if it has none.
+        """
+        if "chunked" not in self.headers.get("Transfer-Encoding", "").lower():
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else None
+        chunks = []
+        while size := int(self.rfile.readline().split(b";")[0].strip(), 16):
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        # skip the trailers up to the empty line ending the body
+        while self.rfile.readline().strip():
+            pass
+        return b"".join(chunks)
+
+    def _respond(self, status: int, headers: list[tuple[str, str]], body: bytes) -> None:
+        """Send a response to the client.
+
+        Args:
+            status: The status of the response.
+            headers: The headers of the response, with the length of the body of a HEAD request.
+            body: The body of the response.
+        """
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if not any(name.lower() == "content-length" for name, _ in headers):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _handle(self) -> None:
+        """Serve the request from the cache or forward it to Hockeypuck."""
+        path, _, query = self.path.partition("?")
+        if path.startswith(RATE_LIMITED_PATH):
+            self._reject(path.removeprefix(RATE_LIMITED_PATH))
+            return
+        lookup = normalize_lookup(query) if path == "/pks/lookup" else None
+        key = None
+        if self.negative_cache is not None and lookup and self.negative_cache.is_absent(lookup[0]):
+            self._respond(404, [("Content-Type", "text/plain; charset=utf-8")], NOT_FOUND)
+            return
+        if self.cache is not None and lookup and self.command == "GET":
+            key, cached = self.cache.get(*lookup)
+            if cached is not None:
+                cached_type, _, body = cached.partition(b"\n")
+                self._respond(200, [("Content-Type", cached_type.decode())], body)
+                return
+        try:
+            status, headers, body = self._forward()
+        except ValueError:
+            self.send_error(400, "Malformed chunked body")
+            return
+        except (http.client.HTTPException, OSError) as e:
+            logger.error("Hockeypuck unavailable: %s", e)
+            self.send_error(502)
+            return
+        if lookup:
+            self._record_lookup(lookup, key, status, headers, body)
+        if path in WRITE_PATHS and self.command == "POST":
+            self._record_write(path, body)
+        self._respond(status, headers, body)
+
+    def _record_lookup(
+        self,
+        lookup: tuple[str, str | None],
+        key: str | None,
+        status: int,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        """Update the caches with the response of Hockeypuck to a lookup.
+
+        Args:
+            lookup: The normalized lookup and the searched hexadecimal ID, if any.
+            key: The cache key of the lookup, None if it is not cached.
+            status: The status of the response.
+            headers: The headers of the response.
+            body: The body of the response.
+        """
+        if self.cache is not None and key and status == 200:
+            content_type = dict((name.lower(), value) for name, value in headers).get(
+                "content-type", "text/plain"
+            )
+            self.cache.set(key, lookup[1], content_type.encode() + b"\n" + body)
+        if self.negative_cache is not None and status == 404:
+            self.negative_cache.not_found(*lookup)
+
+    def _reject(self, path: str) -> None:
+        """Count a request rejected by a Traefik rate limit, and answer its error page.
+
+        The requests without the token of the Traefik errors middleware are not forwarded.
+
+        Args:
+            path: The token and the rate limited endpoint.
+        """
+        token, _, endpoint = path.partition("/")
+        if self.rate_limited_token is None or not hmac.compare_digest(
+            token.encode(), self.rate_limited_token.encode()
+        ):
+            self._respond(404, [("Content-Type", "text/plain; charset=utf-8")], NOT_FOUND)
+            return
+        if endpoint in self.rate_limited:
+            with self._rate_limited_lock:
+                self.rate_limited[endpoint] += 1
+        self._respond(429, [("Content-Type", "text/plain; charset=utf-8")], TOO_MANY_REQUESTS)
+
+    def _record_write(self, path: str, body: bytes) -> None:
+        """Update the caches with the keys changed by a request.
+
+        Args:
+            path: The path of the request.
+            body: The response of Hockeypuck.
+        """
+        fingerprints = changed_fingerprints(body) if path != "/pks/delete" else None
+        if self.cache is not None:
+            self.cache.invalidate(fingerprints)
+        if self.negative_cache is not None and path != "/pks/delete":
+            self.negative_cache.added(fingerprints)
+
+    do_GET = do_HEAD = do_POST = _handle  # noqa: N815
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+        """Log the requests at debug level only, since Hockeypuck logs them.
+
+        Args:
+            format: The message format.
+            args: The message arguments.
+        """
+        logger.debug(format, *args)
+
+
+def write_metrics(
+    cache: LookupCache | None,
+    negative_cache: NegativeCache | None,
+    rate_limited: dict[str, int],
+) -> None:
+    """Write the hits and misses of the caches and the rate limited requests periodically.
+
+    Args:
+        cache: The lookup cache, if enabled.
+        negative_cache: The negative cache, if enabled.
+        rate_limited: The requests rejected by the rate limits, by endpoint.
+    """
+    while True:
+        lines = [
+            "# HELP hockeypuck_rate_limited_requests_total Requests rejected by the rate limits, "
+            "by endpoint.",
+            "# TYPE hockeypuck_rate_limited_requests_total counter",
+            *(
+                f'hockeypuck_rate_limited_requests_total{{endpoint="{endpoint}"}} {count}'
+                for endpoint, count in sorted(rate_limited.items())
+            ),
+        ]
+        if cache is not None:
+            counts = dict(cache.counts)
+            lookups = counts["hit"] + counts["miss"]
+            hit_ratio = counts["hit"] / lookups if lookups else 0
+            lines += [
+                "# HELP hockeypuck_lookup_cache_requests_total Lookups of the cache, by result.",
+                "# TYPE hockeypuck_lookup_cache_requests_total counter",
+                *(
+                    f'hockeypuck_lookup_cache_requests_total{{result="{result}"}} {count}'
+                    for result, count in sorted(counts.items())
+                ),
+                "# HELP hockeypuck_lookup_cache_hit_ratio Ratio of the lookups served from the "
+                "cache.",
+                "# TYPE hockeypuck_lookup_cache_hit_ratio gauge",
+                f"hockeypuck_lookup_cache_hit_ratio {hit_ratio:.4f}",
+            ]
+        if negative_cache is not None:
+            lines += [
+                "# HELP hockeypuck_lookup_negative_cache_hits_total Lookups of absent keys "
+                "answered without the database.",
+                "# TYPE hockeypuck_lookup_negative_cache_hits_total counter",
+                f"hockeypuck_lookup_negative_cache_hits_total {negative_cache.hits}",
+            ]
+        try:
+            os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+            with open(f"{METRICS_FILE}.tmp", "w", encoding="utf-8") as metrics_file:
+                metrics_file.write("\n".join(lines) + "\n")
+            os.replace(f"{METRICS_FILE}.tmp", METRICS_FILE)
+        except OSError as e:
+            logger.warning("Unable to write the lookup cache metrics: %s", e)
+        time.sleep(METRICS_INTERVAL)
+
+
+def main() -> None:
+    """Serve the HTTP requests until interrupted."""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Cache the Hockeypuck lookups in Redis.")
+    parser.add_argument("--port", type=int, default=LISTEN_PORT, help="Port to listen on.")
+    args = parser.parse_args()
+    client = connect_redis()
+    negative_ttl = int(os.getenv("APP_LOOKUP_NEGATIVE_CACHE_TTL") or NEGATIVE_CACHE_DEFAULT_TTL)
+    if client is not None:
+        ttl = int(os.getenv("APP_LOOKUP_CACHE_TTL") or DEFAULT_TTL)
+        ProxyHandler.cache = LookupCache(client, ttl)
+        logger.info("Caching the lookups for %d seconds", ttl)
+        # the lookups only reach the proxy with the redis integration, so the scan of the keys
+        # seeding the negative cache would otherwise only load the database
+        if negative_ttl > 0:
+            ProxyHandler.negative_cache = NegativeCache(negative_ttl)
+            threading.Thread(target=ProxyHandler.negative_cache.run, daemon=True).start()
+    else:
+        logger.info("No redis integration, passing the lookups through")
+    ProxyHandler.rate_limited_token = rate_limited_token(os.getenv("APP_SECRET_KEY"))
+    threading.Thread(
+        target=write_metrics,
+        args=(ProxyHandler.cache, ProxyHandler.negative_cache, ProxyHandler.rate_limited),
+        daemon=True,
+    ).start()
+    server = ThreadingHTTPServer(("", args.port), ProxyHandler)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
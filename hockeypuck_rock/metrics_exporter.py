@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""This script serves the metrics written by the charm to the metrics directory.
+
+Every .prom file of the directory, in the Prometheus text format, is concatenated in the response.
+"""
+
+import argparse
+import logging
+import pathlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Handler serving the metrics files."""
+
+    metrics_dir = pathlib.Path("/hockeypuck/data/metrics")
+
+    def do_GET(self) -> None:  # noqa: N802 pylint: disable=invalid-name
+        """Serve the concatenated metrics files on /metrics."""
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = b"".join(
+            path.read_bytes() for path in sorted(self.metrics_dir.glob("*.prom")) if path.is_file()
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+        """Log the requests at debug level only, since they are scraped periodically.
+
+        Args:
+            format: The message format.
+            args: The message arguments.
+        """
+        logger.debug(format, *args)
+
+
+def main() -> None:
+    """Serve the metrics until interrupted."""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Serve the charm metrics files.")
+    parser.add_argument("--port", type=int, default=9627, help="Port to listen on.")
+    parser.add_argument(
+        "--metrics-dir", default=str(MetricsHandler.metrics_dir), help="Metrics directory."
+    )
+    args = parser.parse_args()
+    MetricsHandler.metrics_dir = pathlib.Path(args.metrics_dir)
+    server = ThreadingHTTPServer(("", args.port), MetricsHandler)
+    logger.info("Serving %s on port %d", args.metrics_dir, args.port)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,3 +8,7 @@ set -euo pipefail
 export PGPASSWORD="${POSTGRESQL_DB_PASSWORD}" 
 SQLCMD="psql ${POSTGRESQL_DB_NAME} -h ${POSTGRESQL_DB_HOSTNAME} -U ${POSTGRESQL_DB_USERNAME}"
 $SQLCMD -c "CREATE TABLE IF NOT EXISTS deleted_keys (fingerprint TEXT PRIMARY KEY NOT NULL, comment TEXT NOT NULL);"
+$SQLCMD -c "ALTER TABLE deleted_keys ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();"
+$SQLCMD -c "CREATE INDEX IF NOT EXISTS deleted_keys_created_at ON deleted_keys (created_at);"
+$SQLCMD -c "CREATE TABLE IF NOT EXISTS block_keys_progress (job_id TEXT NOT NULL, fingerprint TEXT NOT NULL, outcome TEXT NOT NULL, PRIMARY KEY (job_id, fingerprint));"
+$SQLCMD -c "ALTER TABLE block_keys_progress ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();"
@@ -0,0 +1,291 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Negative cache of the key lookups, answering the lookups of absent keys without the database.
+
+Only the lookups Hockeypuck recently answered with a 404 are answered, for a short TTL, from a
+bounded map. The keys added through reconciliation or through another unit are not seen by the
+proxy, so a lookup never confirmed missing is always passed to Hockeypuck.
+
+The short key IDs of all the keys and subkeys of the database are kept in a Bloom filter, seeded
+from the key tables and refreshed with the keys modified since the last refresh. A confirmed
+miss of a key ID or fingerprint is dropped once the filter holds the key, so that it is kept
+when other keys are added through /pks/add, while the misses of the text searches are dropped on
+any addition.
+"""
+
+import collections
+import datetime
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60  # seconds
+FALSE_POSITIVE_RATE = 0.01
+# room for the keys added between two seedings of the filter
+CAPACITY_HEADROOM = 2
+MIN_CAPACITY = 100_000
+MAX_NOT_FOUND_ENTRIES = 100_000
+SHORT_KEY_ID_LENGTH = 8
+# searches by short key ID, long key ID or fingerprint, matched by their suffix like Hockeypuck
+KEY_ID_LENGTHS = frozenset((8, 16, 32, 40, 64))
+SHORT_KEY_IDS_QUERY = """
+SELECT SUBSTRING(rfingerprint FOR 8) FROM keys WHERE mtime > %(since)s::TIMESTAMPTZ - %(overlap)s
+UNION ALL
+SELECT SUBSTRING(s.rsubfp FOR 8) FROM subkeys s JOIN keys k USING (rfingerprint)
+WHERE k.mtime > %(since)s::TIMESTAMPTZ - %(overlap)s
+"""
+# the keys committed after the watermark may carry an older modification time
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+EPOCH = "epoch"
+
+
+class BloomFilter:
+    """Bloom filter of strings, without false negatives."""
+
+    def __init__(self, capacity: int, false_positive_rate: float = FALSE_POSITIVE_RATE) -> None:
+        """Initialize an empty filter.
+
+        Args:
+            capacity: The number of elements the false positive rate is guaranteed for.
+            false_positive_rate: The false positive rate at capacity.
+        """
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, element: str) -> list[int]:
+        """Get the bit positions of an element, by double hashing.
+
+        Args:
+            element: The element.
+
+        Returns:
+            The bit positions of the element.
+        """
+        digest = hashlib.blake2b(element.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, element: str) -> None:
+        """Add an element, only counted if it was not already present.
+
+        Args:
+            element: The element.
+        """
+        positions = self._positions(element)
+        with self._lock:
+            added = False
+            for position in positions:
+                mask = 1 << (position & 7)
+                added = added or not self._bits[position >> 3] & mask
+                self._bits[position >> 3] |= mask
+            self.count += added
+
+    def __contains__(self, element: object) -> bool:
+        """Check whether an element may have been added.
+
+        Args:
+            element: The element.
+
+        Returns:
+            False if the element was never added, True if it probably was.
+        """
+        if not isinstance(element, str):
+            return False
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(element)
+        )
+
+
+def short_key_id(hex_id: str) -> str | None:
+    """Get the short key ID of a searched key ID or fingerprint.
+
+    Args:
+        hex_id: The searched hexadecimal ID, without the 0x prefix.
+
+    Returns:
+        The short key ID, or None if the search is not a key ID or fingerprint.
+    """
+    if len(hex_id) not in KEY_ID_LENGTHS:
+        return None
+    return hex_id[-SHORT_KEY_ID_LENGTH:].lower()
+
+
+def _connect(read_only: bool) -> psycopg2.extensions.connection:
+    """Connect to the database of the postgresql integration.
+
+    Args:
+        read_only: whether to connect to the read-only replica, when the database provides one.
+
+    Returns:
+        The database connection.
+    """
+    host = os.getenv("POSTGRESQL_DB_HOSTNAME")
+    port = os.getenv("POSTGRESQL_DB_PORT") or "5432"
+    if read_only and os.getenv("APP_POSTGRESQL_READ_ONLY_HOSTNAME"):
+        host = os.getenv("APP_POSTGRESQL_READ_ONLY_HOSTNAME")
+        port = os.getenv("APP_POSTGRESQL_READ_ONLY_PORT") or "5432"
+    return psycopg2.connect(
+        dbname=os.getenv("POSTGRESQL_DB_NAME"),
+        user=os.getenv("POSTGRESQL_DB_USERNAME"),
+        password=os.getenv("POSTGRESQL_DB_PASSWORD"),
+        host=host,
+        port=port,
+    )
+
+
+class NegativeCache:
+    """Negative cache of the key lookups."""
+
+    def __init__(self, ttl: int) -> None:
+        """Initialize the cache, without any confirmed miss.
+
+        Args:
+            ttl: The time to live of the not found lookups, and the interval between two
+                refreshes of the filter, in seconds.
+        """
+        self.ttl = ttl
+        self._filter: BloomFilter | None = None
+        self._watermark = EPOCH
+        # the expiry of the confirmed misses and their short key ID, if any
+        self._not_found: collections.OrderedDict[str, tuple[float, str | None]] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def is_absent(self, lookup: str) -> bool:
+        """Check whether a lookup was recently confirmed to find no key.
+
+        Args:
+            lookup: The normalized lookup.
+
+        Returns:
+            True if Hockeypuck found no key for the lookup within the TTL, and the key was not
+            added since.
+        """
+        bloom_filter = self._filter
+        with self._lock:
+            entry = self._not_found.get(lookup)
+            if entry is None:
+                return False
+            expiry, key_id = entry
+            if expiry < time.monotonic() or (
+                key_id and bloom_filter is not None and key_id in bloom_filter
+            ):
+                del self._not_found[lookup]
+                return False
+            self.hits += 1
+            return True
+
+    def not_found(self, lookup: str, hex_id: str | None) -> None:
+        """Remember a lookup Hockeypuck found no key for.
+
+        Args:
+            lookup: The normalized lookup.
+            hex_id: The searched hexadecimal ID, if any.
+        """
+        key_id = short_key_id(hex_id) if hex_id else None
+        with self._lock:
+            self._not_found[lookup] = (time.monotonic() + self.ttl, key_id)
+            self._not_found.move_to_end(lookup)
+            while len(self._not_found) > MAX_NOT_FOUND_ENTRIES:
+                self._not_found.popitem(last=False)
+
+    def added(self, fingerprints: list[str] | None) -> None:
+        """Record the keys added to the database.
+
+        The misses of the text searches, which any key may match, are dropped. The misses of
+        the key IDs are only dropped once the filter holds the added keys.
+
+        Args:
+            fingerprints: The fingerprints of the added keys, None if they are unknown.
+        """
+        bloom_filter = self._filter
+        if fingerprints is not None and bloom_filter is not None:
+            for fingerprint in fingerprints:
+                bloom_filter.add(fingerprint[-SHORT_KEY_ID_LENGTH:].lower())
+        with self._lock:
+            if fingerprints is None or bloom_filter is None:
+                self._not_found.clear()
+                return
+            for lookup in [
+                lookup for lookup, (_, key_id) in self._not_found.items() if key_id is None
+            ]:
+                del self._not_found[lookup]
+
+    def _load(self, bloom_filter: BloomFilter, read_only: bool) -> None:
+        """Add the short key IDs of the keys modified since the watermark to the filter.
+
+        Args:
+            bloom_filter: The filter.
+            read_only: whether to read the read-only replica, when the database provides one.
+        """
+        with _connect(read_only) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COALESCE(MAX(mtime)::TEXT, %s) FROM keys", (EPOCH,))
+                watermark = cursor.fetchone()[0]
+            # a named cursor streams the rows instead of loading them all at once
+            with conn.cursor(name="short_key_ids") as cursor:
+                cursor.itersize = 100_000
+                cursor.execute(
+                    SHORT_KEY_IDS_QUERY,
+                    {"since": self._watermark, "overlap": WATERMARK_OVERLAP},
+                )
+                for (reversed_key_id,) in cursor:
+                    bloom_filter.add(reversed_key_id[::-1])
+        conn.close()
+        self._watermark = watermark
+
+    def refresh(self) -> None:
+        """Seed the filter, or add the keys modified since the last refresh.
+
+        The filter is seeded again from the read-only replica when it is missing or full. The
+        rows missing from a lagging replica are newer than its watermark, so they are then
+        loaded from the primary.
+        """
+        bloom_filter = self._filter
+        if bloom_filter is not None and bloom_filter.count <= bloom_filter.capacity:
+            self._load(bloom_filter, read_only=False)
+        else:
+            self._seed()
+
+    def _seed(self) -> None:
+        """Seed a new filter sized after the number of keys, and swap it in once loaded."""
+        with _connect(read_only=True) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT (SELECT COUNT(*) FROM keys) + (SELECT COUNT(*) FROM subkeys)")
+            count = cursor.fetchone()[0]
+        conn.close()
+        bloom_filter = BloomFilter(max(MIN_CAPACITY, count * CAPACITY_HEADROOM))
+        self._watermark = EPOCH
+        started = time.monotonic()
+        self._load(bloom_filter, read_only=True)
+        self._load(bloom_filter, read_only=False)
+        self._filter = bloom_filter
+        logger.info(
+            "Seeded the negative cache with %d keys in %.0fs, %d bytes",
+            bloom_filter.count,
+            time.monotonic() - started,
+            bloom_filter.size // 8,
+        )
+
+    def run(self) -> None:
+        """Refresh the filter every TTL seconds."""
+        while True:
+            try:
+                self.refresh()
+            except psycopg2.Error as e:
+                logger.warning("Unable to refresh the negative cache: %s", e)
+            time.sleep(self.ttl)
@@ -0,0 +1,21 @@
+#!/bin/bash
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# Vet, test and build hockeypuck-ptree-repair within a Hockeypuck source tree, next to
+# hockeypuck-pbuild, since it uses the Hockeypuck packages.
+# Usage: build.sh <hockeypuck source directory> <output binary>
+
+set -euo pipefail
+
+SOURCE_DIR=$(realpath "$1")
+OUTPUT=$(realpath -m "$2")
+PACKAGE=./server/cmd/hockeypuck-ptree-repair
+
+mkdir -p "${SOURCE_DIR}/src/hockeypuck/${PACKAGE}"
+cp "$(dirname "$(realpath "$0")")"/*.go "${SOURCE_DIR}/src/hockeypuck/${PACKAGE}/"
+cd "${SOURCE_DIR}/src/hockeypuck"
+go vet "$PACKAGE"
+go test "$PACKAGE"
+go build -o "$OUTPUT" "$PACKAGE"
@@ -0,0 +1,86 @@
+// Copyright 2025 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+package main
+
+import (
+	"bufio"
+	"bytes"
+	"encoding/hex"
+	"fmt"
+	"io"
+	"sort"
+	"strings"
+)
+
+type digest [16]byte
+
+// parseDigest parses the hexadecimal MD5 digest of a key.
+func parseDigest(md5 string) (digest, error) {
+	var d digest
+	if len(md5) != hex.EncodedLen(len(d)) {
+		return d, fmt.Errorf("invalid digest %q", md5)
+	}
+	if _, err := hex.Decode(d[:], []byte(md5)); err != nil {
+		return d, fmt.Errorf("invalid digest %q: %w", md5, err)
+	}
+	return d, nil
+}
+
+// digestSet holds the digests of the database not matched yet by a prefix tree element, keyed by
+// the bytes of their element so that both sides are compared in the same representation.
+type digestSet struct {
+	pending map[string]digest
+	matched int
+}
+
+func newDigestSet() *digestSet {
+	return &digestSet{pending: make(map[string]digest)}
+}
+
+// add records the digest of a key of the database.
+func (s *digestSet) add(element []byte, d digest) {
+	s.pending[string(element)] = d
+}
+
+// match reports whether a prefix tree element belongs to a key of the database.
+func (s *digestSet) match(element []byte) bool {
+	if _, ok := s.pending[string(element)]; !ok {
+		return false
+	}
+	delete(s.pending, string(element))
+	s.matched++
+	return true
+}
+
+// missing returns the digests of the database no prefix tree element matched, in order.
+func (s *digestSet) missing() []digest {
+	digests := make([]digest, 0, len(s.pending))
+	for _, d := range s.pending {
+		digests = append(digests, d)
+	}
+	sort.Slice(digests, func(i, j int) bool { return bytes.Compare(digests[i][:], digests[j][:]) < 0 })
+	return digests
+}
+
+// readRemovals reads the distinct digests of a removals file, one per line.
+func readRemovals(r io.Reader) ([]digest, error) {
+	var digests []digest
+	seen := make(map[digest]struct{})
+	scanner := bufio.NewScanner(r)
+	for scanner.Scan() {
+		line := strings.TrimSpace(scanner.Text())
+		if line == "" {
+			continue
+		}
+		d, err := parseDigest(line)
+		if err != nil {
+			return nil, err
+		}
+		if _, ok := seen[d]; !ok {
+			seen[d] = struct{}{}
+			digests = append(digests, d)
+		}
+	}
+	return digests, scanner.Err()
+}
@@ -0,0 +1,63 @@
+// Copyright 2025 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+package main
+
+import (
+	"strings"
+	"testing"
+)
+
+func TestParseDigest(t *testing.T) {
+	d, err := parseDigest("000102030405060708090a0b0c0d0e0f")
+	if err != nil {
+		t.Fatal(err)
+	}
+	if d[0] != 0 || d[15] != 15 {
+		t.Errorf("unexpected digest %x", d)
+	}
+	for _, invalid := range []string{"", "00", "zz0102030405060708090a0b0c0d0e0f"} {
+		if _, err := parseDigest(invalid); err == nil {
+			t.Errorf("digest %q parsed", invalid)
+		}
+	}
+}
+
+func TestDigestSetDiff(t *testing.T) {
+	present, _ := parseDigest("00000000000000000000000000000001")
+	missing, _ := parseDigest("00000000000000000000000000000002")
+	set := newDigestSet()
+	set.add([]byte{1}, present)
+	set.add([]byte{2}, missing)
+
+	if !set.match([]byte{1}) {
+		t.Error("element of a key of the database not matched")
+	}
+	if set.match([]byte{1}) || set.match([]byte{3}) {
+		t.Error("stale element matched")
+	}
+
+	if set.matched != 1 {
+		t.Errorf("matched %d elements", set.matched)
+	}
+	if got := set.missing(); len(got) != 1 || got[0] != missing {
+		t.Errorf("missing digests %x", got)
+	}
+}
+
+func TestReadRemovals(t *testing.T) {
+	removals := "00000000000000000000000000000001\n\n00000000000000000000000000000001\n" +
+		"00000000000000000000000000000002\n"
+
+	digests, err := readRemovals(strings.NewReader(removals))
+
+	if err != nil {
+		t.Fatal(err)
+	}
+	if len(digests) != 2 || digests[0][15] != 1 || digests[1][15] != 2 {
+		t.Errorf("unexpected digests %x", digests)
+	}
+	if _, err := readRemovals(strings.NewReader("invalid\n")); err == nil {
+		t.Error("invalid removals read")
+	}
+}
@@ -0,0 +1,297 @@
+// Copyright 2025 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// hockeypuck-ptree-repair brings the prefix tree back in sync with the database without
+// rebuilding it. The key digests are streamed from PostgreSQL and diffed against the elements of
+// the prefix tree leaves, and only the differing elements are inserted or removed.
+//
+// With -removals-only, only the digests of the keys deleted from the database, listed in the
+// removals file, are removed from the prefix tree. With -since, the digests of the keys modified
+// in the database since the given time are also inserted, so that a prefix tree closed cleanly
+// catches up with the database without diffing the whole of it.
+//
+// The digests are converted to prefix tree elements with sks.DigestZp, the conversion Hockeypuck
+// uses when inserting keys, so the elements are compared in a single representation.
+//
+// It is built and tested within the Hockeypuck source tree by build.sh, next to
+// hockeypuck-pbuild, and must run while the hockeypuck service is stopped since the prefix tree
+// can only be opened by one process.
+package main
+
+import (
+	"database/sql"
+	"encoding/hex"
+	"encoding/json"
+	"flag"
+	"fmt"
+	"os"
+
+	_ "github.com/lib/pq"
+
+	cf "hockeypuck/conflux"
+	"hockeypuck/conflux/recon"
+	"hockeypuck/conflux/recon/leveldb"
+	"hockeypuck/hkp/sks"
+	"hockeypuck/server"
+	"hockeypuck/server/cmd"
+)
+
+var removalsFile = flag.String(
+	"removals", "", "File of digests pending removal from the prefix tree, emptied once repaired",
+)
+var removalsOnly = flag.Bool(
+	"removals-only", false, "Only remove the digests of the removals file from the prefix tree",
+)
+var since = flag.String(
+	"since", "", "With -removals-only, also insert the keys modified since this database time",
+)
+
+type result struct {
+	Matched  int `json:"matched"`
+	Inserted int `json:"inserted"`
+	Removed  int `json:"removed"`
+	Skipped  int `json:"skipped,omitempty"`
+}
+
+func main() {
+	settings := cmd.Init(false)
+	cmd.HandleSignals()
+	var res *result
+	var err error
+	if *removalsOnly {
+		res, err = removeDigests(settings)
+	} else {
+		res, err = repair(settings)
+	}
+	cmd.Die(err)
+	out, err := json.Marshal(res)
+	cmd.Die(err)
+	fmt.Println(string(out))
+}
+
+// loadDigests streams the digests of all the keys of the database.
+func loadDigests(settings *server.Settings) (*digestSet, error) {
+	db, err := sql.Open("postgres", settings.OpenPGP.DB.DSN)
+	if err != nil {
+		return nil, err
+	}
+	defer db.Close()
+	rows, err := db.Query("SELECT md5 FROM keys")
+	if err != nil {
+		return nil, err
+	}
+	defer rows.Close()
+	digests := newDigestSet()
+	for rows.Next() {
+		var md5 string
+		if err := rows.Scan(&md5); err != nil {
+			return nil, err
+		}
+		d, err := parseDigest(md5)
+		if err != nil {
+			return nil, err
+		}
+		z, err := digestZp(d)
+		if err != nil {
+			return nil, err
+		}
+		digests.add(z.Bytes(), d)
+	}
+	return digests, rows.Err()
+}
+
+// digestZp converts the digest of a key to its prefix tree element.
+func digestZp(d digest) (*cf.Zp, error) {
+	var z cf.Zp
+	if err := sks.DigestZp(hex.EncodeToString(d[:]), &z); err != nil {
+		return nil, err
+	}
+	return &z, nil
+}
+
+// walk calls fn with the elements of every leaf below node.
+func walk(node recon.PrefixNode, fn func(cf.Zp)) error {
+	if node.IsLeaf() {
+		elements, err := node.Elements()
+		if err != nil {
+			return err
+		}
+		for _, z := range elements {
+			fn(z)
+		}
+		return nil
+	}
+	children, err := node.Children()
+	if err != nil {
+		return err
+	}
+	for _, child := range children {
+		if err := walk(child, fn); err != nil {
+			return err
+		}
+	}
+	return nil
+}
+
+// openPTree opens the prefix tree of the settings.
+func openPTree(settings *server.Settings) (recon.PrefixTree, error) {
+	ptree, err := leveldb.New(settings.Conflux.Recon.PTreeConfig, settings.Conflux.Recon.LevelDB.Path)
+	if err != nil {
+		return nil, err
+	}
+	if err := ptree.Create(); err != nil {
+		return nil, err
+	}
+	return ptree, nil
+}
+
+// truncateRemovals empties the removals file once its digests are removed from the prefix tree.
+func truncateRemovals() error {
+	if *removalsFile == "" {
+		return nil
+	}
+	if err := os.Truncate(*removalsFile, 0); err != nil && !os.IsNotExist(err) {
+		return err
+	}
+	return nil
+}
+
+// readRemovalsFile reads the digests of the removals file, if any.
+func readRemovalsFile() ([]digest, error) {
+	if *removalsFile == "" {
+		return nil, nil
+	}
+	file, err := os.Open(*removalsFile)
+	if os.IsNotExist(err) {
+		return nil, nil
+	}
+	if err != nil {
+		return nil, err
+	}
+	defer file.Close()
+	return readRemovals(file)
+}
+
+// loadModifiedDigests reads the digests of the keys modified since a time of the database, using
+// the index of the modification times instead of scanning every key.
+func loadModifiedDigests(settings *server.Settings, since string) ([]digest, error) {
+	db, err := sql.Open("postgres", settings.OpenPGP.DB.DSN)
+	if err != nil {
+		return nil, err
+	}
+	defer db.Close()
+	rows, err := db.Query("SELECT md5 FROM keys WHERE mtime > $1", since)
+	if err != nil {
+		return nil, err
+	}
+	defer rows.Close()
+	var digests []digest
+	for rows.Next() {
+		var md5 string
+		if err := rows.Scan(&md5); err != nil {
+			return nil, err
+		}
+		d, err := parseDigest(md5)
+		if err != nil {
+			return nil, err
+		}
+		digests = append(digests, d)
+	}
+	return digests, rows.Err()
+}
+
+// removeDigests removes the digests of the removals file from the prefix tree and, with -since,
+// inserts the digests of the keys modified since, without walking the tree.
+func removeDigests(settings *server.Settings) (*result, error) {
+	removals, err := readRemovalsFile()
+	if err != nil {
+		return nil, err
+	}
+	var modified []digest
+	if *since != "" {
+		if modified, err = loadModifiedDigests(settings, *since); err != nil {
+			return nil, err
+		}
+	}
+	if len(removals) == 0 && len(modified) == 0 {
+		return &result{}, nil
+	}
+	ptree, err := openPTree(settings)
+	if err != nil {
+		return nil, err
+	}
+	defer ptree.Close()
+	res := &result{}
+	for _, d := range removals {
+		z, err := digestZp(d)
+		if err != nil {
+			return nil, err
+		}
+		// the element is missing when the key was never inserted in this prefix tree
+		if err := ptree.Remove(z); err != nil {
+			res.Skipped++
+			continue
+		}
+		res.Removed++
+	}
+	for _, d := range modified {
+		z, err := digestZp(d)
+		if err != nil {
+			return nil, err
+		}
+		// the element is already present when the key was inserted through this keyserver
+		if err := ptree.Insert(z); err != nil {
+			res.Matched++
+			continue
+		}
+		res.Inserted++
+	}
+	return res, truncateRemovals()
+}
+
+func repair(settings *server.Settings) (*result, error) {
+	digests, err := loadDigests(settings)
+	if err != nil {
+		return nil, err
+	}
+	ptree, err := openPTree(settings)
+	if err != nil {
+		return nil, err
+	}
+	defer ptree.Close()
+	root, err := ptree.Root()
+	if err != nil {
+		return nil, err
+	}
+
+	res := &result{}
+	var stale []cf.Zp
+	err = walk(root, func(z cf.Zp) {
+		if !digests.match(z.Bytes()) {
+			stale = append(stale, z)
+		}
+	})
+	if err != nil {
+		return nil, err
+	}
+	res.Matched = digests.matched
+
+	// The tree is only modified once walked, since removals may join its nodes.
+	for i := range stale {
+		if err := ptree.Remove(&stale[i]); err != nil {
+			return nil, err
+		}
+		res.Removed++
+	}
+	for _, d := range digests.missing() {
+		z, err := digestZp(d)
+		if err != nil {
+			return nil, err
+		}
+		if err := ptree.Insert(z); err != nil {
+			return nil, err
+		}
+		res.Inserted++
+	}
+	return res, truncateRemovals()
+}
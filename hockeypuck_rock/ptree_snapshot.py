@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""This script snapshots the prefix tree to the S3 bucket and restores it.
+
+The snapshots are compressed tarballs streamed to and from the bucket, tagged with a marker of the
+database state they match, so that a restored prefix tree can be checked against the database.
+
+With copy, the prefix tree is copied aside, to run while the hockeypuck service is stopped.
+With upload, the copy of the prefix tree is streamed to the bucket.
+With download, a snapshot is streamed from the bucket into the side directory swapped in place of
+the prefix tree by rebuild_ptree.sh, along with its marker, so that the keys modified since the
+snapshot are inserted in the prefix tree when hockeypuck starts.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import subprocess  # nosec B404
+import typing
+
+import boto3
+import botocore.config
+import botocore.exceptions
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "/hockeypuck/data"
+PTREE_DIR = f"{DATA_DIR}/ptree"
+PTREE_NEW_DIR = f"{DATA_DIR}/ptree.new"
+# the marker of the last key modification time ptree.new matches, read by rebuild_ptree.sh
+PTREE_NEW_MARKER_FILE = f"{PTREE_NEW_DIR}.marker"
+PTREE_SNAPSHOT_DIR = f"{DATA_DIR}/ptree.snapshot"
+PTREE_SNAPSHOT_MARKER_FILE = f"{PTREE_SNAPSHOT_DIR}.json"
+SNAPSHOT_PREFIX = "ptree/"
+SNAPSHOT_SUFFIX = ".tar.gz"
+
+
+class SnapshotError(Exception):
+    """Exception raised for errors in the prefix tree snapshot operations."""
+
+
+def _get_db_marker() -> dict[str, str]:
+    """Get the marker of the database state the prefix tree should match.
+
+    Returns:
+        The number of keys and the last key modification time of the database.
+
+    Raises:
+        SnapshotError: if the database cannot be queried.
+    """
+    try:
+        with psycopg2.connect(
+            dbname=os.getenv("POSTGRESQL_DB_NAME"),
+            user=os.getenv("POSTGRESQL_DB_USERNAME"),
+            password=os.getenv("POSTGRESQL_DB_PASSWORD"),
+            host=os.getenv("POSTGRESQL_DB_HOSTNAME"),
+        ) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*), COALESCE(MAX(mtime)::TEXT, '') FROM keys")
+            keys, mtime = cursor.fetchone()
+    except psycopg2.Error as e:
+        raise SnapshotError(f"Failed to query the database: {e}") from e
+    return {"keys": str(keys), "mtime": mtime}
+
+
+def _get_s3_client() -> typing.Any:
+    """Create the S3 client from the environment of the S3 integration.
+
+    Returns:
+        The S3 client.
+
+    Raises:
+        SnapshotError: if the S3 integration is missing.
+    """
+    if not os.getenv("S3_BUCKET"):
+        raise SnapshotError("The S3 integration is missing")
+    addressing_style = os.getenv("S3_ADDRESSING_STYLE") or os.getenv("S3_URI_STYLE") or "auto"
+    return boto3.client(
+        "s3",
+        endpoint_url=os.getenv("S3_ENDPOINT"),
+        region_name=os.getenv("S3_REGION"),
+        aws_access_key_id=os.getenv("S3_ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("S3_SECRET_KEY"),
+        config=botocore.config.Config(s3={"addressing_style": addressing_style}),
+    )
+
+
+def _snapshot_prefix() -> str:
+    """Get the prefix of the snapshot objects in the bucket.
+
+    Returns:
+        The prefix of the snapshot objects, below the path of the S3 integration.
+    """
+    path = os.getenv("S3_PATH", "").strip("/")
+    return f"{path}/{SNAPSHOT_PREFIX}" if path else SNAPSHOT_PREFIX
+
+
+def _copy() -> None:
+    """Copy the prefix tree aside, so that it can be uploaded while the service is running.
+
+    The marker of the database is recorded with the copy, since the service is stopped and the
+    database matches the prefix tree.
+    """
+    shutil.rmtree(PTREE_SNAPSHOT_DIR, ignore_errors=True)
+    shutil.copytree(PTREE_DIR, PTREE_SNAPSHOT_DIR)
+    with open(PTREE_SNAPSHOT_MARKER_FILE, "w", encoding="utf-8") as marker_file:
+        json.dump(_get_db_marker(), marker_file)
+
+
+def _upload(client: typing.Any) -> dict[str, str]:
+    """Stream the copy of the prefix tree to the bucket as a compressed tarball.
+
+    Args:
+        client: The S3 client.
+
+    Returns:
+        The key of the snapshot and its database marker.
+
+    Raises:
+        SnapshotError: if the snapshot cannot be uploaded.
+    """
+    if not os.path.isfile(PTREE_SNAPSHOT_MARKER_FILE):
+        raise SnapshotError("No copy of the prefix tree to upload")
+    with open(PTREE_SNAPSHOT_MARKER_FILE, encoding="utf-8") as marker_file:
+        marker = json.load(marker_file)
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    key = f"{_snapshot_prefix()}{timestamp}{SNAPSHOT_SUFFIX}"
+    with subprocess.Popen(  # nosec B603 B607
+        ["tar", "-C", PTREE_SNAPSHOT_DIR, "-czf", "-", "."], stdout=subprocess.PIPE
+    ) as tar:
+        try:
+            client.upload_fileobj(
+                tar.stdout, os.environ["S3_BUCKET"], key, ExtraArgs={"Metadata": marker}
+            )
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError) as e:
+            tar.kill()
+            raise SnapshotError(f"Failed to upload the snapshot: {e}") from e
+    if tar.returncode != 0:
+        raise SnapshotError(f"Failed to archive the prefix tree: tar exited with {tar.returncode}")
+    shutil.rmtree(PTREE_SNAPSHOT_DIR, ignore_errors=True)
+    os.remove(PTREE_SNAPSHOT_MARKER_FILE)
+    return {"snapshot": key, **marker}
+
+
+def _latest_snapshot(client: typing.Any) -> str:
+    """Find the latest snapshot of the bucket.
+
+    Args:
+        client: The S3 client.
+
+    Returns:
+        The key of the latest snapshot.
+
+    Raises:
+        SnapshotError: if the bucket holds no snapshot.
+    """
+    paginator = client.get_paginator("list_objects_v2")
+    keys = [
+        content["Key"]
+        for page in paginator.paginate(Bucket=os.environ["S3_BUCKET"], Prefix=_snapshot_prefix())
+        for content in page.get("Contents", [])
+        if content["Key"].endswith(SNAPSHOT_SUFFIX)
+    ]
+    if not keys:
+        raise SnapshotError("No prefix tree snapshot in the bucket")
+    # the snapshot names are UTC timestamps, sorting in chronological order
+    return max(keys)
+
+
+def _download(client: typing.Any, snapshot: str | None) -> dict[str, str | bool]:
+    """Stream a snapshot from the bucket into the side directory of the prefix tree.
+
+    Args:
+        client: The S3 client.
+        snapshot: The key of the snapshot, the latest snapshot if None.
+
+    Returns:
+        The key of the snapshot, its database marker and whether it is stale compared to the
+        current database.
+
+    Raises:
+        SnapshotError: if the snapshot cannot be downloaded.
+    """
+    try:
+        key = snapshot or _latest_snapshot(client)
+        response = client.get_object(Bucket=os.environ["S3_BUCKET"], Key=key)
+    except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError) as e:
+        raise SnapshotError(f"Failed to download the snapshot: {e}") from e
+    shutil.rmtree(PTREE_NEW_DIR, ignore_errors=True)
+    os.makedirs(PTREE_NEW_DIR)
+    with subprocess.Popen(  # nosec B603 B607
+        ["tar", "-C", PTREE_NEW_DIR, "-xzf", "-"], stdin=subprocess.PIPE
+    ) as tar:
+        archive = typing.cast(typing.IO[bytes], tar.stdin)
+        try:
+            shutil.copyfileobj(response["Body"], archive)
+        except botocore.exceptions.BotoCoreError as e:
+            tar.kill()
+            raise SnapshotError(f"Failed to download the snapshot: {e}") from e
+        finally:
+            archive.close()
+    if tar.returncode != 0:
+        shutil.rmtree(PTREE_NEW_DIR, ignore_errors=True)
+        raise SnapshotError(f"Failed to extract the snapshot: tar exited with {tar.returncode}")
+    marker = {name: response["Metadata"].get(name, "") for name in ("keys", "mtime")}
+    with open(PTREE_NEW_MARKER_FILE, "w", encoding="utf-8") as marker_file:
+        marker_file.write(marker["mtime"])
+    return {"snapshot": key, **marker, "stale": marker != _get_db_marker()}
+
+
+def main() -> None:
+    """Run the prefix tree snapshot operation and print its result as JSON.
+
+    Raises:
+        SnapshotError: if the operation fails.
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Snapshot the prefix tree to S3 and restore it.")
+    parser.add_argument("operation", choices=["copy", "upload", "download"])
+    parser.add_argument("--snapshot", help="Key of the snapshot to download, the latest if unset")
+    args = parser.parse_args()
+    try:
+        if args.operation == "copy":
+            _copy()
+            return
+        client = _get_s3_client()
+        result = (
+            _upload(client) if args.operation == "upload" else _download(client, args.snapshot)
+        )
+    except SnapshotError as e:
+        logging.error("Prefix tree snapshot operation failed: %s", e)
+        raise
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,86 @@
+#!/bin/bash
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# Rebuild the prefix tree into a side directory while Hockeypuck keeps serving from the current
+# one, then swap the directories.
+#   build: build the new prefix tree from the database into ptree.new.
+#   swap: replace the prefix tree with ptree.new, to run while the hockeypuck service is stopped.
+#       The marker of the database the new prefix tree matches replaces the clean shutdown marker
+#       of the old one, so that the keys modified since are inserted when hockeypuck starts.
+#   count: print the number of keys in the database, to estimate the progress of the build.
+
+set -euo pipefail
+
+DATA_DIR=/hockeypuck/data
+PTREE_DIR="${DATA_DIR}/ptree"
+PTREE_NEW_DIR="${DATA_DIR}/ptree.new"
+PTREE_OLD_DIR="${DATA_DIR}/ptree.old"
+CONFIG_TEMPLATE=/hockeypuck/etc/hockeypuck.conf
+PBUILD_CONFIG_FILE="${DATA_DIR}/hockeypuck-pbuild.conf"
+PTREE_CLEAN_FILE="${DATA_DIR}/ptree.clean"
+# the marker of the database ptree.new matches, written by the build or the snapshot download
+PTREE_NEW_MARKER_FILE="${DATA_DIR}/ptree.new.marker"
+
+db_marker() {
+    PGPASSWORD="${POSTGRESQL_DB_PASSWORD}" psql -v ON_ERROR_STOP=1 -t -A \
+        -d "${POSTGRESQL_DB_NAME}" -h "${POSTGRESQL_DB_HOSTNAME}" -p "${POSTGRESQL_DB_PORT:-5432}" \
+        -U "${POSTGRESQL_DB_USERNAME}" -c "SELECT COALESCE(MAX(mtime)::TEXT, '') FROM keys;"
+}
+
+case "${1:-}" in
+    build)
+        rm -rf "$PTREE_NEW_DIR" "$PTREE_NEW_MARKER_FILE"
+        # the keys modified during the build may be missing from the new prefix tree, so its
+        # marker is read before the build starts and only the keys modified since are inserted
+        # when hockeypuck starts, instead of repairing the whole prefix tree
+        marker=$(db_marker)
+        sed "s|^path=\"${PTREE_DIR}\"$|path=\"${PTREE_NEW_DIR}\"|" "$CONFIG_TEMPLATE" > "$PBUILD_CONFIG_FILE"
+        if ! grep -q "^path=\"${PTREE_NEW_DIR}\"$" "$PBUILD_CONFIG_FILE"; then
+            echo "Prefix tree path not found in ${CONFIG_TEMPLATE}" >&2
+            exit 1
+        fi
+        /hockeypuck/bin/hockeypuck-pbuild -config "$PBUILD_CONFIG_FILE"
+        # only recorded once the build completed, so that an interrupted build is never swapped
+        # in as a clean prefix tree
+        echo "$marker" > "$PTREE_NEW_MARKER_FILE"
+        ;;
+    swap)
+        if [ ! -d "$PTREE_NEW_DIR" ]; then
+            echo "No prefix tree built in ${PTREE_NEW_DIR}" >&2
+            exit 1
+        fi
+        rm -rf "$PTREE_OLD_DIR"
+        if [ -d "$PTREE_DIR" ]; then
+            mv "$PTREE_DIR" "$PTREE_OLD_DIR"
+        fi
+        if ! mv "$PTREE_NEW_DIR" "$PTREE_DIR"; then
+            mv "$PTREE_OLD_DIR" "$PTREE_DIR"
+            exit 1
+        fi
+        rm -rf "$PTREE_OLD_DIR"
+        if [ -f "$PTREE_NEW_MARKER_FILE" ]; then
+            mv "$PTREE_NEW_MARKER_FILE" "$PTREE_CLEAN_FILE"
+        else
+            rm -f "$PTREE_CLEAN_FILE"
+        fi
+        ;;
+    count)
+        # An estimate is enough, so a read-only replica is used when the database provides one
+        if [ -n "${APP_POSTGRESQL_READ_ONLY_HOSTNAME:-}" ]; then
+            HOST="$APP_POSTGRESQL_READ_ONLY_HOSTNAME"
+            PORT="${APP_POSTGRESQL_READ_ONLY_PORT:-5432}"
+        else
+            HOST="$POSTGRESQL_DB_HOSTNAME"
+            PORT="${POSTGRESQL_DB_PORT:-5432}"
+        fi
+        PGPASSWORD="${POSTGRESQL_DB_PASSWORD}" psql -v ON_ERROR_STOP=1 -t -A \
+            -d "${POSTGRESQL_DB_NAME}" -U "${POSTGRESQL_DB_USERNAME}" -h "$HOST" -p "$PORT" \
+            -c "SELECT COUNT(*) FROM keys;"
+        ;;
+    *)
+        echo "Usage: $0 build|swap|count" >&2
+        exit 2
+        ;;
+esac
@@ -0,0 +1,53 @@
+#!/bin/bash
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# Incrementally synchronise the on-disk blocklist with the deleted_keys table.
+# Only the rows added since the last synchronisation are fetched, so the cost of a
+# synchronisation does not depend on the size of the blocklist.
+# Remove the blocklist directory to force a full synchronisation.
+# The rows committed late by long transactions carry a created_at older than the watermark, so
+# the rows created within an overlap window before the watermark are fetched again, and only the
+# ones missing from the previous window are appended.
+
+set -euo pipefail
+
+BLOCKLIST_DIR=/hockeypuck/data/blocklist
+BLOCKLIST_FILE="${BLOCKLIST_DIR}/fingerprints"
+WATERMARK_FILE="${BLOCKLIST_DIR}/watermark"
+# fingerprints of the rows within the overlap window of the last synchronisation
+RECENT_FILE="${BLOCKLIST_DIR}/recent"
+WATERMARK_OVERLAP="5 minutes"
+
+export PGPASSWORD=${POSTGRESQL_DB_PASSWORD}
+
+SQLCMD="psql -v ON_ERROR_STOP=1 -t -A -d ${POSTGRESQL_DB_NAME} -h ${POSTGRESQL_DB_HOSTNAME} -p ${POSTGRESQL_DB_PORT:-5432} -U ${POSTGRESQL_DB_USERNAME}"
+# The full synchronisation reads a read-only replica when the database provides one, and the
+# primary otherwise
+if [ -n "${APP_POSTGRESQL_READ_ONLY_HOSTNAME:-}" ]; then
+    READ_ONLY_SQLCMD="psql -v ON_ERROR_STOP=1 -t -A -d ${POSTGRESQL_DB_NAME} -h ${APP_POSTGRESQL_READ_ONLY_HOSTNAME} -p ${APP_POSTGRESQL_READ_ONLY_PORT:-5432} -U ${POSTGRESQL_DB_USERNAME}"
+else
+    READ_ONLY_SQLCMD="$SQLCMD"
+fi
+
+mkdir -p "$BLOCKLIST_DIR"
+
+if [ ! -f "$BLOCKLIST_FILE" ] || [ ! -f "$WATERMARK_FILE" ]; then
+    # The watermark and the rows are read from the same server, and the rows missing from a
+    # lagging replica are newer than its watermark, so they are fetched from the primary below
+    WATERMARK=$($READ_ONLY_SQLCMD -c "SELECT COALESCE(MAX(created_at), 'epoch') FROM deleted_keys;")
+    $READ_ONLY_SQLCMD -c "COPY (SELECT fingerprint FROM deleted_keys WHERE created_at <= '${WATERMARK}') TO STDOUT;" > "${BLOCKLIST_FILE}.new"
+    $READ_ONLY_SQLCMD -c "COPY (SELECT fingerprint FROM deleted_keys WHERE created_at > '${WATERMARK}'::TIMESTAMPTZ - INTERVAL '${WATERMARK_OVERLAP}' AND created_at <= '${WATERMARK}') TO STDOUT;" > "$RECENT_FILE"
+    mv "${BLOCKLIST_FILE}.new" "$BLOCKLIST_FILE"
+    echo "$WATERMARK" > "$WATERMARK_FILE"
+fi
+touch "$RECENT_FILE"
+
+WATERMARK=$(cat "$WATERMARK_FILE")
+NEW_WATERMARK=$($SQLCMD -c "SELECT COALESCE(MAX(created_at), 'epoch') FROM deleted_keys;")
+$SQLCMD -c "COPY (SELECT fingerprint FROM deleted_keys WHERE created_at > '${WATERMARK}'::TIMESTAMPTZ - INTERVAL '${WATERMARK_OVERLAP}' AND created_at <= '${NEW_WATERMARK}') TO STDOUT;" > "${RECENT_FILE}.new"
+# the window of the previous synchronisation covers the rows of this window already appended
+grep -F -x -v -f "$RECENT_FILE" "${RECENT_FILE}.new" >> "$BLOCKLIST_FILE" || true
+mv "${RECENT_FILE}.new" "$RECENT_FILE"
+echo "$NEW_WATERMARK" > "$WATERMARK_FILE"
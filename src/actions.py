@@ -3,8 +3,11 @@
 
 """Hockeypuck charm actions."""
 
+import hashlib
+import json
 import logging
 import re
+import time
 import typing
 
 import ops
@@ -12,16 +15,136 @@ import paas_app_charmer.go
 import requests
 from requests.exceptions import RequestException
 
-from admin_gpg import AdminGPG
+from admin_gpg import get_admin_gpg
+from block_keys_engine import (
+    DELETED,
+    FINGERPRINT_REGEX,
+    FINGERPRINT_UNAVAILABLE,
+    INVALID_FINGERPRINT,
+    BlockKeysEngine,
+)
+from charm_metrics import CharmMetrics
+from lookup_keys_engine import FOUND, NOT_FOUND, LookupKeysEngine
+from pooled_request_engine import DEFAULT_MAX_WORKERS, FAILED
 
 WORKLOAD_CONTAINER_NAME = "app"
+# the workload service, other services of the container such as charm-metrics are left running
+WORKLOAD_SERVICE_NAME = "go"
 
 logger = logging.getLogger(__name__)
 
 HTTP_PORT: typing.Final[int] = 11371  # the port hockeypuck listens to for HTTP requests
 RECONCILIATION_PORT: typing.Final[int] = 11370  # the port hockeypuck listens to for reconciliation
 METRICS_PORT: typing.Final[int] = 9626  # the metrics port
-FINGERPRINT_REGEX = re.compile(r"[0-9A-Fa-f]{40}|[0-9A-Fa-f]{64}")
+# the port of the lookup caches in front of HTTP_PORT
+LOOKUP_CACHE_PORT: typing.Final[int] = 11372
+REDIS_RELATION_NAME = "redis"
+SYNC_BLOCKLIST_COMMAND = ["/hockeypuck/bin/sync_blocklist.sh"]
+REBUILD_PTREE_COMMAND = ["/hockeypuck/bin/rebuild_ptree.sh"]
+PBUILD_COMMAND = [
+    "/hockeypuck/bin/hockeypuck-pbuild",
+    "-config",
+    "/hockeypuck/etc/hockeypuck.conf",
+]
+# hockeypuck-pbuild logs the number of keys added to the prefix tree so far
+PBUILD_PROGRESS_REGEX = re.compile(r"(\d+) keys added")
+PBUILD_LOG_INTERVAL: typing.Final[int] = 30  # seconds between progress reports
+# seconds to wait for the keyserver to answer the lookups once started
+KEYSERVER_START_TIMEOUT: typing.Final[int] = 600
+KEYSERVER_POLL_INTERVAL: typing.Final[int] = 1
+PTREE_SNAPSHOT_COMMAND = ["/hockeypuck/bin/ptree_snapshot.py"]
+# digests of the keys deleted from the database, pending removal from the prefix tree
+PTREE_REMOVALS_FILE = "/hockeypuck/data/ptree-removals"
+PTREE_REPAIR_COMMAND = [
+    "/hockeypuck/bin/hockeypuck-ptree-repair",
+    "-config",
+    "/hockeypuck/etc/hockeypuck.conf",
+    "-removals",
+    PTREE_REMOVALS_FILE,
+]
+# the results larger than this are written to a file of the workload container
+MAX_ACTION_RESULT_SIZE: typing.Final[int] = 64 * 1024
+ACTION_RESULTS_DIR = "/hockeypuck/data/action-results"
+BLOCK_KEYS_JOB_COMMAND = ["/hockeypuck/bin/block_keys.py", "--job"]
+DEFAULT_CHECKPOINT_INTERVAL: typing.Final[int] = 500
+# outcomes of the block keys engine recorded in a job checkpoint
+JOB_OUTCOMES = {DELETED: "deleted", FINGERPRINT_UNAVAILABLE: "unavailable"}
+JOB_RESULTS = {
+    "deleted": "Deleted and blocked successfully.",
+    "unavailable": FINGERPRINT_UNAVAILABLE,
+}
+
+
+def http_serving_port(model: ops.Model) -> int:
+    """Get the port the HTTP requests of the keyserver are routed to.
+
+    The lookup caches are only put in front of Hockeypuck when the charm is integrated with
+    Redis, sparing an extra hop to every request otherwise.
+
+    Args:
+        model: the model of the charm.
+
+    Returns:
+        The lookup cache port if the redis relation exists, the Hockeypuck HTTP port otherwise.
+    """
+    if model.get_relation(REDIS_RELATION_NAME) is None:
+        return HTTP_PORT
+    return LOOKUP_CACHE_PORT
+
+
+class _PbuildProgress:
+    """Progress of a prefix tree build, relayed to the action and exported as gauges."""
+
+    def __init__(self, event: ops.ActionEvent, metrics: CharmMetrics, total: int) -> None:
+        """Initialize the progress.
+
+        Args:
+            event: the event triggering the original action.
+            metrics: the charm metrics the gauges are exported to.
+            total: the number of keys in the database.
+        """
+        self._event = event
+        self._metrics = metrics
+        self._total = total
+        self._start = self._last_report = time.monotonic()
+        self._processed = 0
+
+    def update(self, processed: int) -> None:
+        """Record the number of keys processed, reporting it every PBUILD_LOG_INTERVAL seconds.
+
+        Args:
+            processed: the number of keys processed so far.
+        """
+        self._processed = processed
+        if time.monotonic() - self._last_report >= PBUILD_LOG_INTERVAL:
+            self.report()
+
+    def report(self) -> None:
+        """Log the progress, throughput and estimated time to completion and export them."""
+        self._last_report = time.monotonic()
+        rate = self._processed / max(self._last_report - self._start, 1e-3)
+        eta = max(self._total - self._processed, 0) / rate if rate else 0
+        self._event.log(
+            f"Processed {self._processed}/{self._total} keys, {rate:.0f} keys/s, ETA {eta:.0f}s."
+        )
+        for metric, description, value in (
+            (
+                "hockeypuck_ptree_rebuild_keys_processed",
+                "Keys added to the prefix tree by the running rebuild.",
+                self._processed,
+            ),
+            (
+                "hockeypuck_ptree_rebuild_keys_per_second",
+                "Throughput of the running prefix tree rebuild.",
+                round(rate, 1),
+            ),
+            (
+                "hockeypuck_ptree_rebuild_eta_seconds",
+                "Estimated time to completion of the running prefix tree rebuild.",
+                round(eta),
+            ),
+        ):
+            self._metrics.set(metric, description, value)
 
 
 class Observer(ops.Object):
@@ -40,7 +163,20 @@ class Observer(ops.Object):
         charm.framework.observe(
             charm.on.rebuild_prefix_tree_action, self._rebuild_prefix_tree_action
         )
+        charm.framework.observe(
+            charm.on.repair_prefix_tree_action, self._repair_prefix_tree_action
+        )
+        charm.framework.observe(
+            charm.on.snapshot_prefix_tree_action, self._snapshot_prefix_tree_action
+        )
+        charm.framework.observe(
+            charm.on.restore_prefix_tree_action, self._restore_prefix_tree_action
+        )
         charm.framework.observe(charm.on.lookup_key_action, self._lookup_key_action)
+        charm.framework.observe(charm.on.import_blocklist_action, self._import_blocklist_action)
+        charm.framework.observe(
+            charm.on.drain_reconciliation_action, self._drain_reconciliation_action
+        )
 
     def _block_keys_action(self, event: ops.ActionEvent) -> None:
         """Blocklist and delete keys from the database.
@@ -54,117 +190,525 @@ class Observer(ops.Object):
 
             input_fingerprints: str = event.params["fingerprints"]
             comment: str = event.params["comment"]
-            fingerprints = input_fingerprints.split(",")
-
-            result = {}
-            fingerprints = [fingerprint.lower() for fingerprint in fingerprints]
-            for fingerprint in fingerprints:
-                if not FINGERPRINT_REGEX.fullmatch(fingerprint):
-                    result[fingerprint] = (
-                        "Invalid fingerprint format. "
-                        "Fingerprints must be 40 or 64 characters long and "
-                        "consist of hexadecimal characters only."
-                    )
-                    continue
-                response = requests.get(
-                    f"http://127.0.0.1:{HTTP_PORT}/pks/lookup?op=get&search=0x{fingerprint}",
-                    timeout=20,
+            if event.params.get("mode", "http") == "database":
+                self._block_keys_in_database(event, input_fingerprints.split(","), comment)
+                return
+            self._run_block_keys_job(event, input_fingerprints.split(","), comment)
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action %s failed: %s %s", ex.command, ex.stdout, ex.stderr)
+            event.fail(f"Failed: {ex.stderr!r}")
+        except (
+            RuntimeError,
+            RequestException,
+        ) as e:
+            logger.exception("Action failed: %s", e)
+            event.fail(f"Failed: {e}")
+
+    def _run_block_keys_job(
+        self, event: ops.ActionEvent, fingerprints: list[str], comment: str
+    ) -> None:
+        """Delete keys through the keyserver as a resumable job and blocklist them.
+
+        The outcome of the processed fingerprints is checkpointed in the database every
+        checkpoint-interval keys, so that a job resumed with the same fingerprints only
+        processes the ones that were not completed.
+
+        Args:
+            event: the event triggering the original action.
+            fingerprints: the fingerprints to delete and block.
+            comment: the comment associated with blocking.
+        """
+        fingerprints = list(dict.fromkeys(fp.strip().lower() for fp in fingerprints))
+        job = hashlib.sha256(",".join(sorted(fingerprints)).encode()).hexdigest()[:16]
+        if event.params.get("resume", False):
+            progress = json.loads(
+                self._run_workload_command([*BLOCK_KEYS_JOB_COMMAND, job, "--progress"])
+            )
+        else:
+            self._run_workload_command([*BLOCK_KEYS_JOB_COMMAND, job, "--reset"])
+            progress = {}
+        result = {fp: JOB_RESULTS[outcome] for fp, outcome in progress.items()}
+        pending = [fp for fp in fingerprints if fp not in progress]
+        event.log(f"Block keys job {job}: {len(progress)} keys already processed.")
+
+        result.update(self._process_block_keys_job(event, job, pending))
+
+        failed = sum(1 for outcome in result.values() if outcome.startswith(FAILED))
+        command = [*BLOCK_KEYS_JOB_COMMAND, job, "--comment", comment]
+        if not failed:
+            # the checkpoints are only needed to resume the job
+            command.append("--finished")
+        if event.params.get("online", True):
+            stdout = self._execute_online_action(event, command)
+        else:
+            stdout = self._execute_action(event, command)
+        if stdout is not None:
+            self.charm.publish_blocklist_generation()
+        for fingerprint, outcome in result.items():
+            if outcome == DELETED:
+                result[fingerprint] = JOB_RESULTS["deleted"]
+        result["job-id"] = job
+        event.set_results(result)
+        if failed:
+            event.fail(
+                f"Failed to delete {failed} keys. "
+                "Run the action again with resume=true to only retry the remaining keys."
+            )
+
+    def _process_block_keys_job(
+        self, event: ops.ActionEvent, job: str, fingerprints: list[str]
+    ) -> dict[str, str]:
+        """Delete keys through the keyserver, checkpointing the job progress.
+
+        Args:
+            event: the event triggering the original action.
+            job: the job identifier.
+            fingerprints: the fingerprints to delete.
+
+        Returns:
+            The outcome of the block keys engine for each fingerprint.
+        """
+        admin_gpg = get_admin_gpg(self.model)
+        engine = BlockKeysEngine(
+            admin_gpg,
+            base_url=f"http://127.0.0.1:{HTTP_PORT}",
+            max_workers=event.params.get("concurrency", DEFAULT_MAX_WORKERS),
+        )
+        interval = event.params.get("checkpoint-interval", DEFAULT_CHECKPOINT_INTERVAL)
+        result: dict[str, str] = {}
+        # the pooled session of the engine is reused by every checkpoint interval
+        with engine, admin_gpg.signing_session():
+            started = time.monotonic()
+            for offset in range(0, len(fingerprints), interval):
+                processed = min(offset + interval, len(fingerprints))
+                outcomes = engine.run(fingerprints[offset:processed])
+                result.update(outcomes)
+                checkpoint = {
+                    fp: JOB_OUTCOMES[outcome]
+                    for fp, outcome in outcomes.items()
+                    if outcome in JOB_OUTCOMES
+                }
+                self._run_workload_command(
+                    [*BLOCK_KEYS_JOB_COMMAND, job, "--checkpoint"], stdin=json.dumps(checkpoint)
                 )
-                if response.status_code == 404:
-                    result[fingerprint] = "Fingerprint unavailable in the database."
-                    continue
-                if not response.ok:
-                    response.raise_for_status()
-                if "-----BEGIN PGP PUBLIC KEY BLOCK-----" in response.text:
-                    public_key = response.text
-                    request = "/pks/delete\n" + public_key
-                    admin_gpg = AdminGPG(self.model)
-                    signature = admin_gpg.generate_signature(request=request)
-                    response = requests.post(
-                        f"http://127.0.0.1:{HTTP_PORT}/pks/delete",
-                        timeout=20,
-                        data={"keytext": request, "keysig": signature},
-                    )
-                    response.raise_for_status()
-                    logging.info("Deleted %s from the database.", fingerprint)
-                    event.log(f"Deleted {fingerprint} from the database.")
-                else:
-                    raise RuntimeError(
-                        f"Public key not found in response for fingerprint: {fingerprint}"
-                    )
-            fingerprints_to_block = list(set(fingerprints) - set(result))
+                rate = processed / max(time.monotonic() - started, 1e-3)
+                event.log(
+                    f"Processed {processed}/{len(fingerprints)} keys, {rate:.1f} keys/s, "
+                    f"ETA {(len(fingerprints) - processed) / rate:.0f}s."
+                )
+        return result
+
+    def _run_workload_command(self, command: list[str], stdin: str | None = None) -> str:
+        """Run a command in the hockeypuck container without interrupting the service.
 
+        Args:
+            command: the command to be executed inside the hockeypuck container.
+            stdin: the data to send to the standard input of the command.
+
+        Returns:
+            The standard output of the command.
+        """
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        service_name = WORKLOAD_SERVICE_NAME
+        process = hockeypuck_container.exec(
+            command,
+            service_context=service_name,
+            stdin=stdin,
+        )
+        stdout, _ = process.wait_output()
+        return stdout
+
+    def _block_keys_in_database(
+        self, event: ops.ActionEvent, fingerprints: list[str], comment: str
+    ) -> None:
+        """Delete and blocklist keys with a single database transaction.
+
+        The keys are removed from the database directly instead of through signed HKP delete
+        requests. The digests of the deleted keys are recorded in the workload container for
+        removal from the prefix tree.
+
+        Args:
+            event: the event triggering the original action.
+            fingerprints: the fingerprints to delete and block.
+            comment: the comment associated with blocking.
+        """
+        result = {}
+        valid_fingerprints = []
+        for fingerprint in dict.fromkeys(fp.strip().lower() for fp in fingerprints):
+            if FINGERPRINT_REGEX.fullmatch(fingerprint):
+                valid_fingerprints.append(fingerprint)
+            else:
+                result[fingerprint] = INVALID_FINGERPRINT
+        if valid_fingerprints:
             command = [
                 "/hockeypuck/bin/block_keys.py",
                 "--fingerprints",
-                ",".join(fingerprints_to_block),
+                ",".join(valid_fingerprints),
                 "--comment",
                 comment,
+                "--delete",
             ]
-            self._execute_action(event, command)
-            for fingerprint in fingerprints_to_block:
-                result[fingerprint] = "Deleted and blocked successfully."
-            event.set_results(result)
-        except (
-            RuntimeError,
-            RequestException,
-        ) as e:
-            logger.exception("Action failed: %s", e)
-            event.fail(f"Failed: {e}")
+            stdout = self._execute_online_action(event, command)
+            if stdout is None:
+                return
+            self.charm.publish_blocklist_generation()
+            deleted = set(json.loads(stdout.strip().splitlines()[-1])["deleted"])
+            for fingerprint in valid_fingerprints:
+                result[fingerprint] = (
+                    JOB_RESULTS["deleted"] if fingerprint in deleted else FINGERPRINT_UNAVAILABLE
+                )
+        event.set_results(result)
 
-    def _rebuild_prefix_tree_action(self, event: ops.ActionEvent) -> None:
-        """Rebuild the prefix tree using the hockeypuck-pbuild binary.
+    def _import_blocklist_action(self, event: ops.ActionEvent) -> None:
+        """Bulk import a file of fingerprints present in the workload container to the blocklist.
 
         Args:
             event: the event triggering the original action.
         """
         command = [
-            "/hockeypuck/bin/hockeypuck-pbuild",
-            "-config",
-            "/hockeypuck/etc/hockeypuck.conf",
+            "/hockeypuck/bin/block_keys.py",
+            "--file",
+            event.params["path"],
+            "--comment",
+            event.params["comment"],
         ]
-        self._execute_action(event, command)
+        stdout = self._execute_online_action(event, command)
+        if stdout is not None:
+            self.charm.publish_blocklist_generation()
+            event.set_results(json.loads(stdout.strip().splitlines()[-1]))
+
+    def _rebuild_prefix_tree_action(self, event: ops.ActionEvent) -> None:
+        """Rebuild the prefix tree using the hockeypuck-pbuild binary.
+
+        In online mode, the prefix tree is built into a side directory while Hockeypuck keeps
+        serving from the current one, and the service is only stopped to swap the directories.
+
+        Args:
+            event: the event triggering the original action.
+        """
+        if not self.charm.is_ready():
+            event.fail("Service not yet ready.")
+            return
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        try:
+            if not event.params.get("online", True):
+                self._stop_workload(event)
+                try:
+                    self._stream_pbuild(event, PBUILD_COMMAND)
+                finally:
+                    self._start_workload()
+                return
+            event.log("Building the prefix tree while the keyserver keeps serving requests")
+            self._stream_pbuild(event, [*REBUILD_PTREE_COMMAND, "build"])
+            event.log("Swapping the prefix tree")
+            start = time.monotonic()
+            self._stop_workload(event)
+            try:
+                hockeypuck_container.exec(
+                    [*REBUILD_PTREE_COMMAND, "swap"], service_context=WORKLOAD_SERVICE_NAME
+                ).wait_output()
+            finally:
+                self._start_workload()
+            # the downtime includes the startup of the keyserver, applying the keys modified
+            # during the build to the new prefix tree
+            serving = self._wait_for_keyserver()
+            event.set_results({"downtime": f"{time.monotonic() - start:.1f}s"})
+            if not serving:
+                event.fail(
+                    f"The keyserver did not answer lookups {KEYSERVER_START_TIMEOUT}s after "
+                    "the swap."
+                )
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action %s failed: %s %s", ex.command, ex.stdout, ex.stderr)
+            event.fail(f"Failed: {ex.stderr!r}")
+
+    def _wait_for_keyserver(self) -> bool:
+        """Wait for the keyserver to answer the lookups after the service started.
+
+        Returns:
+            True if the keyserver answered a lookup within KEYSERVER_START_TIMEOUT seconds.
+        """
+        deadline = time.monotonic() + KEYSERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                requests.get(
+                    f"http://127.0.0.1:{HTTP_PORT}/pks/lookup",
+                    params={"op": "stats"},
+                    timeout=KEYSERVER_POLL_INTERVAL,
+                )
+                return True
+            except RequestException:
+                time.sleep(KEYSERVER_POLL_INTERVAL)
+        return False
+
+    def _stream_pbuild(self, event: ops.ActionEvent, command: list[str]) -> None:
+        """Run a prefix tree build, relaying its progress.
+
+        The number of keys processed is parsed from the hockeypuck-pbuild output, and the
+        progress, throughput and estimated time to completion are logged to the action every
+        PBUILD_LOG_INTERVAL seconds and exported as gauges.
+
+        Args:
+            event: the event triggering the original action.
+            command: the command building the prefix tree.
+        """
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        total, _ = hockeypuck_container.exec(
+            [*REBUILD_PTREE_COMMAND, "count"], service_context=WORKLOAD_SERVICE_NAME
+        ).wait_output()
+        progress = _PbuildProgress(event, CharmMetrics(hockeypuck_container), int(total))
+        process = hockeypuck_container.exec(
+            command, service_context=WORKLOAD_SERVICE_NAME, combine_stderr=True
+        )
+        for line in typing.cast(typing.TextIO, process.stdout):
+            logger.debug("pbuild: %s", line.rstrip())
+            match = PBUILD_PROGRESS_REGEX.search(line)
+            if match:
+                progress.update(int(match.group(1)))
+        process.wait()
+        progress.report()
+
+    def _repair_prefix_tree_action(self, event: ops.ActionEvent) -> None:
+        """Repair the prefix tree by only fixing the elements differing from the database.
+
+        Args:
+            event: the event triggering the original action.
+        """
+        stdout = self._execute_action(event, PTREE_REPAIR_COMMAND)
+        if stdout is not None:
+            event.set_results(json.loads(stdout.strip().splitlines()[-1]))
+
+    def _snapshot_prefix_tree_action(self, event: ops.ActionEvent) -> None:
+        """Upload a snapshot of the prefix tree to the S3 bucket.
+
+        The service is only stopped while the prefix tree is copied aside, and the copy is
+        uploaded while the keyserver keeps serving requests.
+
+        Args:
+            event: the event triggering the original action.
+        """
+        if self._execute_action(event, [*PTREE_SNAPSHOT_COMMAND, "copy"]) is None:
+            return
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        try:
+            event.log("Uploading the prefix tree snapshot")
+            stdout, _ = hockeypuck_container.exec(
+                [*PTREE_SNAPSHOT_COMMAND, "upload"], service_context=WORKLOAD_SERVICE_NAME
+            ).wait_output()
+            event.set_results(json.loads(stdout.strip().splitlines()[-1]))
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action %s failed: %s %s", ex.command, ex.stdout, ex.stderr)
+            event.fail(f"Failed: {ex.stderr!r}")
+
+    def _restore_prefix_tree_action(self, event: ops.ActionEvent) -> None:
+        """Restore the prefix tree from a snapshot of the S3 bucket.
+
+        The snapshot is downloaded while the keyserver keeps serving requests, and the service
+        is only stopped to swap it in. The keys modified since the snapshot are inserted in the
+        restored prefix tree when the service starts, from the marker of the snapshot.
+
+        Args:
+            event: the event triggering the original action.
+        """
+        if not self.charm.is_ready():
+            event.fail("Service not yet ready.")
+            return
+        command = [*PTREE_SNAPSHOT_COMMAND, "download"]
+        if event.params.get("snapshot"):
+            command.extend(["--snapshot", event.params["snapshot"]])
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        try:
+            event.log("Downloading the prefix tree snapshot")
+            stdout, _ = hockeypuck_container.exec(
+                command, service_context=WORKLOAD_SERVICE_NAME
+            ).wait_output()
+            results = json.loads(stdout.strip().splitlines()[-1])
+            self._stop_workload(event)
+            try:
+                hockeypuck_container.exec(
+                    [*REBUILD_PTREE_COMMAND, "swap"], service_context=WORKLOAD_SERVICE_NAME
+                ).wait_output()
+                if results["stale"]:
+                    event.log(
+                        "The keys modified since the snapshot are inserted on start, run "
+                        "repair-prefix-tree to also remove the keys deleted since"
+                    )
+            finally:
+                self._start_workload()
+            event.set_results(results)
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action %s failed: %s %s", ex.command, ex.stdout, ex.stderr)
+            event.fail(f"Failed: {ex.stderr!r}")
 
     def _lookup_key_action(self, event: ops.ActionEvent) -> None:
-        """Lookup a key in the hockeypuck database using email id or fingerprint or keyword.
+        """Lookup keys in the hockeypuck database using email ids or fingerprints or keywords.
+
+        A single keyword returns the armored keys. A list of keywords is looked up concurrently
+        and returns a summary of the keys of each keyword. The results larger than
+        MAX_ACTION_RESULT_SIZE are written to a file of the workload container instead.
 
         Args:
             event: the event triggering the original action.
         """
-        keyword = event.params["keyword"]
         if not self.charm.is_ready():
             event.fail("Service not yet ready.")
+            return
+        keyword = event.params.get("keyword")
+        keywords = [kw for kw in event.params.get("keywords", "").split(",") if kw.strip()]
+        if bool(keyword) == bool(keywords):
+            event.fail("Exactly one of keyword and keywords must be set.")
+            return
+        base_url = f"http://127.0.0.1:{LOOKUP_CACHE_PORT}"
         try:
-            response = requests.get(
-                f"http://127.0.0.1:{HTTP_PORT}/pks/lookup?op=get&search={keyword}",
-                timeout=20,
-            )
-            response.raise_for_status()
-            event.set_results({"result": response.text})
+            if keyword:
+                response = requests.get(
+                    f"{base_url}/pks/lookup?op=get&search={keyword}",
+                    timeout=20,
+                )
+                response.raise_for_status()
+                self._set_large_results(event, {"result": response.text}, "result", "asc")
+                return
+            with LookupKeysEngine(
+                base_url,
+                max_workers=event.params.get("concurrency", DEFAULT_MAX_WORKERS),
+                armored=event.params.get("armored", False),
+            ) as engine:
+                summaries = engine.run(keywords)
+            statuses = [summary["status"] for summary in summaries]
+            results = {
+                "found": str(statuses.count(FOUND)),
+                "not-found": str(statuses.count(NOT_FOUND)),
+                "failed": str(sum(1 for status in statuses if status.startswith(FAILED))),
+                "summary": json.dumps(summaries),
+            }
+            self._set_large_results(event, results, "summary", "json")
         except RequestException as e:
             logger.error("Action failed: %s", e)
             event.fail(f"Failed: {str(e)}")
 
-    def _execute_action(self, event: ops.ActionEvent, command: list[str]) -> None:
+    def _set_large_results(
+        self, event: ops.ActionEvent, results: dict[str, str], payload: str, extension: str
+    ) -> None:
+        """Set the action results, writing a large payload to a file of the workload container.
+
+        Args:
+            event: the event triggering the original action.
+            results: the action results.
+            payload: the name of the result possibly too large for the action results.
+            extension: the extension of the file the payload is written to.
+        """
+        if len(results[payload]) > MAX_ACTION_RESULT_SIZE:
+            path = f"{ACTION_RESULTS_DIR}/{event.id}-{payload}.{extension}"
+            hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+            hockeypuck_container.push(path, results.pop(payload), make_dirs=True)
+            results["path"] = path
+        event.set_results(results)
+
+    def _drain_reconciliation_action(self, event: ops.ActionEvent) -> None:
+        """Drain the reconciliation traffic of the unit, or restore it.
+
+        Juju only commits the relation data at the end of the action, so the unit is drained
+        ahead of the actions stopping the hockeypuck service. These actions keep the unit
+        drained, and the traffic is restored by the first update-status once the keyserver
+        accepts reconciliation connections again.
+
+        Args:
+            event: the event triggering the original action.
+        """
+        if event.params.get("restore", False):
+            self.charm.release_recon_drain()
+            self.charm.publish_recon_weight()
+        else:
+            self.charm.drain_recon()
+        event.set_results({"drained": str(self.charm.is_recon_drained())})
+
+    def _stop_workload(self, event: ops.ActionEvent) -> None:
+        """Stop the hockeypuck service, keeping the reconciliation traffic of the unit drained.
+
+        Args:
+            event: the event triggering the original action.
+        """
+        if not self.charm.is_recon_drained():
+            event.log(
+                "The unit was not drained beforehand, the reconciliation sessions routed to it "
+                "fail until the action ends. Run drain-reconciliation first to avoid it."
+            )
+        self.charm.drain_recon()
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        hockeypuck_container.pebble.stop_services(services=[WORKLOAD_SERVICE_NAME])
+
+    def _start_workload(self) -> None:
+        """Start the hockeypuck service.
+
+        The unit stays drained until a later dispatch sees the keyserver accepting
+        reconciliation connections, as it may repair its prefix tree before serving.
+        """
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        hockeypuck_container.pebble.start_services(services=[WORKLOAD_SERVICE_NAME])
+        self.charm.release_recon_drain()
+
+    def _execute_action(self, event: ops.ActionEvent, command: list[str]) -> str | None:
         """Stop the hockeypuck service, execute the action and start the service.
 
         Args:
             event: the event triggering the original action.
             command: the command to be executed inside the hockeypuck container.
+
+        Returns:
+            The standard output of the command, or None if the action failed.
         """
         if not self.charm.is_ready():
             event.fail("Service not yet ready.")
+            return None
         hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
-        service_name = next(iter(hockeypuck_container.get_services()))
+        service_name = WORKLOAD_SERVICE_NAME
         try:
-            hockeypuck_container.pebble.stop_services(services=[service_name])
+            self._stop_workload(event)
             process = hockeypuck_container.exec(
                 command,
                 service_context=service_name,
             )
-            process.wait_output()
+            stdout, _ = process.wait_output()
+            return stdout
         except ops.pebble.ExecError as ex:
             logger.exception("Action %s failed: %s %s", ex.command, ex.stdout, ex.stderr)
             event.fail(f"Failed: {ex.stderr!r}")
+            return None
         finally:
-            hockeypuck_container.pebble.start_services(services=[service_name])
+            self._start_workload()
+
+    def _execute_online_action(self, event: ops.ActionEvent, command: list[str]) -> str | None:
+        """Execute the action while the hockeypuck service keeps running, then reload it.
+
+        Once the command succeeded, the on-disk blocklist is incrementally refreshed and the
+        service restarted to load it, so that the time the keyserver is unavailable is limited
+        to the service startup instead of the action duration.
+
+        Args:
+            event: the event triggering the original action.
+            command: the command to be executed inside the hockeypuck container.
+
+        Returns:
+            The standard output of the command, or None if the action failed.
+        """
+        if not self.charm.is_ready():
+            event.fail("Service not yet ready.")
+            return None
+        hockeypuck_container = self.charm.unit.get_container(WORKLOAD_CONTAINER_NAME)
+        service_name = WORKLOAD_SERVICE_NAME
+        try:
+            process = hockeypuck_container.exec(
+                command,
+                service_context=service_name,
+            )
+            stdout, _ = process.wait_output()
+            hockeypuck_container.exec(
+                SYNC_BLOCKLIST_COMMAND,
+                service_context=service_name,
+            ).wait_output()
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action %s failed: %s %s", ex.command, ex.stdout, ex.stderr)
+            event.fail(f"Failed: {ex.stderr!r}")
+            return None
+        hockeypuck_container.pebble.restart_services(services=[service_name])
+        return stdout
@@ -4,34 +4,81 @@
 
 """Admin GPG Module."""
 
+import contextlib
 import logging
+import pathlib
 import secrets
 import string
+import threading
 import time
 import typing
+import weakref
 
 import gnupg
 import ops
 import requests
 from requests.exceptions import RequestException
 
+from signers import GPGSigner, Signer, open_openpgp_signer
+
 logger = logging.getLogger(__name__)
 
 ADMIN_LABEL = "admin-gpg-key"
+PEER_RELATION_NAME = "secret-storage"
 PASSWORD_ALPHABET = string.ascii_letters + string.digits
+# Dedicated keyring kept across hooks, so that the admin key is only imported once
+ADMIN_GNUPG_HOME = pathlib.Path.home() / ".hockeypuck-admin-gnupg"
+HOCKEYPUCK_URL = "http://127.0.0.1:11371"
+PUSH_NUM_TRIES = 8
+PUSH_INITIAL_DELAY = 0.25
+PUSH_MAX_DELAY = 8.0
+
+
+class AdminKeyNotReadyError(RuntimeError):
+    """Exception raised when the admin GPG key has not been created by the leader yet."""
+
+
+_admin_gpg_cache: "weakref.WeakKeyDictionary[ops.Model, AdminGPG]" = weakref.WeakKeyDictionary()
+
+
+def get_admin_gpg(model: ops.Model) -> "AdminGPG":
+    """Get the AdminGPG instance shared by the whole charm process.
+
+    Creating a GPG instance forks the gpg binary, and each new instance would otherwise check
+    the keyring again, so a single instance is shared for a given model.
+
+    Args:
+        model: The Juju model.
+
+    Returns:
+        The AdminGPG instance for the model.
+    """
+    admin_gpg = _admin_gpg_cache.get(model)
+    if admin_gpg is None:
+        admin_gpg = AdminGPG(model)
+        _admin_gpg_cache[model] = admin_gpg
+    return admin_gpg
 
 
 class AdminGPG:
     """Admin GPG class."""
 
-    def __init__(self, model: ops.Model) -> None:
+    def __init__(self, model: ops.Model, gnupghome: pathlib.Path | None = None) -> None:
         """Initialize the AdminGPG class.
 
         Args:
             model: The Juju model.
+            gnupghome: The GnuPG home directory holding the admin keyring, ADMIN_GNUPG_HOME by
+                default.
         """
         self.model = model
-        self.gpg = gnupg.GPG()
+        gnupghome = gnupghome or ADMIN_GNUPG_HOME
+        gnupghome.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.gpg = gnupg.GPG(gnupghome=str(gnupghome))
+        self._admin_fingerprint: str | None = None
+        self._signing_lock = threading.Lock()
+        self._signing_credentials: tuple[str, str] | None = None
+        self._session_signer: Signer | None = None
 
     def admin_fingerprint(self) -> str:
         """Get the admin GPG key fingerprint.
@@ -45,11 +92,28 @@ class AdminGPG:
         """Ensure the admin GPG key is present in the GPG keyring.
 
         Checks if the admin GPG key is already present in the Juju secrets. If present,
-        the key is loaded into the keyring, else a new key is generated and added
-        to the Juju secrets. The newly generated key by default gets added to the keyring.
+        the key is loaded into the keyring unless the keyring already holds it, else a new key
+        is generated and added to the Juju secrets. The newly generated key by default gets
+        added to the keyring. The result is kept for the lifetime of the instance, since a new
+        secret revision is only seen by a new hook.
+
+        Returns:
+            The fingerprint of the admin GPG key.
+        """
+        if self._admin_fingerprint is None:
+            self._admin_fingerprint = self._load_admin_key()
+        return self._admin_fingerprint
+
+    def _load_admin_key(self) -> str:
+        """Load the admin GPG key from the Juju secrets, creating it if needed.
 
         Returns:
             The fingerprint of the admin GPG key.
+
+        Raises:
+            AdminKeyNotReadyError: If the admin GPG key does not exist and this unit is not the
+                leader, which creates it.
+            ValueError: If the admin GPG key cannot be added to the Juju secrets.
         """
         try:
             admin_secret = self.model.get_secret(label=ADMIN_LABEL)
@@ -57,14 +121,18 @@ class AdminGPG:
             admin_secret = None
         try:
             if admin_secret is None:
+                if not self.model.unit.is_leader():
+                    raise AdminKeyNotReadyError("Waiting for the leader to create the admin key")
                 admin_credentials = self._create_admin_gpg_key()
                 self._add_admin_to_juju_secret(admin_credentials)
                 return admin_credentials["admin-key"].fingerprint
 
             admin_credentials = admin_secret.get_content()
-            self.gpg.import_keys(admin_credentials["adminpublickey"])
-            self.gpg.import_keys(admin_credentials["adminprivatekey"])
-            return admin_credentials["adminfingerprint"]
+            fingerprint = admin_credentials["adminfingerprint"]
+            if not self.gpg.list_keys(secret=True, keys=[fingerprint]):
+                self.gpg.import_keys(admin_credentials["adminpublickey"])
+                self.gpg.import_keys(admin_credentials["adminprivatekey"])
+            return fingerprint
         except ValueError as e:
             logging.error("Error adding GPG key to secret: %s", e)
             raise e
@@ -109,15 +177,22 @@ class AdminGPG:
                 },
                 label=ADMIN_LABEL,
             )
+            # Notify the other units, waiting for the admin key, through the peer relation
+            peer_relation = self.model.get_relation(PEER_RELATION_NAME)
+            if peer_relation is not None:
+                peer_relation.data[self.model.app]["admin-fingerprint"] = admin_key.fingerprint
         except ValueError as e:
             logging.error("Error adding GPG key to secret: %s", e)
             raise e
 
-    def push_admin_key(self, num_tries: int = 5) -> None:
-        """Push the admin public key to the keyserver.
+    def push_admin_key(self, num_tries: int = PUSH_NUM_TRIES) -> None:
+        """Push the admin public key to the keyserver unless it is already published.
+
+        The keyserver is polled with an exponential backoff until it answers, and the key is
+        only pushed when its fingerprint cannot be looked up.
 
         Args:
-            num_tries: Number of times to retry pushing the admin key to Hockeypuck.
+            num_tries: Number of times to retry reaching Hockeypuck.
 
         Raises:
             RequestException: If there is an error pushing the admin key to Hockeypuck.
@@ -125,32 +200,100 @@ class AdminGPG:
         """
         try:
             admin_secret = self.model.get_secret(label=ADMIN_LABEL).get_content()
-            public_key = admin_secret["adminpublickey"]
-            trial = 0
-            while trial < num_tries:
-                response = requests.post(
-                    "http://127.0.0.1:11371/pks/add",
-                    timeout=20,
-                    data={"keytext": public_key},
-                )
-                logging.info(
-                    "Pushing admin key to hockeypuck. Response text: %s, response code: %s",
-                    response.text,
-                    response.status_code,
-                )
-                if response.status_code == 200:
+            delay = PUSH_INITIAL_DELAY
+            for trial in range(num_tries):
+                try:
+                    if self._is_admin_key_published(admin_secret["adminfingerprint"]):
+                        logging.info("Admin key already published to Hockeypuck")
+                        return
+                    response = requests.post(
+                        f"{HOCKEYPUCK_URL}/pks/add",
+                        timeout=20,
+                        data={"keytext": admin_secret["adminpublickey"]},
+                    )
+                    logging.info(
+                        "Pushing admin key to hockeypuck. Response text: %s, response code: %s",
+                        response.text,
+                        response.status_code,
+                    )
+                    response.raise_for_status()
                     return
-                trial += 1
-                logging.info("Waiting for Hockeypuck to be reachable")
-                time.sleep(5)
-            if trial == num_tries:
-                response.raise_for_status()
+                except RequestException:
+                    if trial == num_tries - 1:
+                        raise
+                logging.info("Waiting %.2fs for Hockeypuck to be reachable", delay)
+                time.sleep(delay)
+                delay = min(delay * 2, PUSH_MAX_DELAY)
         except RequestException as e:
             logging.error("Error pushing admin key to Hockeypuck: %s", e)
             raise RequestException(f"Failed to push admin key to Hockeypuck: {e}") from e
         except ops.SecretNotFoundError as e:
             raise RuntimeError(f"Admin GPG key not found in Juju secret store. {e}") from e
 
+    @staticmethod
+    def _is_admin_key_published(fingerprint: str) -> bool:
+        """Check whether the keyserver already holds the admin key.
+
+        Args:
+            fingerprint: The fingerprint of the admin key.
+
+        Returns:
+            True if the fingerprint is listed by the keyserver.
+
+        Raises:
+            HTTPError: If the keyserver is not ready to answer lookups.
+        """
+        response = requests.get(
+            f"{HOCKEYPUCK_URL}/pks/lookup",
+            timeout=20,
+            params={"op": "index", "options": "mr", "search": f"0x{fingerprint}"},
+        )
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return any(
+            line.lower().startswith(f"pub:{fingerprint.lower()}:")
+            for line in response.text.splitlines()
+        )
+
+    def _get_signing_credentials(self) -> tuple[str, str]:
+        """Get the admin fingerprint and passphrase used to sign requests.
+
+        The credentials are resolved once per instance, so that the same instance can sign many
+        requests, possibly from several threads, without re-reading the secret.
+
+        Returns:
+            The admin GPG key fingerprint and its passphrase.
+        """
+        with self._signing_lock:
+            if self._signing_credentials is None:
+                admin_secret = self.model.get_secret(label=ADMIN_LABEL).get_content()
+                self._signing_credentials = (
+                    self.admin_fingerprint(),
+                    admin_secret["adminpassword"],
+                )
+            return self._signing_credentials
+
+    @contextlib.contextmanager
+    def signing_session(self) -> typing.Iterator[None]:
+        """Sign the requests in-process with the admin key unlocked for the context duration.
+
+        Requests are signed with the gpg binary outside of a session, or if the admin key cannot
+        be loaded in-process.
+
+        Yields:
+            None, once the in-process signer is ready.
+        """
+        admin_secret = self.model.get_secret(label=ADMIN_LABEL).get_content()
+        with open_openpgp_signer(
+            admin_secret["adminprivatekey"], admin_secret["adminpassword"]
+        ) as signer:
+            self._session_signer = signer
+            try:
+                yield
+            finally:
+                self._session_signer = None
+
     def generate_signature(self, request: str) -> str:
         """Generate signature for the given request.
 
@@ -160,12 +303,8 @@ class AdminGPG:
         Returns:
             The signature for the given request.
         """
-        admin_secret = self.model.get_secret(label=ADMIN_LABEL).get_content()
-        password = admin_secret["adminpassword"]
-        signature = self.gpg.sign(
-            request,
-            keyid=self.admin_fingerprint(),
-            passphrase=password,
-            detach=True,
-        )
-        return str(signature)
+        signer = self._session_signer
+        if signer is None:
+            fingerprint, password = self._get_signing_credentials()
+            signer = GPGSigner(self.gpg, fingerprint, password)
+        return signer.sign(request)
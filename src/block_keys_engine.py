@@ -0,0 +1,111 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Concurrent engine deleting keys from Hockeypuck through its HKP admin interface."""
+
+import logging
+import re
+import typing
+
+from admin_gpg import AdminGPG
+from pooled_request_engine import (
+    DEFAULT_MAX_WORKERS,
+    FAILED,
+    REQUEST_TIMEOUT,
+    PooledRequestEngine,
+)
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_REGEX = re.compile(r"[0-9A-Fa-f]{40}|[0-9A-Fa-f]{64}")
+PUBLIC_KEY_HEADER = "-----BEGIN PGP PUBLIC KEY BLOCK-----"
+
+INVALID_FINGERPRINT = (
+    "Invalid fingerprint format. "
+    "Fingerprints must be 40 or 64 characters long and "
+    "consist of hexadecimal characters only."
+)
+FINGERPRINT_UNAVAILABLE = "Fingerprint unavailable in the database."
+DELETED = "Deleted from the database."
+
+
+class BlockKeysEngine(PooledRequestEngine):
+    """Delete keys from Hockeypuck using a bounded worker pool.
+
+    All the workers share a single pooled HTTP session and a single AdminGPG instance, so the
+    admin key is loaded once per run instead of once per fingerprint.
+    """
+
+    def __init__(
+        self,
+        admin_gpg: AdminGPG,
+        base_url: str,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        on_deleted: typing.Callable[[str], None] | None = None,
+    ) -> None:
+        """Initialize the engine.
+
+        Args:
+            admin_gpg: AdminGPG instance used to sign the delete requests.
+            base_url: Base URL of the Hockeypuck HKP interface.
+            max_workers: Maximum number of fingerprints processed concurrently.
+            on_deleted: Callback invoked from the calling thread with each deleted fingerprint.
+        """
+        super().__init__(base_url, max_workers)
+        self._admin_gpg = admin_gpg
+        self._on_deleted = on_deleted
+
+    def run(self, fingerprints: typing.Iterable[str]) -> dict[str, str]:
+        """Delete the given fingerprints from the keyserver.
+
+        Args:
+            fingerprints: Fingerprints to delete.
+
+        Returns:
+            The outcome for each fingerprint, keyed by the lowercase fingerprint. The outcome of
+            fingerprints that could not be deleted starts with FAILED.
+        """
+        result: dict[str, str] = {}
+        pending = []
+        for fingerprint in dict.fromkeys(fp.strip().lower() for fp in fingerprints):
+            if FINGERPRINT_REGEX.fullmatch(fingerprint):
+                pending.append(fingerprint)
+            else:
+                result[fingerprint] = INVALID_FINGERPRINT
+        for fingerprint, outcome in self._map(self._delete_key, pending):
+            if isinstance(outcome, Exception):
+                result[fingerprint] = f"{FAILED}{outcome}"
+                continue
+            result[fingerprint] = outcome
+            if outcome == DELETED and self._on_deleted:
+                self._on_deleted(fingerprint)
+        return result
+
+    def _delete_key(self, fingerprint: str) -> str:
+        """Look up a key and delete it with a signed admin request.
+
+        Args:
+            fingerprint: Fingerprint of the key to delete.
+
+        Returns:
+            The outcome of the deletion.
+
+        Raises:
+            RuntimeError: If the lookup response does not contain a public key.
+        """
+        response = self._get("/pks/lookup", {"op": "get", "search": f"0x{fingerprint}"})
+        if response.status_code == 404:
+            return FINGERPRINT_UNAVAILABLE
+        response.raise_for_status()
+        if PUBLIC_KEY_HEADER not in response.text:
+            raise RuntimeError(f"Public key not found in response for fingerprint: {fingerprint}")
+        request = "/pks/delete\n" + response.text
+        signature = self._admin_gpg.generate_signature(request=request)
+        response = self._session.post(
+            f"{self._base_url}/pks/delete",
+            timeout=REQUEST_TIMEOUT,
+            data={"keytext": request, "keysig": signature},
+        )
+        response.raise_for_status()
+        logger.info("Deleted %s from the database.", fingerprint)
+        return DELETED
@@ -6,19 +6,36 @@
 
 """Go Charm entrypoint."""
 
+import hashlib
+import json
 import logging
 import pathlib
+import socket
 import typing
 
 import ops
 import paas_charm.go
 from charms.operator_libs_linux.v0 import apt
+from paas_charm.app import WorkloadConfig
 from paas_charm.charm_state import CharmState
+from paas_charm.charm_utils import block_if_invalid_data
+from paas_charm.exceptions import CharmConfigInvalidError
 from requests.exceptions import RequestException
 
 import actions
 import traefik_route_observer
-from admin_gpg import AdminGPG
+from admin_gpg import PEER_RELATION_NAME, AdminKeyNotReadyError, get_admin_gpg
+from charm_metrics import METRICS_DIR, CharmMetrics
+
+DATA_DIR = "/hockeypuck/data"
+WORKLOAD_USER = "_daemon_"
+RESTARTS_METRIC = "hockeypuck_charm_restarts_total"
+RESTARTS_DESCRIPTION = "Workload restarts requested by the charm, by outcome."
+BLOCKLIST_GENERATION_KEY = "blocklist-generation"
+# the blocklist generations of every unit a unit synchronised its on-disk blocklist with
+BLOCKLIST_SYNCED_KEY = "blocklist-synced"
+POSTGRESQL_DEFAULT_PORT = "5432"
+RECON_CHECK_TIMEOUT = 1  # seconds to wait for the reconciliation port to accept a connection
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +50,8 @@ for logger_name in getattr(logging.root.manager, "loggerDict", {}):
 class HockeypuckK8SCharm(paas_charm.go.Charm):
     """Go Charm service."""
 
+    _stored = ops.StoredState()
+
     def __init__(self, *args: typing.Any) -> None:
         """Initialize the instance.
 
@@ -43,9 +62,26 @@ class HockeypuckK8SCharm(paas_charm.go.Charm):
 
         self.actions_observer = actions.Observer(self)
         self.reconciliation_port = actions.RECONCILIATION_PORT
-        self._traefik_route = traefik_route_observer.TraefikRouteObserver(self)
+        self._traefik_route = traefik_route_observer.TraefikRouteObserver(
+            self,
+            secret_key=(
+                self._secret_storage.get_secret_key()
+                if self._secret_storage.is_initialized
+                else None
+            ),
+        )
         self.framework.observe(self.on.install, self.install_gnupg)
         self.framework.observe(self.on.upgrade_charm, self.install_gnupg)
+        self.framework.observe(self.on.update_status, self.publish_recon_weight)
+        self.framework.observe(self.on[PEER_RELATION_NAME].relation_changed, self._sync_blocklist)
+        self.framework.observe(self.on[PEER_RELATION_NAME].relation_departed, self._sync_blocklist)
+        self.framework.observe(self.on.update_status, self._sync_blocklist)
+        self._stored.set_default(workload_hash="", recon_drained=False)
+        if postgresql_requirer := self._database_requirers.get("postgresql"):
+            self.framework.observe(
+                postgresql_requirer.on.read_only_endpoints_changed,
+                self._on_read_only_endpoints_changed,
+            )
 
     def install_gnupg(self, _: ops.InstallEvent) -> None:
         """Install gnupg package."""
@@ -55,33 +91,255 @@ class HockeypuckK8SCharm(paas_charm.go.Charm):
         apt.update()
         apt.add_package(["gnupg"])
 
-    def is_ready(self) -> bool:
-        """Check if the charm is ready to start the workload application.
+    @property
+    def _workload_config(self) -> WorkloadConfig:
+        """Return the workload configuration.
+
+        When integrated with redis, the HTTP requests are served through the lookup caches,
+        answering the lookups of popular keys and of absent keys.
 
         Returns:
-            True if the charm is ready to start the workload application.
+            The workload configuration.
         """
-        if self.model.app.planned_units() > 1:
-            self.update_app_and_unit_status(
-                ops.BlockedStatus("Hockeypuck does not support multi-unit deployments")
-            )
-            return False
-        return super().is_ready()
+        workload_config = super()._workload_config
+        workload_config.port = actions.http_serving_port(self.model)
+        return workload_config
+
+    @block_if_invalid_data
+    def _on_read_only_endpoints_changed(self, _: ops.HookEvent) -> None:
+        """Handle the read-only-endpoints-changed event of the postgresql relation."""
+        self.restart()
 
     def restart(self, rerun_migrations: bool = False) -> None:
+        """Restart the workload and publish the reconciliation readiness of the unit.
+
+        Args:
+            rerun_migrations: Whether to rerun migrations.
+        """
+        self._restart_workload(rerun_migrations)
+        self.publish_recon_weight()
+
+    def _restart_workload(self, rerun_migrations: bool) -> None:
         """Open reconciliation port and call the parent restart method.
 
+        The restart is skipped when the rendered workload environment is unchanged since the
+        last restart and the workload is running, so that hooks not changing anything effective
+        do not drop the in-flight requests and reconciliation sessions. The ingress, the ports
+        and the status are still updated, as the parent restart method does.
+
         Args:
             rerun_migrations: Whether to rerun migrations.
         """
-        self.unit.open_port("tcp", actions.RECONCILIATION_PORT)
+        metrics = CharmMetrics(self.unit.get_container(self._workload_config.container_name))
+        if not rerun_migrations and self.is_ready():
+            workload_hash = self._workload_hash()
+            if workload_hash == self._stored.workload_hash and self._is_workload_running():
+                logger.info("Workload environment unchanged, skipping restart")
+                metrics.inc(RESTARTS_METRIC, RESTARTS_DESCRIPTION, {"outcome": "skipped"})
+                self._ingress.provide_ingress_requirements(port=self._workload_config.port)
+                self.unit.set_ports(
+                    ops.Port(protocol="tcp", port=self._workload_config.port),
+                    ops.Port(protocol="tcp", port=actions.RECONCILIATION_PORT),
+                )
+                self.update_app_and_unit_status(ops.ActiveStatus())
+                return
+        self._prepare_data_storage()
         super().restart(rerun_migrations)
+        # the parent restart method closes the ports other than the HTTP one
+        self.unit.open_port("tcp", actions.RECONCILIATION_PORT)
+        if not isinstance(self.unit.status, ops.ActiveStatus):
+            return
+        metrics.inc(RESTARTS_METRIC, RESTARTS_DESCRIPTION, {"outcome": "performed"})
         try:
-            if self.is_ready():
-                admin_gpg = AdminGPG(self.model)
-                admin_gpg.push_admin_key()
+            admin_gpg = get_admin_gpg(self.model)
+            admin_gpg.push_admin_key()
         except RequestException:
             ops.ErrorStatus("Unable to push admin key to Hockeypuck")
+            return
+        # Only record the environment once the restart fully succeeded, so that a failed
+        # restart is retried by the next hook
+        self._stored.workload_hash = self._workload_hash()
+
+    def drain_recon(self) -> None:
+        """Drain the reconciliation traffic of the unit until an action restores it.
+
+        Juju only commits the relation data at the end of the hook or action, so the unit must
+        be drained by its own action ahead of the actions stopping the workload.
+        """
+        self._stored.recon_drained = True
+        self._traefik_route.publish_recon_weight(0)
+
+    def release_recon_drain(self) -> None:
+        """Let the next dispatch restore the reconciliation traffic once the workload serves."""
+        self._stored.recon_drained = False
+
+    def is_recon_drained(self) -> bool:
+        """Check whether the reconciliation traffic of the unit is drained.
+
+        Returns:
+            True if the unit was drained by an action and not restored since.
+        """
+        return bool(self._stored.recon_drained)
+
+    def publish_recon_weight(self, _: ops.HookEvent | None = None) -> None:
+        """Publish the weight of the reconciliation traffic of the unit.
+
+        A drained unit or a unit not serving the reconciliation port gets a weight of 0, and a
+        unit with prefix tree removals pending gets a reduced share of the traffic, as it still
+        serves the removed keys to its peers.
+        """
+        if self.is_recon_drained() or not self._is_recon_serving():
+            weight = 0
+        elif self._has_pending_ptree_removals():
+            weight = traefik_route_observer.RECON_WEIGHT_DEGRADED
+        else:
+            weight = traefik_route_observer.RECON_WEIGHT_READY
+        self._traefik_route.publish_recon_weight(weight)
+
+    def publish_blocklist_generation(self) -> None:
+        """Announce a change of the blocklist in the database to the other units.
+
+        The generation of the unit is bumped in its peer relation data, so that the other units
+        synchronise their on-disk blocklist. The action changing the blocklist synchronised the
+        one of the unit with the whole database, so the unit is recorded as synchronised.
+        """
+        peer_relation = self.model.get_relation(PEER_RELATION_NAME)
+        if peer_relation is None:
+            return
+        unit_data = peer_relation.data[self.unit]
+        unit_data[BLOCKLIST_GENERATION_KEY] = str(
+            int(unit_data.get(BLOCKLIST_GENERATION_KEY) or "0") + 1
+        )
+        unit_data[BLOCKLIST_SYNCED_KEY] = json.dumps(
+            _blocklist_generations(peer_relation, self.unit), sort_keys=True
+        )
+
+    def _sync_blocklist(self, _: ops.EventBase) -> None:
+        """Synchronise the blocklist when another unit changed it in the database.
+
+        The on-disk blocklist is refreshed while the workload keeps serving, and only the
+        workload service is restarted to load it. The units take turns in the order of their
+        number, each waiting for the units before it to publish the generations they
+        synchronised, so that a single unit restarts at a time. The generations are only
+        recorded once the restart succeeded, so that the next dispatch retries it.
+        """
+        peer_relation = self.model.get_relation(PEER_RELATION_NAME)
+        if peer_relation is None:
+            return
+        generations = _blocklist_generations(peer_relation, self.unit)
+        unit_data = peer_relation.data[self.unit]
+        if _is_blocklist_synced(unit_data.get(BLOCKLIST_SYNCED_KEY), generations):
+            return
+        for unit in peer_relation.units:
+            synced = peer_relation.data[unit].get(BLOCKLIST_SYNCED_KEY)
+            # the units not publishing their generations yet synchronise on their next start
+            if (
+                synced is not None
+                and _unit_number(unit) < _unit_number(self.unit)
+                and not _is_blocklist_synced(synced, generations)
+            ):
+                logger.info("Waiting for %s to synchronise the blocklist", unit.name)
+                return
+        if self._is_workload_running():
+            container = self.unit.get_container(self._workload_config.container_name)
+            service_name = self._workload_config.service_name
+            try:
+                container.exec(
+                    actions.SYNC_BLOCKLIST_COMMAND, service_context=service_name
+                ).wait_output()
+                container.restart(service_name)
+            except (ops.pebble.ExecError, ops.pebble.ChangeError) as e:
+                logger.warning("Unable to synchronise the blocklist: %s", e)
+                return
+        # a workload not running synchronises the blocklist on its next start
+        unit_data[BLOCKLIST_SYNCED_KEY] = json.dumps(generations, sort_keys=True)
+
+    def _has_pending_ptree_removals(self) -> bool:
+        """Check whether keys are pending removal from the prefix tree.
+
+        Returns:
+            True if the prefix tree removals file is not empty.
+        """
+        container = self.unit.get_container(self._workload_config.container_name)
+        try:
+            files = container.list_files(actions.PTREE_REMOVALS_FILE)
+        except (ops.pebble.APIError, ops.pebble.PathError, ops.pebble.ConnectionError):
+            return False
+        return any(file.size for file in files)
+
+    def _prepare_data_storage(self) -> None:
+        """Give the workload user the ownership of the data storage.
+
+        The storage is mounted as root, while the workload runs as an unprivileged user keeping
+        the prefix tree, the blocklist and the lookup cache metrics in it.
+        """
+        container = self.unit.get_container(self._workload_config.container_name)
+        if not container.can_connect():
+            return
+        try:
+            container.make_dir(METRICS_DIR, make_parents=True)
+            container.exec(
+                ["chown", f"{WORKLOAD_USER}:{WORKLOAD_USER}", DATA_DIR, METRICS_DIR]
+            ).wait()
+        except ops.pebble.PathError as e:
+            logger.warning("Unable to create %s: %s", METRICS_DIR, e)
+        except ops.pebble.ExecError as e:
+            logger.warning("Unable to change the ownership of %s: %s", DATA_DIR, e.stderr)
+
+    def _workload_hash(self) -> str:
+        """Compute the hash of the rendered workload environment.
+
+        The environment holds the admin keys, the reconciliation peers and the database
+        connection details of the workload. The configurations only read by the traefik-route
+        are left out, as changing them does not need a restart of the workload.
+
+        Returns:
+            The hash of the workload environment.
+        """
+        route_variables = {
+            f"APP_{option.replace('-', '_').upper()}"
+            for option in traefik_route_observer.ROUTE_CONFIG_OPTIONS
+        }
+        environment = json.dumps(
+            {
+                name: value
+                for name, value in self._gen_environment().items()
+                if name not in route_variables
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(environment.encode()).hexdigest()
+
+    def _is_workload_running(self) -> bool:
+        """Check whether the workload service is running.
+
+        Returns:
+            True if the workload service is running.
+        """
+        container = self.unit.get_container(self._workload_config.container_name)
+        if not container.can_connect():
+            return False
+        services = container.get_services(self._workload_config.service_name)
+        return bool(services) and all(service.is_running() for service in services.values())
+
+    def _is_recon_serving(self) -> bool:
+        """Check whether the workload is running and accepts reconciliation connections.
+
+        The workload may repair its prefix tree before serving, so the running service alone
+        does not mean the unit can take reconciliation traffic.
+
+        Returns:
+            True if the reconciliation port of the workload accepts connections.
+        """
+        if not self._is_workload_running():
+            return False
+        try:
+            with socket.create_connection(
+                ("127.0.0.1", actions.RECONCILIATION_PORT), timeout=RECON_CHECK_TIMEOUT
+            ):
+                return True
+        except OSError:
+            return False
 
     def get_cos_dir(self) -> str:
         """Return the directory with COS related files.
@@ -102,7 +360,10 @@ class HockeypuckK8SCharm(paas_charm.go.Charm):
             New CharmState
         """
         charm_state = super()._create_charm_state()
-        admin_fingerprint = AdminGPG(self.model).admin_fingerprint()
+        try:
+            admin_fingerprint = get_admin_gpg(self.model).admin_fingerprint()
+        except AdminKeyNotReadyError as e:
+            raise CharmConfigInvalidError(str(e)) from e
         if "admin_keys" not in charm_state._user_defined_config:
             charm_state._user_defined_config["admin_keys"] = admin_fingerprint
         else:
@@ -110,9 +371,94 @@ class HockeypuckK8SCharm(paas_charm.go.Charm):
                 charm_state._user_defined_config["admin_keys"].rstrip(chars=",")
                 + f",{admin_fingerprint}"
             )
+        charm_state._user_defined_config.update(self._read_only_database_config())
 
         return charm_state
 
+    def _read_only_database_config(self) -> dict[str, str]:
+        """Get the read-only replica endpoint of the postgresql relation.
+
+        Hockeypuck itself only takes a single database connection, so the replica is used by the
+        workload scripts for the reads that tolerate a replication lag.
+
+        Returns:
+            The hostname and port of the first read-only endpoint, if any, as user defined config.
+        """
+        postgresql_requirer = self._database_requirers.get("postgresql")
+        if postgresql_requirer is None:
+            return {}
+        for data in postgresql_requirer.fetch_relation_data(
+            fields=["read-only-endpoints"]
+        ).values():
+            if endpoints := data.get("read-only-endpoints"):
+                hostname, port = _parse_endpoint(endpoints.split(",")[0].strip())
+                return {
+                    "postgresql_read_only_hostname": hostname,
+                    "postgresql_read_only_port": port,
+                }
+        return {}
+
+
+def _blocklist_generations(relation: ops.Relation, unit: ops.Unit) -> dict[str, int]:
+    """Get the blocklist generations published in the peer relation.
+
+    Args:
+        relation: the peer relation.
+        unit: the unit of the charm.
+
+    Returns:
+        The generation of each unit which changed the blocklist, by unit name.
+    """
+    return {
+        peer.name: int(generation)
+        for peer in (unit, *relation.units)
+        if (generation := relation.data[peer].get(BLOCKLIST_GENERATION_KEY))
+    }
+
+
+def _is_blocklist_synced(synced: str | None, generations: dict[str, int]) -> bool:
+    """Check whether a unit synchronised its blocklist with the generations of every unit.
+
+    Args:
+        synced: the generations the unit published as synchronised, if any.
+        generations: the current generations of the units which changed the blocklist.
+
+    Returns:
+        True if no generation is newer than the one the unit synchronised.
+    """
+    applied = json.loads(synced) if synced else {}
+    return all(applied.get(name, 0) >= generation for name, generation in generations.items())
+
+
+def _unit_number(unit: ops.Unit) -> int:
+    """Get the number of a unit in its application.
+
+    Args:
+        unit: the unit.
+
+    Returns:
+        The number of the unit.
+    """
+    return int(unit.name.rpartition("/")[2])
+
+
+def _parse_endpoint(endpoint: str) -> tuple[str, str]:
+    """Split a database endpoint into its hostname and port.
+
+    Args:
+        endpoint: the endpoint, as host, host:port, [IPv6] or [IPv6]:port.
+
+    Returns:
+        The hostname and port of the endpoint, the port defaulting to the PostgreSQL one.
+    """
+    hostname, port = endpoint, ""
+    if endpoint.startswith("["):
+        hostname, _, rest = endpoint[1:].partition("]")
+        port = rest.removeprefix(":")
+    elif endpoint.count(":") == 1:
+        hostname, _, port = endpoint.partition(":")
+    return hostname, port or POSTGRESQL_DEFAULT_PORT
+
 
 if __name__ == "__main__":
     ops.main(HockeypuckK8SCharm)
@@ -0,0 +1,144 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Metrics of the charm operations, exposed by the workload container."""
+
+import json
+import logging
+import typing
+
+import ops
+
+logger = logging.getLogger(__name__)
+
+CHARM_METRICS_PORT: typing.Final[int] = 9627  # the charm metrics exporter port
+METRICS_DIR = "/hockeypuck/data/metrics"
+
+# comment of the .prom file holding the samples, ignored by Prometheus
+STATE_COMMENT = "# charm-metrics-state "
+COUNTER = "counter"
+GAUGE = "gauge"
+
+
+class CharmMetrics:
+    """Counters and gauges written to the metrics directory of the workload container.
+
+    The metrics are rendered in the Prometheus text format to a .prom file, which is served by
+    the charm-metrics service of the workload. The samples are kept as JSON in a comment of the
+    same file, so that an update is a single pull and push. The metrics are reset when the
+    workload container is recreated, which Prometheus handles as a counter reset.
+    """
+
+    def __init__(self, container: ops.Container, name: str = "charm") -> None:
+        """Initialize the metrics.
+
+        Args:
+            container: The workload container.
+            name: The name of the metrics files, unique to the metrics writer.
+        """
+        self._container = container
+        self._prom_path = f"{METRICS_DIR}/{name}.prom"
+
+    def inc(
+        self,
+        metric: str,
+        description: str,
+        labels: dict[str, str] | None = None,
+        value: float = 1,
+    ) -> None:
+        """Increment a counter.
+
+        Args:
+            metric: The name of the counter.
+            description: The help text of the counter.
+            labels: The labels of the sample.
+            value: The increment.
+        """
+        self._update(metric, COUNTER, description, labels, value, increment=True)
+
+    def set(
+        self,
+        metric: str,
+        description: str,
+        value: float,
+        labels: dict[str, str] | None = None,
+    ) -> None:
+        """Set a gauge.
+
+        Args:
+            metric: The name of the gauge.
+            description: The help text of the gauge.
+            value: The value of the gauge.
+            labels: The labels of the sample.
+        """
+        self._update(metric, GAUGE, description, labels, value, increment=False)
+
+    def _update(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        metric: str,
+        metric_type: str,
+        description: str,
+        labels: dict[str, str] | None,
+        value: float,
+        increment: bool,
+    ) -> None:
+        """Update a sample and render the metrics file.
+
+        Metrics are best effort: failing to write them never fails the charm operation.
+
+        Args:
+            metric: The name of the metric.
+            metric_type: The Prometheus type of the metric.
+            description: The help text of the metric.
+            labels: The labels of the sample.
+            value: The value, or the increment for counters.
+            increment: Whether the value is added to the current sample.
+        """
+        if not self._container.can_connect():
+            logger.debug("Workload container unavailable, metric %s not recorded", metric)
+            return
+        sample = ",".join(f'{key}="{val}"' for key, val in sorted((labels or {}).items()))
+        try:
+            state = self._load()
+            entry = state.setdefault(
+                metric, {"type": metric_type, "help": description, "samples": {}}
+            )
+            entry["help"] = description
+            if increment:
+                value += entry["samples"].get(sample, 0)
+            entry["samples"][sample] = value
+            self._container.push(self._prom_path, _render(state), make_dirs=True)
+        except (ops.pebble.Error, ValueError) as e:
+            logger.warning("Unable to record metric %s: %s", metric, e)
+
+    def _load(self) -> dict[str, typing.Any]:
+        """Load the current samples.
+
+        Returns:
+            The metrics keyed by name.
+        """
+        try:
+            first_line = self._container.pull(self._prom_path).readline()
+        except ops.pebble.PathError:
+            return {}
+        if not first_line.startswith(STATE_COMMENT):
+            return {}
+        return json.loads(first_line.removeprefix(STATE_COMMENT))
+
+
+def _render(state: dict[str, typing.Any]) -> str:
+    """Render the metrics in the Prometheus text format.
+
+    Args:
+        state: The metrics keyed by name.
+
+    Returns:
+        The metrics in the Prometheus text format, preceded by the state comment.
+    """
+    lines = [f"{STATE_COMMENT}{json.dumps(state, sort_keys=True)}"]
+    for metric, entry in sorted(state.items()):
+        lines.append(f"# HELP {metric} {entry['help']}")
+        lines.append(f"# TYPE {metric} {entry['type']}")
+        for sample, value in sorted(entry["samples"].items()):
+            lines.append(f"{metric}{{{sample}}} {value}" if sample else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
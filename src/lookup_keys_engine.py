@@ -0,0 +1,103 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Concurrent engine looking up keys in Hockeypuck through its HKP interface."""
+
+import typing
+import urllib.parse
+
+from pooled_request_engine import DEFAULT_MAX_WORKERS, FAILED, PooledRequestEngine
+
+FOUND = "found"
+NOT_FOUND = "not-found"
+
+
+def parse_machine_readable_index(index: str) -> list[dict[str, typing.Any]]:
+    """Parse the machine readable output of an op=index lookup.
+
+    Args:
+        index: The op=index response with the mr option.
+
+    Returns:
+        The summary of each key: fingerprint, algorithm, bits, creation and expiration times,
+        flags and UIDs.
+    """
+    keys: list[dict[str, typing.Any]] = []
+    for line in index.splitlines():
+        fields = line.strip().split(":")
+        if fields[0] == "pub" and len(fields) >= 2:
+            fields += [""] * (7 - len(fields))
+            keys.append(
+                {
+                    "fingerprint": fields[1].lower(),
+                    "algorithm": fields[2],
+                    "bits": fields[3],
+                    "created": fields[4],
+                    "expires": fields[5],
+                    "flags": fields[6],
+                    "uids": [],
+                }
+            )
+        elif fields[0] == "uid" and len(fields) >= 2 and keys:
+            keys[-1]["uids"].append(urllib.parse.unquote(fields[1]))
+    return keys
+
+
+class LookupKeysEngine(PooledRequestEngine):
+    """Look up keys in Hockeypuck using a bounded worker pool sharing a pooled HTTP session."""
+
+    def __init__(
+        self, base_url: str, max_workers: int = DEFAULT_MAX_WORKERS, armored: bool = False
+    ) -> None:
+        """Initialize the engine.
+
+        Args:
+            base_url: Base URL of the Hockeypuck HKP interface.
+            max_workers: Maximum number of keywords looked up concurrently.
+            armored: Whether to include the armored keys in the summaries.
+        """
+        super().__init__(base_url, max_workers)
+        self._armored = armored
+
+    def run(self, keywords: typing.Iterable[str]) -> list[dict[str, typing.Any]]:
+        """Look up the given keywords.
+
+        Args:
+            keywords: Fingerprints, key IDs, email addresses or keywords to look up.
+
+        Returns:
+            The summary of each keyword, in the order of the keywords. The status of the
+            keywords that could not be looked up starts with FAILED.
+        """
+        pending = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword.strip()))
+        result: dict[str, dict[str, typing.Any]] = {}
+        for keyword, summary in self._map(self._lookup, pending):
+            if isinstance(summary, Exception):
+                summary = {"keyword": keyword, "status": f"{FAILED}{summary}"}
+            result[keyword] = summary
+        return [result[keyword] for keyword in pending]
+
+    def _lookup(self, keyword: str) -> dict[str, typing.Any]:
+        """Look up the machine readable index of a keyword, and its armored keys if requested.
+
+        Args:
+            keyword: The keyword to look up.
+
+        Returns:
+            The summary of the keys matching the keyword.
+        """
+        response = self._get("/pks/lookup", {"op": "index", "options": "mr", "search": keyword})
+        if response.status_code == 404:
+            return {"keyword": keyword, "status": NOT_FOUND}
+        response.raise_for_status()
+        summary: dict[str, typing.Any] = {
+            "keyword": keyword,
+            "status": FOUND,
+            "keys": parse_machine_readable_index(response.text),
+        }
+        if self._armored:
+            response = self._get("/pks/lookup", {"op": "get", "search": keyword})
+            response.raise_for_status()
+            summary["size"] = len(response.content)
+            summary["armored"] = response.text
+        return summary
@@ -0,0 +1,92 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Base of the concurrent engines sending requests to Hockeypuck over a pooled HTTP session."""
+
+import concurrent.futures
+import logging
+import typing
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS: typing.Final[int] = 8
+REQUEST_TIMEOUT: typing.Final[int] = 20
+FAILED = "Failed: "
+
+ResultT = typing.TypeVar("ResultT")
+
+
+class PooledRequestEngine:
+    """Process items with a bounded worker pool sharing a single pooled HTTP session.
+
+    The session is kept open across runs, until the engine is closed.
+    """
+
+    def __init__(self, base_url: str, max_workers: int = DEFAULT_MAX_WORKERS) -> None:
+        """Initialize the engine.
+
+        Args:
+            base_url: Base URL of the Hockeypuck HKP interface.
+            max_workers: Maximum number of items processed concurrently.
+        """
+        self._base_url = base_url
+        self._max_workers = max(1, max_workers)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._max_workers)
+        self._session.mount("http://", adapter)
+
+    def __enter__(self) -> typing.Self:
+        """Use the engine in a with statement, closing it on exit.
+
+        Returns:
+            The engine.
+        """
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Close the engine on exit of the with statement."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the pooled HTTP session."""
+        self._session.close()
+
+    def _map(
+        self, task: typing.Callable[[str], ResultT], items: typing.Iterable[str]
+    ) -> typing.Iterator[tuple[str, ResultT | Exception]]:
+        """Run a task for each item on the worker pool.
+
+        Args:
+            task: The task processing an item.
+            items: The items to process.
+
+        Yields:
+            Each item and the result of its task, or the error it failed with, as they complete.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {executor.submit(task, item): item for item in items}
+            for future in concurrent.futures.as_completed(futures):
+                item = futures[future]
+                result: ResultT | Exception
+                try:
+                    result = future.result()
+                except (RuntimeError, RequestException) as e:
+                    logger.error("Failed to process %s: %s", item, e)
+                    result = e
+                yield item, result
+
+    def _get(self, path: str, params: dict[str, str]) -> requests.Response:
+        """Send a GET request to Hockeypuck over the pooled session.
+
+        Args:
+            path: The path of the request.
+            params: The query parameters of the request.
+
+        Returns:
+            The response.
+        """
+        return self._session.get(f"{self._base_url}{path}", params=params, timeout=REQUEST_TIMEOUT)
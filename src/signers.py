@@ -0,0 +1,114 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Signer backends generating detached signatures for Hockeypuck admin requests."""
+
+import contextlib
+import logging
+import typing
+
+import gnupg
+
+# PGPy fails to import with an AttributeError on the cryptography releases that removed the
+# ciphers it registers, the signatures then fall back to the gpg binary
+try:
+    import pgpy
+    from pgpy.errors import PGPError
+except Exception:  # pylint: disable=broad-exception-caught  # pragma: no cover
+    pgpy = None  # pylint: disable=invalid-name
+
+logger = logging.getLogger(__name__)
+
+
+class Signer(typing.Protocol):  # pylint: disable=too-few-public-methods
+    """Backend generating detached signatures with the admin key."""
+
+    def sign(self, request: str) -> str:
+        """Generate a detached armored signature for the given request.
+
+        Args:
+            request: The request to sign.
+        """
+
+
+class GPGSigner:  # pylint: disable=too-few-public-methods
+    """Signer running the gpg binary for each signature."""
+
+    def __init__(self, gpg: gnupg.GPG, fingerprint: str, passphrase: str) -> None:
+        """Initialize the signer.
+
+        Args:
+            gpg: The GPG instance whose keyring holds the admin key.
+            fingerprint: The fingerprint of the admin key.
+            passphrase: The passphrase of the admin key.
+        """
+        self._gpg = gpg
+        self._fingerprint = fingerprint
+        self._passphrase = passphrase
+
+    def sign(self, request: str) -> str:
+        """Generate a detached armored signature for the given request.
+
+        Args:
+            request: The request to sign.
+
+        Returns:
+            The signature for the given request.
+        """
+        signature = self._gpg.sign(
+            request,
+            keyid=self._fingerprint,
+            passphrase=self._passphrase,
+            detach=True,
+        )
+        return str(signature)
+
+
+class OpenPGPSigner:  # pylint: disable=too-few-public-methods
+    """Signer using an admin key unlocked in the charm process memory."""
+
+    def __init__(self, key: "pgpy.PGPKey") -> None:
+        """Initialize the signer.
+
+        Args:
+            key: The unlocked admin private key.
+        """
+        self._key = key
+
+    def sign(self, request: str) -> str:
+        """Generate a detached armored signature for the given request.
+
+        Args:
+            request: The request to sign.
+
+        Returns:
+            The signature for the given request.
+        """
+        return str(self._key.sign(request))
+
+
+@contextlib.contextmanager
+def open_openpgp_signer(private_key: str, passphrase: str) -> typing.Iterator[Signer | None]:
+    """Unlock the admin key in memory for the duration of the context.
+
+    The unlocked key material is cleared when the context exits.
+
+    Args:
+        private_key: The armored admin private key.
+        passphrase: The passphrase of the admin key.
+
+    Yields:
+        The in-process signer, or None if the key cannot be used in-process.
+    """
+    signer = None
+    with contextlib.ExitStack() as stack:
+        if pgpy is None:
+            logger.warning("PGPy unavailable, signing admin requests with gpg")
+        else:
+            try:
+                key, _ = pgpy.PGPKey.from_blob(private_key)
+                stack.enter_context(key.unlock(passphrase))
+                signer = OpenPGPSigner(key)
+            except (PGPError, AttributeError, ValueError, NotImplementedError) as e:
+                logger.warning("Unable to load the admin key in-process, signing with gpg: %s", e)
+        yield signer
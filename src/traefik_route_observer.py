@@ -3,20 +3,75 @@
 
 """Traefik route observer module."""
 
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
 import socket
 import typing
 
 import ops
 from charms.traefik_k8s.v0.traefik_route import TraefikRouteRequirer
 
-from actions import RECONCILIATION_PORT
+from actions import (
+    LOOKUP_CACHE_PORT,
+    RECONCILIATION_PORT,
+    WORKLOAD_CONTAINER_NAME,
+    http_serving_port,
+)
+from charm_metrics import CharmMetrics
+
+logger = logging.getLogger(__name__)
 
 RELATION_NAME = "traefik-route"
-HOCKEYPUCK_TCP_ROUTER = {
-    "hockeypuck-tcp-router": {
-        "rule": "ClientIP(`0.0.0.0/0`)",
-        "service": "hockeypuck-tcp-service",
-        "entryPoints": ["reconciliation-port"],
+PEER_RELATION_NAME = "secret-storage"
+# weight of the reconciliation traffic of a unit, published by each unit in its peer data
+RECON_WEIGHT_KEY = "recon-weight"
+RECON_WEIGHT_READY: typing.Final[int] = 10
+RECON_WEIGHT_DEGRADED: typing.Final[int] = 1
+RECON_HEALTH_CHECK_TIMEOUT = "5s"
+SUBMISSIONS_METRIC = "hockeypuck_traefik_route_submissions_total"
+SUBMISSIONS_DESCRIPTION = "Traefik route configurations submitted by the leader, by outcome."
+# the HTTP entry points of traefik-k8s, the TLS one only being served with a certificate
+HTTP_ENTRY_POINTS: dict[str, dict[str, object]] = {
+    "": {"entryPoints": ["web"]},
+    "-tls": {"entryPoints": ["websecure"], "tls": {}},
+}
+HOCKEYPUCK_HTTP_MIDDLEWARES = {
+    # armored keys compress several-fold, the small responses are not worth compressing
+    "hockeypuck-compress": {"compress": {"minResponseBodyBytes": 1024}},
+    "hockeypuck-webroot-cache": {
+        "headers": {"customResponseHeaders": {"Cache-Control": "public, max-age=3600"}}
+    },
+}
+# endpoints rate limited per client by the rate-limit-<endpoint> configurations
+RATE_LIMITED_ENDPOINTS = {
+    "add": "/pks/add",
+    "lookup": "/pks/lookup",
+    "hashquery": "/pks/hashquery",
+}
+RATE_LIMIT_PERIOD = "1m"
+# configurations only read by the traefik-route, not by the workload
+ROUTE_CONFIG_OPTIONS = (
+    "hkp-hostname",
+    "recon-allowed-cidrs",
+    "recon-health-check-interval",
+    *(f"rate-limit-{endpoint}" for endpoint in RATE_LIMITED_ENDPOINTS),
+)
+# path of the lookup cache counting the requests rejected by the rate limits, followed by a token
+# derived from the application secret key, so that only the errors middleware reaches it
+RATE_LIMITED_PATH = "/_hockeypuck/rate-limited/"
+RATE_LIMITED_TOKEN_CONTEXT = b"hockeypuck-rate-limited"
+# the webroot router catches all the requests of the hostname the other routers do not match
+WEBROOT_ROUTER_PRIORITY = 1
+HKP_ROUTER_PRIORITY = 2
+RATE_LIMIT_ROUTER_PRIORITY = 3
+HOCKEYPUCK_HTTP_TRANSPORT = {
+    "hockeypuck-http-transport": {
+        # keep the backend connections alive between requests instead of dialing each time
+        "maxIdleConnsPerHost": 64,
+        "forwardingTimeouts": {"dialTimeout": "5s", "idleConnTimeout": "90s"},
     }
 }
 
@@ -24,23 +79,58 @@ HOCKEYPUCK_TCP_ROUTER = {
 class TraefikRouteObserver(ops.Object):
     """Traefik route relation observer."""
 
-    def __init__(self, charm: ops.CharmBase):
+    _stored = ops.StoredState()
+
+    def __init__(self, charm: ops.CharmBase, secret_key: str | None = None):
         """Initialize the observer and register event handlers.
 
         Args:
             charm: The parent charm.
+            secret_key: The application secret key, the rate limited path being derived from it.
         """
         super().__init__(charm, RELATION_NAME)
         self._charm = charm
+        self._secret_key = secret_key
         self.traefik_route = TraefikRouteRequirer(
             self._charm, self.model.get_relation(RELATION_NAME), RELATION_NAME, raw=True
         )
+        self._stored.set_default(route_digest="", peer_networks={})
         self._configure_traefik_route()
 
     def _configure_traefik_route(self) -> None:
-        """Build the traefik-route configuration."""
-        if self._charm.unit.is_leader() and self.traefik_route.is_ready():
-            self.traefik_route.submit_to_traefik(self._route_config, static=self._static_config)
+        """Build the traefik-route configuration.
+
+        The configuration is only submitted when it changed since the last submission, since
+        every submission makes Traefik reload its dynamic configuration.
+        """
+        if not self._charm.unit.is_leader() or not self.traefik_route.is_ready():
+            return
+        route_config = self._route_config
+        static_config = self._static_config
+        relation = typing.cast(ops.Relation, self.model.get_relation(RELATION_NAME))
+        # a new relation starts with an empty configuration, so it is part of the digest
+        digest = hashlib.sha256(
+            json.dumps([relation.id, route_config, static_config], sort_keys=True).encode()
+        ).hexdigest()
+        metrics = CharmMetrics(self._charm.unit.get_container(WORKLOAD_CONTAINER_NAME))
+        if digest == self._stored.route_digest:
+            metrics.inc(SUBMISSIONS_METRIC, SUBMISSIONS_DESCRIPTION, {"outcome": "skipped"})
+            return
+        self.traefik_route.submit_to_traefik(route_config, static=static_config)
+        self._stored.route_digest = digest
+        metrics.inc(SUBMISSIONS_METRIC, SUBMISSIONS_DESCRIPTION, {"outcome": "performed"})
+
+    def publish_recon_weight(self, weight: int) -> None:
+        """Publish the weight of the reconciliation traffic of the unit to the leader.
+
+        Args:
+            weight: the weight of the unit, 0 to drain it.
+        """
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        if relation is None:
+            return
+        if relation.data[self._charm.unit].get(RECON_WEIGHT_KEY) != str(weight):
+            relation.data[self._charm.unit][RECON_WEIGHT_KEY] = str(weight)
 
     @property
     def _static_config(self) -> dict[str, dict[str, dict[str, str]]]:
@@ -56,30 +146,248 @@ class TraefikRouteObserver(ops.Object):
 
     @property
     def _route_config(self) -> dict[str, dict[str, object]]:
-        """Return the Traefik route configuration for the Hockeypuck service."""
-        address_list = []
-        address_list.append({"address": f"{socket.getfqdn()}:{RECONCILIATION_PORT}"})
-        secret_storage_relation = typing.cast(
-            ops.Relation, self.model.get_relation("secret-storage")
-        )
-        unit_names = [unit.name for unit in secret_storage_relation.units]
+        """Return the Traefik route configuration for the Hockeypuck service.
+
+        Each unit gets its own service, weighted by the reconciliation readiness the unit
+        published, and health-checked when the recon-health-check-interval is set. The units
+        published with a weight of 0 are drained, unless no unit is ready. The HKP requests are
+        also routed when the hkp-hostname is configured.
+        """
+        peer_relation = typing.cast(ops.Relation, self.model.get_relation(PEER_RELATION_NAME))
+        units = self._unit_fqdns(peer_relation)
+        load_balancer: dict[str, object] = {}
+        if health_check_interval := self._charm.config.get("recon-health-check-interval"):
+            load_balancer["healthCheck"] = {
+                "interval": health_check_interval,
+                "timeout": RECON_HEALTH_CHECK_TIMEOUT,
+            }
+        services: dict[str, object] = {}
+        weights: dict[str, int] = {}
+        for unit, unit_fqdn in units:
+            service = f"hockeypuck-tcp-{unit.name.replace('/', '-')}"
+            services[service] = {
+                "loadBalancer": {
+                    "servers": [{"address": f"{unit_fqdn}:{RECONCILIATION_PORT}"}],
+                    **load_balancer,
+                }
+            }
+            weights[service] = _recon_weight(peer_relation.data[unit])
+        ready = {service: weight for service, weight in weights.items() if weight > 0}
+        weighted: dict[str, object] = {
+            "services": [
+                {"name": service, "weight": weight}
+                for service, weight in (ready or dict.fromkeys(weights, 1)).items()
+            ]
+        }
+        if load_balancer:
+            # propagate the health of the unit services, so that the failing ones are drained
+            weighted["healthCheck"] = {}
+        services["hockeypuck-tcp-service"] = {"weighted": weighted}
+        route_config: dict[str, dict[str, object]] = {
+            "tcp": {
+                "routers": self._tcp_routers,
+                "services": services,
+            }
+        }
+        if hostname := self._charm.config.get("hkp-hostname"):
+            route_config["http"] = self._http_route_config(str(hostname), units)
+        return route_config
+
+    @property
+    def _tcp_routers(self) -> dict[str, object]:
+        """Return the Traefik TCP router of the reconciliation requests.
+
+        Only the external peers and the allowlisted networks can open reconciliation sessions,
+        the connections of the other clients being dropped by Traefik. No router is returned
+        when no client is allowed, closing the reconciliation port to every client.
+        """
+        networks = self._recon_client_networks()
+        if not networks:
+            logger.warning(
+                "Reconciliation closed: no external-peers resolved nor recon-allowed-cidrs set"
+            )
+            return {}
+        return {
+            "hockeypuck-tcp-router": {
+                "rule": " || ".join(f"ClientIP(`{network}`)" for network in networks),
+                "service": "hockeypuck-tcp-service",
+                "entryPoints": ["reconciliation-port"],
+            }
+        }
+
+    def _recon_client_networks(self) -> list[str]:
+        """Get the networks allowed to open reconciliation sessions.
+
+        The addresses of the external peers are resolved at each hook, and completed with the
+        networks of the recon-allowed-cidrs configuration. The last resolved addresses of a peer
+        are kept when its resolution fails, so that a transient DNS failure does not drop it.
+
+        Returns:
+            The allowed networks, in CIDR notation.
+        """
+        networks: list[str] = []
+        peer_networks: dict[str, list[str]] = {}
+        for peer in str(self._charm.config.get("external-peers") or "").splitlines():
+            host = peer.split(",")[0].strip()
+            if not host:
+                continue
+            try:
+                addresses = socket.getaddrinfo(host, RECONCILIATION_PORT, proto=socket.IPPROTO_TCP)
+            except OSError as e:
+                last_networks = typing.cast(dict[str, list[str]], self._stored.peer_networks)
+                peer_networks[host] = list(last_networks.get(host, []))
+                logger.warning(
+                    "Unable to resolve the external peer %s, keeping its last addresses %s: %s",
+                    host,
+                    peer_networks[host],
+                    e,
+                )
+            else:
+                peer_networks[host] = [
+                    # drop the scope of the IPv6 link-local addresses
+                    str(ipaddress.ip_network(str(address[4][0]).split("%", maxsplit=1)[0]))
+                    for address in addresses
+                ]
+            networks.extend(peer_networks[host])
+        # the peers removed from the configuration are forgotten
+        self._stored.peer_networks = peer_networks
+        for cidr in str(self._charm.config.get("recon-allowed-cidrs") or "").split(","):
+            if not cidr.strip():
+                continue
+            try:
+                networks.append(str(ipaddress.ip_network(cidr.strip(), strict=False)))
+            except ValueError:
+                logger.warning("Ignoring the invalid recon-allowed-cidrs network %s", cidr)
+        return list(dict.fromkeys(networks))
+
+    def _unit_fqdns(self, peer_relation: ops.Relation) -> list[tuple[ops.Unit, str]]:
+        """Get the FQDN of each unit of the application.
+
+        Args:
+            peer_relation: the peer relation of the application.
+
+        Returns:
+            The units and their FQDN, starting with the current unit.
+        """
+        units = [(self._charm.unit, socket.getfqdn())]
         # unit fqdn format: <unit-name>.<app-name>-endpoints.<model-name>.svc.cluster.local
-        for unit_name in unit_names:
-            unit_name = unit_name.replace("/", "-")
+        for unit in peer_relation.units:
             unit_fqdn = (
-                f"{unit_name}."
+                f"{unit.name.replace('/', '-')}."
                 f"{self._charm.app.name}-endpoints."
                 f"{self._charm.model.name}.svc"
             )
-            address_list.append({"address": f"{unit_fqdn}:{RECONCILIATION_PORT}"})
-        route_config = {
-            "tcp": {
-                "routers": HOCKEYPUCK_TCP_ROUTER,
-                "services": {
-                    "hockeypuck-tcp-service": {
-                        "loadBalancer": {"servers": address_list},
+            units.append((unit, unit_fqdn))
+        return units
+
+    def _http_route_config(
+        self, hostname: str, units: list[tuple[ops.Unit, str]]
+    ) -> dict[str, object]:
+        """Return the Traefik HTTP route configuration for the HKP requests.
+
+        The /pks/ requests and the static webroot assets get their own routers, both compressed,
+        to a service reusing its connections to each unit, through its lookup cache when
+        integrated with redis. The endpoints with a rate limit configured get their own router,
+        limiting the requests of each client, the rejected ones being counted by the lookup
+        cache of the units.
+
+        Args:
+            hostname: the hostname the HKP requests are routed for.
+            units: the units and their FQDN.
+
+        Returns:
+            The HTTP routers, middlewares, services and servers transports.
+        """
+        routers: dict[str, object] = {}
+        middlewares = dict(HOCKEYPUCK_HTTP_MIDDLEWARES)
+        for suffix, entry_points in HTTP_ENTRY_POINTS.items():
+            routers[f"hockeypuck-hkp-router{suffix}"] = {
+                "rule": f"Host(`{hostname}`) && PathPrefix(`/pks/`)",
+                "priority": HKP_ROUTER_PRIORITY,
+                "service": "hockeypuck-http-service",
+                "middlewares": ["hockeypuck-compress"],
+                **entry_points,
+            }
+            routers[f"hockeypuck-webroot-router{suffix}"] = {
+                "rule": f"Host(`{hostname}`) && !PathPrefix(`{RATE_LIMITED_PATH}`)",
+                # the priority otherwise defaults to the length of the rule, longer than the others
+                "priority": WEBROOT_ROUTER_PRIORITY,
+                "service": "hockeypuck-http-service",
+                "middlewares": ["hockeypuck-compress", "hockeypuck-webroot-cache"],
+                **entry_points,
+            }
+        for endpoint, path in RATE_LIMITED_ENDPOINTS.items():
+            average = int(self._charm.config.get(f"rate-limit-{endpoint}") or 0)
+            if average <= 0:
+                continue
+            middlewares[f"hockeypuck-rate-limit-{endpoint}"] = {
+                "rateLimit": {"average": average, "period": RATE_LIMIT_PERIOD, "burst": average}
+            }
+            endpoint_middlewares = [f"hockeypuck-rate-limit-{endpoint}", "hockeypuck-compress"]
+            if self._secret_key:
+                # the rejected requests get their error page from the lookup cache, counting them
+                token = rate_limited_token(self._secret_key)
+                middlewares[f"hockeypuck-rate-limited-{endpoint}"] = {
+                    "errors": {
+                        "status": ["429"],
+                        "service": "hockeypuck-rate-limited-service",
+                        "query": f"{RATE_LIMITED_PATH}{token}/{endpoint}",
                     }
-                },
+                }
+                endpoint_middlewares.insert(0, f"hockeypuck-rate-limited-{endpoint}")
+            for suffix, entry_points in HTTP_ENTRY_POINTS.items():
+                routers[f"hockeypuck-{endpoint}-router{suffix}"] = {
+                    "rule": f"Host(`{hostname}`) && Path(`{path}`)",
+                    "priority": RATE_LIMIT_ROUTER_PRIORITY,
+                    "service": "hockeypuck-http-service",
+                    "middlewares": endpoint_middlewares,
+                    **entry_points,
+                }
+        services = {
+            service: {
+                "loadBalancer": {
+                    "servers": [{"url": f"http://{unit_fqdn}:{port}"} for _, unit_fqdn in units],
+                    "passHostHeader": True,
+                    "serversTransport": "hockeypuck-http-transport",
+                }
             }
+            for service, port in (
+                ("hockeypuck-http-service", http_serving_port(self.model)),
+                ("hockeypuck-rate-limited-service", LOOKUP_CACHE_PORT),
+            )
         }
-        return route_config
+        return {
+            "routers": routers,
+            "middlewares": middlewares,
+            "services": services,
+            "serversTransports": HOCKEYPUCK_HTTP_TRANSPORT,
+        }
+
+
+def rate_limited_token(secret_key: str) -> str:
+    """Derive the token of the rate limited path from the application secret key.
+
+    The lookup cache derives the same token from the APP_SECRET_KEY environment variable.
+
+    Args:
+        secret_key: the application secret key.
+
+    Returns:
+        The token of the rate limited path.
+    """
+    return hmac.new(secret_key.encode(), RATE_LIMITED_TOKEN_CONTEXT, hashlib.sha256).hexdigest()
+
+
+def _recon_weight(unit_data: typing.Mapping[str, str]) -> int:
+    """Get the weight of the reconciliation traffic published by a unit.
+
+    Args:
+        unit_data: the peer data of the unit.
+
+    Returns:
+        The weight of the unit, the weight of a ready unit if it published none.
+    """
+    try:
+        return max(0, int(unit_data.get(RECON_WEIGHT_KEY, RECON_WEIGHT_READY)))
+    except ValueError:
+        return RECON_WEIGHT_READY
@@ -0,0 +1,67 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Benchmark of the signer backends used for Hockeypuck admin requests."""
+
+import pathlib
+import time
+
+import gnupg
+import pytest
+
+from signers import GPGSigner, Signer, open_openpgp_signer
+
+NUM_SIGNATURES = 50
+PASSPHRASE = "benchmark"
+REQUEST = (
+    "/pks/delete\n-----BEGIN PGP PUBLIC KEY BLOCK-----\nkey\n-----END PGP PUBLIC KEY BLOCK-----"
+)
+
+
+@pytest.fixture(name="gpg", scope="module")
+def gpg_fixture(tmp_path_factory: pytest.TempPathFactory) -> gnupg.GPG:
+    """Create a keyring holding a generated admin key."""
+    gnupghome = tmp_path_factory.mktemp("gnupg")
+    gnupghome.chmod(0o700)
+    gpg = gnupg.GPG(gnupghome=str(gnupghome))
+    key = gpg.gen_key(
+        gpg.gen_key_input(
+            name_real="Admin User", name_email="admin@user.com", passphrase=PASSPHRASE
+        )
+    )
+    gpg.admin_fingerprint = key.fingerprint
+    return gpg
+
+
+def _measure(signer: Signer, gpg: gnupg.GPG, tmp_path: pathlib.Path, name: str) -> float:
+    """Sign NUM_SIGNATURES requests and check the signatures verify with gpg.
+
+    Returns:
+        The number of signatures per second.
+    """
+    start = time.monotonic()
+    signatures = [signer.sign(REQUEST) for _ in range(NUM_SIGNATURES)]
+    rate = NUM_SIGNATURES / (time.monotonic() - start)
+    print(f"{name}: {rate:.1f} signatures/s")
+    signature_file = tmp_path / f"{name}.asc"
+    for signature in (signatures[0], signatures[-1]):
+        signature_file.write_text(signature, encoding="utf-8")
+        assert gpg.verify_data(str(signature_file), REQUEST.encode())
+    return rate
+
+
+def test_signers_throughput(gpg: gnupg.GPG, tmp_path: pathlib.Path) -> None:
+    """
+    arrange: a keyring holding a generated admin key.
+    act: sign the same request with the gpg binary and in-process.
+    assert: all the signatures verify and the in-process signer is faster.
+    """
+    private_key = gpg.export_keys(  # pylint: disable=unexpected-keyword-arg
+        gpg.admin_fingerprint, secret=True, passphrase=PASSPHRASE
+    )
+    gpg_rate = _measure(GPGSigner(gpg, gpg.admin_fingerprint, PASSPHRASE), gpg, tmp_path, "gpg")
+    with open_openpgp_signer(private_key, PASSPHRASE) as signer:
+        assert signer is not None
+        openpgp_rate = _measure(signer, gpg, tmp_path, "in-process")
+
+    assert openpgp_rate > gpg_rate
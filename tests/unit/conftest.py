@@ -0,0 +1,77 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fixtures for the charm unit tests."""
+
+import copy
+import pathlib
+import typing
+from unittest import mock
+
+import paas_charm.utils
+import pytest
+import yaml
+from ops.testing import Harness
+
+import pooled_request_engine
+from charm import HockeypuckK8SCharm
+from tests.unit import fake_keyserver
+
+CHARMCRAFT = yaml.safe_load(
+    (pathlib.Path(__file__).parents[2] / "charmcraft.yaml").read_text(encoding="utf-8")
+)
+
+
+def _expand_go_framework() -> tuple[dict, dict, dict]:
+    """Expand the metadata, config and actions the go-framework extension adds to the charm.
+
+    Returns:
+        The metadata, config and actions of the charm.
+    """
+    charmcraft = copy.deepcopy(CHARMCRAFT)
+    meta = {key: charmcraft[key] for key in ("name", "requires", "containers", "storage")}
+    meta["containers"]["app"]["resource"] = "app-image"
+    meta["resources"] = {"app-image": {"type": "oci-image"}}
+    meta["peers"] = {"secret-storage": {"interface": "secret-storage"}}
+    meta["provides"] = {
+        "metrics-endpoint": {"interface": "prometheus_scrape"},
+        "grafana-dashboard": {"interface": "grafana_dashboard"},
+    }
+    meta["requires"] |= {
+        "logging": {"interface": "loki_push_api"},
+        "ingress": {"interface": "ingress", "limit": 1},
+    }
+    config = {"options": charmcraft["config"]["options"]}
+    config["options"] |= {
+        "app-port": {"type": "int", "default": 8080},
+        "metrics-port": {"type": "int", "default": 8080},
+        "metrics-path": {"type": "string", "default": "/metrics"},
+        "app-secret-key": {"type": "string"},
+    }
+    actions = charmcraft["actions"] | {"rotate-secret-key": {"description": "Rotate the key."}}
+    return meta, config, actions
+
+
+@pytest.fixture(name="harness")
+def harness_fixture(monkeypatch: pytest.MonkeyPatch) -> typing.Iterator[Harness]:
+    """Harness of the charm, with the metadata of the go-framework extension."""
+    meta, config, actions = _expand_go_framework()
+    # paas-charm reads the config metadata from the charm directory
+    monkeypatch.setattr(paas_charm.utils, "config_metadata", lambda _: config)
+    harness = Harness(
+        HockeypuckK8SCharm,
+        meta=yaml.safe_dump(meta),
+        config=yaml.safe_dump(config),
+        actions=yaml.safe_dump(actions),
+    )
+    harness.set_can_connect("app", True)
+    yield harness
+    harness.cleanup()
+
+
+@pytest.fixture(name="session")
+def session_fixture(monkeypatch: pytest.MonkeyPatch) -> mock.MagicMock:
+    """Patch the pooled HTTP session of the engines with the fake keyserver."""
+    session = mock.MagicMock(**{"get.side_effect": fake_keyserver.lookup})
+    monkeypatch.setattr(pooled_request_engine.requests, "Session", mock.Mock(return_value=session))
+    return session
@@ -0,0 +1,41 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fake Hockeypuck HKP interface shared by the unit tests of the pooled request engines."""
+
+from unittest import mock
+
+import requests
+
+PRESENT_FINGERPRINT = "a" * 40
+PUBLIC_KEY = "-----BEGIN PGP PUBLIC KEY BLOCK-----\nkey\n-----END PGP PUBLIC KEY BLOCK-----"
+INDEX = (
+    "info:1:1\n"
+    f"pub:{PRESENT_FINGERPRINT.upper()}:1:4096:1700000000::\n"
+    "uid:Alice%20%3Calice@example.com%3E:1700000000::\n"
+)
+# search failing with an internal server error
+ERROR_SEARCH = "error"
+
+
+def lookup(url: str, params: dict, timeout: int) -> mock.Mock:  # pylint: disable=unused-argument
+    """Fake a Hockeypuck lookup only knowing PRESENT_FINGERPRINT, failing on ERROR_SEARCH.
+
+    Args:
+        url: the URL of the lookup.
+        params: the query parameters of the lookup.
+        timeout: the timeout of the request.
+
+    Returns:
+        The response of the lookup.
+    """
+    response = mock.Mock()
+    if params["search"] == ERROR_SEARCH:
+        response.raise_for_status.side_effect = requests.HTTPError("500")
+    elif params["search"].lower() == f"0x{PRESENT_FINGERPRINT}":
+        response.status_code = 200
+        response.text = INDEX if params["op"] == "index" else PUBLIC_KEY
+        response.content = response.text.encode()
+    else:
+        response.status_code = 404
+    return response
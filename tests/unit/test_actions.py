@@ -0,0 +1,245 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the actions module."""
+
+import json
+from unittest import mock
+
+import pytest
+from ops.testing import Harness
+from requests.exceptions import RequestException
+
+import actions
+import charm
+import traefik_route_observer
+from block_keys_engine import DELETED
+from pooled_request_engine import FAILED
+
+FINGERPRINT = "a" * 40
+OTHER_FINGERPRINT = "b" * 40
+
+
+def test_pbuild_progress_reported_at_interval(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    arrange: a prefix tree build of 1000 keys.
+    act: record progress updates before and after the report interval.
+    assert: the progress, throughput and ETA are only reported once the interval elapsed.
+    """
+    now = mock.Mock(return_value=0.0)
+    monkeypatch.setattr(actions.time, "monotonic", now)
+    event = mock.Mock()
+    metrics = mock.Mock()
+    progress = actions._PbuildProgress(event, metrics, 1000)  # pylint: disable=protected-access
+
+    now.return_value = 10.0
+    progress.update(100)
+    event.log.assert_not_called()
+
+    now.return_value = float(actions.PBUILD_LOG_INTERVAL)
+    progress.update(300)
+
+    event.log.assert_called_once_with("Processed 300/1000 keys, 10 keys/s, ETA 70s.")
+    metrics.set.assert_any_call("hockeypuck_ptree_rebuild_keys_per_second", mock.ANY, 10.0)
+    metrics.set.assert_any_call("hockeypuck_ptree_rebuild_eta_seconds", mock.ANY, 70)
+
+
+def test_workload_drained_while_stopped_by_action(
+    harness: Harness, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a unit in the peer relation, drained by the drain-reconciliation action.
+    act: stop the workload for an action and start it again, then run update-status before and
+        after the workload accepts reconciliation connections.
+    assert: the unit stays drained until the workload accepts reconciliation connections.
+    """
+    relation_id = harness.add_relation("secret-storage", "hockeypuck-k8s")
+    harness.begin()
+    container = mock.Mock()
+    monkeypatch.setattr(harness.charm.unit, "get_container", lambda _: container)
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_has_pending_ptree_removals", lambda _: False)
+    serving = mock.Mock(return_value=True)
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_is_recon_serving", serving)
+    observer = harness.charm.actions_observer
+    harness.run_action("drain-reconciliation")
+    drained_weight = harness.get_relation_data(relation_id, harness.charm.unit.name)[
+        "recon-weight"
+    ]
+
+    event = mock.Mock()
+    observer._stop_workload(event)  # pylint: disable=protected-access
+    observer._start_workload()  # pylint: disable=protected-access
+    started_weight = harness.get_relation_data(relation_id, harness.charm.unit.name)[
+        "recon-weight"
+    ]
+    serving.return_value = False
+    harness.charm.on.update_status.emit()
+    repairing_weight = harness.get_relation_data(relation_id, harness.charm.unit.name)[
+        "recon-weight"
+    ]
+    serving.return_value = True
+    harness.charm.on.update_status.emit()
+
+    assert drained_weight == started_weight == repairing_weight == "0"
+    event.log.assert_not_called()
+    container.pebble.stop_services.assert_called_once_with(services=["go"])
+    container.pebble.start_services.assert_called_once_with(services=["go"])
+    assert harness.get_relation_data(relation_id, harness.charm.unit.name)["recon-weight"] == str(
+        traefik_route_observer.RECON_WEIGHT_READY
+    )
+
+
+def test_stop_workload_warns_when_not_drained(harness: Harness) -> None:
+    """
+    arrange: a unit in the peer relation, not drained beforehand.
+    act: stop the workload for an action.
+    assert: the action warns that the unit was not drained, and the unit is drained.
+    """
+    harness.add_relation("secret-storage", "hockeypuck-k8s")
+    harness.begin()
+    event = mock.Mock()
+
+    with mock.patch.object(harness.charm.unit, "get_container"):
+        harness.charm.actions_observer._stop_workload(event)  # pylint: disable=protected-access
+
+    event.log.assert_called_once()
+    assert harness.charm.is_recon_drained()
+
+
+def test_rebuild_downtime_includes_keyserver_startup(
+    harness: Harness, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a ready unit whose keyserver answers the lookups from its third poll.
+    act: rebuild the prefix tree online.
+    assert: the downtime lasts until the keyserver answers the lookups.
+    """
+    harness.begin()
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "is_ready", lambda _: True)
+    monkeypatch.setattr(actions.Observer, "_stream_pbuild", mock.Mock())
+    container = mock.Mock()
+    monkeypatch.setattr(harness.charm.unit, "get_container", lambda _: container)
+    now = mock.Mock(return_value=0.0)
+    monkeypatch.setattr(actions.time, "monotonic", now)
+    monkeypatch.setattr(
+        actions.time, "sleep", lambda seconds: setattr(now, "return_value", now() + seconds)
+    )
+    get = mock.Mock(side_effect=[RequestException("down"), RequestException("down"), None])
+    monkeypatch.setattr(actions.requests, "get", get)
+
+    output = harness.run_action("rebuild-prefix-tree")
+
+    assert output.results == {"downtime": "2.0s"}
+    assert get.call_args.args == (f"http://127.0.0.1:{actions.HTTP_PORT}/pks/lookup",)
+
+
+@pytest.fixture(name="block_keys_job")
+def block_keys_job_fixture(
+    harness: Harness, monkeypatch: pytest.MonkeyPatch
+) -> dict[str, mock.Mock]:
+    """Mocks of the workload commands and of the engine of the block keys jobs."""
+    harness.begin()
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "publish_blocklist_generation", mock.Mock())
+    mocks = {}
+    for method in ("run_workload_command", "process_block_keys_job", "execute_online_action"):
+        mocks[method] = mock.Mock(name=method)
+        monkeypatch.setattr(harness.charm.actions_observer, f"_{method}", mocks[method])
+    mocks["run"] = mock.Mock(
+        side_effect=lambda fingerprints, **params: _run_block_keys_job(
+            harness.charm.actions_observer, fingerprints, **params
+        )
+    )
+    return mocks
+
+
+def _run_block_keys_job(
+    observer: actions.Observer, fingerprints: list[str], **params: object
+) -> mock.Mock:
+    """Run a block keys job.
+
+    Args:
+        observer: the actions observer.
+        fingerprints: the fingerprints to delete and block.
+        params: the parameters of the action.
+
+    Returns:
+        The event of the action.
+    """
+    event = mock.Mock(params=params)
+    observer._run_block_keys_job(  # pylint: disable=protected-access
+        event, fingerprints, "takedown"
+    )
+    return event
+
+
+def test_block_keys_job_resumes_from_checkpoint(block_keys_job: dict[str, mock.Mock]) -> None:
+    """
+    arrange: a job with a deleted key checkpointed.
+    act: resume the job.
+    assert: only the keys not checkpointed are processed, the checkpointed one being reported.
+    """
+    block_keys_job["run_workload_command"].return_value = json.dumps({FINGERPRINT: "deleted"})
+    block_keys_job["process_block_keys_job"].return_value = {OTHER_FINGERPRINT: DELETED}
+
+    event = block_keys_job["run"]([FINGERPRINT, OTHER_FINGERPRINT], resume=True)
+
+    assert block_keys_job["run_workload_command"].call_args.args[0][-1] == "--progress"
+    assert block_keys_job["process_block_keys_job"].call_args.args[2] == [OTHER_FINGERPRINT]
+    results = event.set_results.call_args.args[0]
+    assert results[FINGERPRINT] == results[OTHER_FINGERPRINT] == actions.JOB_RESULTS["deleted"]
+
+
+def test_block_keys_job_resets_checkpoint(block_keys_job: dict[str, mock.Mock]) -> None:
+    """
+    arrange: a job with a deleted key checkpointed.
+    act: run the job again without resuming it.
+    assert: the checkpoints are reset and every key is processed.
+    """
+    block_keys_job["process_block_keys_job"].return_value = {FINGERPRINT: DELETED}
+
+    block_keys_job["run"]([FINGERPRINT])
+
+    assert block_keys_job["run_workload_command"].call_args.args[0][-1] == "--reset"
+    assert block_keys_job["process_block_keys_job"].call_args.args[2] == [FINGERPRINT]
+
+
+@pytest.mark.parametrize(
+    "outcome, finished",
+    [
+        pytest.param(DELETED, True, id="every key processed"),
+        pytest.param(f"{FAILED}timeout", False, id="failed key"),
+    ],
+)
+def test_block_keys_job_finished_unless_failed(
+    block_keys_job: dict[str, mock.Mock], outcome: str, finished: bool
+) -> None:
+    """
+    arrange: a job processing a deleted key and another key.
+    act: run the job.
+    assert: the job is only marked finished when no key failed, the action failing otherwise.
+    """
+    block_keys_job["process_block_keys_job"].return_value = {
+        FINGERPRINT: DELETED,
+        OTHER_FINGERPRINT: outcome,
+    }
+
+    event = block_keys_job["run"]([FINGERPRINT, OTHER_FINGERPRINT])
+
+    command = block_keys_job["execute_online_action"].call_args.args[1]
+    assert ("--finished" in command) == finished
+    assert event.fail.called != finished
+
+
+def test_block_keys_job_id_stable_across_order(block_keys_job: dict[str, mock.Mock]) -> None:
+    """
+    arrange: the same fingerprints in different orders and cases.
+    act: run the jobs.
+    assert: the jobs share their identifier, so that either one can be resumed.
+    """
+    block_keys_job["process_block_keys_job"].return_value = {}
+
+    first = block_keys_job["run"]([FINGERPRINT, OTHER_FINGERPRINT])
+    second = block_keys_job["run"]([OTHER_FINGERPRINT.upper(), f" {FINGERPRINT}"])
+
+    first_job = first.set_results.call_args.args[0]["job-id"]
+    assert first_job == second.set_results.call_args.args[0]["job-id"]
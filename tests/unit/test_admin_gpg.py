@@ -0,0 +1,171 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the admin GPG module."""
+
+import pathlib
+from unittest import mock
+
+import pytest
+import requests
+
+import admin_gpg
+
+ADMIN_CREDENTIALS = {
+    "adminpublickey": "public key",
+    "adminprivatekey": "private key",
+    "adminfingerprint": "A" * 40,
+    "adminpassword": "password",
+}
+
+
+@pytest.fixture(name="gpg")
+def gpg_fixture(monkeypatch: pytest.MonkeyPatch) -> mock.MagicMock:
+    """Patch the python-gnupg GPG class."""
+    gpg = mock.MagicMock()
+    monkeypatch.setattr(admin_gpg.gnupg, "GPG", mock.Mock(return_value=gpg))
+    return gpg
+
+
+@pytest.fixture(name="model")
+def model_fixture() -> mock.MagicMock:
+    """Mock a Juju model holding the admin secret."""
+    model = mock.MagicMock()
+    model.get_secret.return_value.get_content.return_value = ADMIN_CREDENTIALS
+    return model
+
+
+def test_admin_key_imported_once(
+    gpg: mock.MagicMock, model: mock.MagicMock, tmp_path: pathlib.Path
+) -> None:
+    """
+    arrange: an empty keyring and an admin key stored in the Juju secrets.
+    act: get the admin fingerprint several times.
+    assert: the keys are imported once and the keyring is only checked once.
+    """
+    gpg.list_keys.return_value = []
+    instance = admin_gpg.AdminGPG(model, gnupghome=tmp_path / "gnupg")
+
+    assert instance.admin_fingerprint() == ADMIN_CREDENTIALS["adminfingerprint"]
+    assert instance.admin_fingerprint() == ADMIN_CREDENTIALS["adminfingerprint"]
+
+    gpg.list_keys.assert_called_once_with(
+        secret=True, keys=[ADMIN_CREDENTIALS["adminfingerprint"]]
+    )
+    assert gpg.import_keys.call_count == 2
+    assert (tmp_path / "gnupg").is_dir()
+
+
+def test_admin_key_already_in_keyring(
+    gpg: mock.MagicMock, model: mock.MagicMock, tmp_path: pathlib.Path
+) -> None:
+    """
+    arrange: a keyring already holding the admin key.
+    act: get the admin fingerprint.
+    assert: the keys are not imported again.
+    """
+    gpg.list_keys.return_value = [{"fingerprint": ADMIN_CREDENTIALS["adminfingerprint"]}]
+    instance = admin_gpg.AdminGPG(model, gnupghome=tmp_path)
+
+    assert instance.admin_fingerprint() == ADMIN_CREDENTIALS["adminfingerprint"]
+
+    gpg.import_keys.assert_not_called()
+
+
+def test_get_admin_gpg_shared_per_model(
+    gpg: mock.MagicMock,  # pylint: disable=unused-argument
+    model: mock.MagicMock,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+) -> None:
+    """
+    arrange: a Juju model.
+    act: get the AdminGPG instance twice for the same model and once for another model.
+    assert: the same instance is returned for the same model only.
+    """
+    monkeypatch.setattr(admin_gpg, "ADMIN_GNUPG_HOME", tmp_path)
+
+    instance = admin_gpg.get_admin_gpg(model)
+
+    assert admin_gpg.get_admin_gpg(model) is instance
+    assert admin_gpg.get_admin_gpg(mock.MagicMock()) is not instance
+
+
+def test_push_admin_key_already_published(
+    gpg: mock.MagicMock,  # pylint: disable=unused-argument
+    model: mock.MagicMock,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+) -> None:
+    """
+    arrange: a keyserver already listing the admin key.
+    act: push the admin key.
+    assert: the key is not pushed again and the hook does not wait.
+    """
+    lookup = mock.Mock(status_code=200, text=f"info:1:1\npub:{'a' * 40}:1:4096:0::\n")
+    monkeypatch.setattr(admin_gpg.requests, "get", mock.Mock(return_value=lookup))
+    post = mock.Mock()
+    monkeypatch.setattr(admin_gpg.requests, "post", post)
+    sleep = mock.Mock()
+    monkeypatch.setattr(admin_gpg.time, "sleep", sleep)
+
+    admin_gpg.AdminGPG(model, gnupghome=tmp_path).push_admin_key()
+
+    post.assert_not_called()
+    sleep.assert_not_called()
+
+
+def test_push_admin_key_waits_for_keyserver(
+    gpg: mock.MagicMock,  # pylint: disable=unused-argument
+    model: mock.MagicMock,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+) -> None:
+    """
+    arrange: a keyserver only reachable on the third attempt and missing the admin key.
+    act: push the admin key.
+    assert: the lookups are retried with an exponential backoff and the key is pushed once.
+    """
+    monkeypatch.setattr(
+        admin_gpg.requests,
+        "get",
+        mock.Mock(
+            side_effect=[
+                requests.ConnectionError("refused"),
+                requests.ConnectionError("refused"),
+                mock.Mock(status_code=404),
+            ]
+        ),
+    )
+    post = mock.Mock()
+    monkeypatch.setattr(admin_gpg.requests, "post", post)
+    sleep = mock.Mock()
+    monkeypatch.setattr(admin_gpg.time, "sleep", sleep)
+
+    admin_gpg.AdminGPG(model, gnupghome=tmp_path).push_admin_key()
+
+    post.assert_called_once()
+    assert post.call_args.kwargs["data"] == {"keytext": ADMIN_CREDENTIALS["adminpublickey"]}
+    assert [call.args[0] for call in sleep.call_args_list] == [
+        admin_gpg.PUSH_INITIAL_DELAY,
+        admin_gpg.PUSH_INITIAL_DELAY * 2,
+    ]
+
+
+def test_admin_key_created_by_leader_only(
+    gpg: mock.MagicMock, model: mock.MagicMock, tmp_path: pathlib.Path
+) -> None:
+    """
+    arrange: no admin key in the Juju secrets and a unit which is not the leader.
+    act: get the admin fingerprint.
+    assert: the unit waits for the leader instead of generating a key.
+    """
+    model.get_secret.side_effect = admin_gpg.ops.SecretNotFoundError()
+    model.unit.is_leader.return_value = False
+    instance = admin_gpg.AdminGPG(model, gnupghome=tmp_path)
+
+    with pytest.raises(admin_gpg.AdminKeyNotReadyError):
+        instance.admin_fingerprint()
+
+    gpg.gen_key.assert_not_called()
+    model.app.add_secret.assert_not_called()
@@ -0,0 +1,236 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the block keys script."""
+
+import argparse
+import io
+import json
+import pathlib
+from unittest import mock
+
+import block_keys
+import pytest
+
+FINGERPRINT = "a" * 40
+OTHER_FINGERPRINT = "b" * 40
+
+
+@pytest.fixture(name="cursor")
+def cursor_fixture(monkeypatch: pytest.MonkeyPatch) -> mock.MagicMock:
+    """Cursor of a mocked database connection, rendering the mogrified values as text."""
+    cursor = mock.MagicMock()
+    cursor.mogrify.side_effect = lambda query, params: (
+        query % tuple(f"'{param}'" for param in params)
+    ).encode()
+    connection = mock.MagicMock()
+    connection.__enter__.return_value = connection
+    connection.cursor.return_value.__enter__.return_value = cursor
+    monkeypatch.setattr(block_keys, "_get_db_connection", mock.Mock(return_value=connection))
+    return cursor
+
+
+def _job_args(**kwargs: object) -> argparse.Namespace:
+    """Build the command line arguments of a block keys job.
+
+    Args:
+        kwargs: the arguments differing from the defaults.
+
+    Returns:
+        The parsed command line arguments.
+    """
+    defaults: dict[str, object] = {
+        "job": "job",
+        "comment": "takedown",
+        "checkpoint": False,
+        "progress": False,
+        "reset": False,
+        "finished": False,
+    }
+    return argparse.Namespace(**(defaults | kwargs))
+
+
+def test_job_checkpoint_records_outcomes(
+    cursor: mock.MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: the outcomes of a checkpoint interval on the standard input.
+    act: checkpoint the job.
+    assert: the outcomes are upserted for the job and the deleted keys invalidated.
+    """
+    outcomes = {FINGERPRINT: "deleted", OTHER_FINGERPRINT: "unavailable"}
+    monkeypatch.setattr(block_keys.sys, "stdin", io.StringIO(json.dumps(outcomes)))
+    invalidate = mock.Mock()
+    monkeypatch.setattr(block_keys, "_invalidate_lookup_cache", invalidate)
+
+    block_keys._run_job(_job_args(checkpoint=True))  # pylint: disable=protected-access
+
+    query = cursor.execute.call_args.args[0]
+    assert query.startswith("INSERT INTO block_keys_progress (job_id, fingerprint, outcome)")
+    assert f"('job', LOWER('{FINGERPRINT}'), 'deleted')" in query
+    assert "ON CONFLICT (job_id, fingerprint) DO UPDATE" in query
+    invalidate.assert_called_once_with([FINGERPRINT])
+
+
+def test_job_progress_prints_outcomes(
+    cursor: mock.MagicMock, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """
+    arrange: a job with a stored checkpoint.
+    act: get the progress of the job.
+    assert: the stored outcomes are printed as JSON, to resume the job from.
+    """
+    cursor.fetchall.return_value = [(FINGERPRINT, "deleted")]
+
+    block_keys._run_job(_job_args(progress=True))  # pylint: disable=protected-access
+
+    cursor.execute.assert_called_once_with(
+        "SELECT fingerprint, outcome FROM block_keys_progress WHERE job_id = %s;", ("job",)
+    )
+    assert json.loads(capsys.readouterr().out) == {FINGERPRINT: "deleted"}
+
+
+def test_job_reset_forgets_outcomes(cursor: mock.MagicMock) -> None:
+    """
+    arrange: a job with a stored checkpoint.
+    act: reset the job.
+    assert: only the checkpoints of the job are deleted.
+    """
+    block_keys._run_job(_job_args(reset=True))  # pylint: disable=protected-access
+
+    cursor.execute.assert_called_once_with(
+        "DELETE FROM block_keys_progress WHERE job_id = %s;", ("job",)
+    )
+
+
+@pytest.mark.parametrize(
+    "finished, pruned_job",
+    [
+        pytest.param(True, "job", id="finished"),
+        pytest.param(False, None, id="unfinished"),
+    ],
+)
+def test_job_blocks_deleted_keys(
+    cursor: mock.MagicMock, finished: bool, pruned_job: str | None
+) -> None:
+    """
+    arrange: a job with a deleted key and an unavailable key checkpointed.
+    act: block the keys of the job.
+    assert: only the deleted key is blocked, and the checkpoints of the job are only pruned
+        once it finished.
+    """
+    cursor.fetchall.return_value = [(FINGERPRINT, "deleted"), (OTHER_FINGERPRINT, "unavailable")]
+
+    block_keys._run_job(_job_args(finished=finished))  # pylint: disable=protected-access
+
+    insert, prune = cursor.execute.call_args_list[1:]
+    assert f"(LOWER('{FINGERPRINT}'), 'takedown')" in insert.args[0]
+    assert OTHER_FINGERPRINT not in insert.args[0]
+    assert prune.args[1] == (pruned_job, block_keys.JOB_EXPIRY)
+
+
+def test_delete_keys_from_tables_in_order(cursor: mock.MagicMock) -> None:
+    """
+    arrange: a database with the userids table, holding one of two keys to delete.
+    act: delete the keys.
+    assert: the subkeys, userids and keys rows are deleted in order by reversed fingerprint,
+        and only the deleted key is blocked.
+    """
+    cursor.fetchone.return_value = (True,)
+    cursor.fetchall.return_value = [(FINGERPRINT, "0123456789abcdef0123456789abcdef")]
+    rfingerprints = [FINGERPRINT[::-1], OTHER_FINGERPRINT[::-1]]
+
+    deleted = block_keys._delete_keys_from_tables(  # pylint: disable=protected-access
+        cursor, [FINGERPRINT, OTHER_FINGERPRINT.upper()], "takedown"
+    )
+
+    statements = [call.args for call in cursor.execute.call_args_list]
+    assert statements[:4] == [
+        ("DELETE FROM subkeys WHERE rfingerprint = ANY(%s);", (rfingerprints,)),
+        ("SELECT TO_REGCLASS('userids') IS NOT NULL;",),
+        ("DELETE FROM userids WHERE rfingerprint = ANY(%s);", (rfingerprints,)),
+        (
+            "DELETE FROM keys WHERE rfingerprint = ANY(%s) "
+            "RETURNING REVERSE(rfingerprint), md5;",
+            (rfingerprints,),
+        ),
+    ]
+    assert statements[4][0].startswith("INSERT INTO deleted_keys")
+    assert OTHER_FINGERPRINT not in statements[4][0]
+    assert deleted == {FINGERPRINT: "0123456789abcdef0123456789abcdef"}
+
+
+def test_delete_keys_without_userids_table(cursor: mock.MagicMock) -> None:
+    """
+    arrange: a database without the userids table, not holding the key to delete.
+    act: delete the key.
+    assert: the userids table is skipped and no key is blocked.
+    """
+    cursor.fetchone.return_value = (False,)
+    cursor.fetchall.return_value = []
+
+    deleted = block_keys._delete_keys_from_tables(  # pylint: disable=protected-access
+        cursor, [FINGERPRINT], "takedown"
+    )
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert len(statements) == 3
+    assert not any("userids WHERE" in statement for statement in statements)
+    assert not deleted
+
+
+def test_block_delete_records_ptree_removals(
+    cursor: mock.MagicMock,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """
+    arrange: a database holding a key to delete, with digests already pending removal.
+    act: delete and block the key.
+    assert: the digest of the deleted key is appended to the prefix tree removals file.
+    """
+    removals = tmp_path / "ptree-removals"
+    removals.write_text("fedcba9876543210fedcba9876543210\n", encoding="utf-8")
+    monkeypatch.setattr(block_keys, "PTREE_REMOVALS_FILE", str(removals))
+    monkeypatch.setattr(block_keys, "_invalidate_lookup_cache", mock.Mock())
+    cursor.fetchone.return_value = (True,)
+    cursor.fetchall.return_value = [(FINGERPRINT, "0123456789abcdef0123456789abcdef")]
+    args = argparse.Namespace(fingerprints=FINGERPRINT, comment="takedown", delete=True)
+
+    block_keys._block(args)  # pylint: disable=protected-access
+
+    assert removals.read_text(encoding="utf-8").splitlines() == [
+        "fedcba9876543210fedcba9876543210",
+        "0123456789abcdef0123456789abcdef",
+    ]
+    assert json.loads(capsys.readouterr().out) == {"deleted": [FINGERPRINT]}
+
+
+def test_copy_fingerprints_to_table(cursor: mock.MagicMock) -> None:
+    """
+    arrange: a list of fingerprints with duplicates, uppercase and prefixed fingerprints, a
+        comment and a malformed line.
+    act: copy the fingerprints to the deleted_keys table.
+    assert: the lines are streamed as they are into the staging table, then merged as distinct
+        lowercase fingerprints without prefix, the malformed lines being counted as skipped.
+    """
+    lines = f"{FINGERPRINT}\n0x{FINGERPRINT.upper()}\n{OTHER_FINGERPRINT}\n# comment\nnot-hex\n"
+    copied: list[tuple[str, str]] = []
+    cursor.copy_expert.side_effect = lambda query, stream: copied.append((query, stream.read()))
+    cursor.fetchone.side_effect = [(5,), (2,)]
+    cursor.rowcount = 2
+
+    summary = block_keys._copy_fingerprints_to_table(  # pylint: disable=protected-access
+        cursor, io.StringIO(lines), "takedown"
+    )
+
+    assert copied == [("COPY blocklist_import (fingerprint) FROM STDIN;", lines)]
+    merge = cursor.execute.call_args_list[2].args
+    assert merge[0].startswith("INSERT INTO deleted_keys (fingerprint, comment) SELECT DISTINCT")
+    assert "REGEXP_REPLACE(LOWER(TRIM(fingerprint)), '^0x', '')" in merge[0]
+    assert "WHERE fingerprint ~ '^([0-9a-f]{40}|[0-9a-f]{64})$'" in merge[0]
+    assert merge[0].endswith("ON CONFLICT DO NOTHING;")
+    assert merge[1] == ("takedown",)
+    assert cursor.execute.call_args_list[-1].args == ("DROP TABLE blocklist_import;",)
+    assert summary == {"read": 5, "blocked": 2, "skipped": 2}
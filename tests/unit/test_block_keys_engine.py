@@ -0,0 +1,76 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the block keys engine."""
+
+from unittest import mock
+
+import requests
+
+import block_keys_engine
+import pooled_request_engine
+from tests.unit.fake_keyserver import PRESENT_FINGERPRINT, PUBLIC_KEY
+
+ABSENT_FINGERPRINT = "b" * 64
+
+
+def test_run_reports_outcome_per_fingerprint(session: mock.MagicMock) -> None:
+    """
+    arrange: a keyserver containing a single key.
+    act: run the engine against a present, an absent and an invalid fingerprint.
+    assert: only the present key is signed and deleted and each fingerprint gets its outcome.
+    """
+    admin_gpg = mock.Mock()
+    admin_gpg.generate_signature.return_value = "signature"
+    deleted: list[str] = []
+    engine = block_keys_engine.BlockKeysEngine(
+        admin_gpg, base_url="http://127.0.0.1:11371", max_workers=4, on_deleted=deleted.append
+    )
+
+    result = engine.run([PRESENT_FINGERPRINT.upper(), ABSENT_FINGERPRINT, "0xinvalid"])
+
+    assert result == {
+        PRESENT_FINGERPRINT: block_keys_engine.DELETED,
+        ABSENT_FINGERPRINT: block_keys_engine.FINGERPRINT_UNAVAILABLE,
+        "0xinvalid": block_keys_engine.INVALID_FINGERPRINT,
+    }
+    assert deleted == [PRESENT_FINGERPRINT]
+    admin_gpg.generate_signature.assert_called_once_with(request="/pks/delete\n" + PUBLIC_KEY)
+    session.post.assert_called_once_with(
+        "http://127.0.0.1:11371/pks/delete",
+        timeout=pooled_request_engine.REQUEST_TIMEOUT,
+        data={"keytext": "/pks/delete\n" + PUBLIC_KEY, "keysig": "signature"},
+    )
+
+
+def test_run_reports_request_errors(session: mock.MagicMock) -> None:
+    """
+    arrange: a keyserver failing the delete requests.
+    act: run the engine against a present and an absent fingerprint.
+    assert: the present fingerprint is reported as failed and the absent one is processed.
+    """
+    session.post.return_value.raise_for_status.side_effect = requests.HTTPError("500")
+    engine = block_keys_engine.BlockKeysEngine(mock.Mock(), base_url="http://127.0.0.1:11371")
+
+    result = engine.run([PRESENT_FINGERPRINT, ABSENT_FINGERPRINT])
+
+    assert result == {
+        PRESENT_FINGERPRINT: f"{pooled_request_engine.FAILED}500",
+        ABSENT_FINGERPRINT: block_keys_engine.FINGERPRINT_UNAVAILABLE,
+    }
+
+
+def test_run_keeps_session_open_until_closed(session: mock.MagicMock) -> None:
+    """
+    arrange: an engine used as a context manager.
+    act: run the engine twice, then exit the context.
+    assert: the pooled session is only closed on exit.
+    """
+    with block_keys_engine.BlockKeysEngine(
+        mock.Mock(), base_url="http://127.0.0.1:11371"
+    ) as engine:
+        engine.run([ABSENT_FINGERPRINT])
+        engine.run([ABSENT_FINGERPRINT])
+        session.close.assert_not_called()
+
+    session.close.assert_called_once_with()
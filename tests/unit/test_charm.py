@@ -0,0 +1,252 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the charm."""
+
+import json
+from unittest import mock
+
+import ops
+import paas_charm.go
+import pytest
+from ops.testing import Harness
+from requests.exceptions import RequestException
+
+import charm
+
+
+@pytest.fixture(name="parent_restart")
+def parent_restart_fixture(harness: Harness, monkeypatch: pytest.MonkeyPatch) -> mock.Mock:
+    """Begin the harness with a ready charm, faking the restart of the parent charm."""
+    harness.begin()
+    parent_restart = mock.Mock(
+        side_effect=lambda _: setattr(harness.charm.unit, "status", ops.ActiveStatus())
+    )
+    monkeypatch.setattr(paas_charm.go.Charm, "restart", parent_restart)
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "is_ready", lambda _: True)
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_is_workload_running", lambda _: True)
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_prepare_data_storage", lambda _: None)
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_workload_hash", lambda _: "new")
+    monkeypatch.setattr(charm, "get_admin_gpg", mock.Mock())
+    return parent_restart
+
+
+def test_restart_skipped_when_environment_unchanged(
+    harness: Harness, parent_restart: mock.Mock
+) -> None:
+    """
+    arrange: a running workload restarted with the current environment.
+    act: restart the charm.
+    assert: the workload is not restarted.
+    """
+    harness.charm._stored.workload_hash = "new"  # pylint: disable=protected-access
+
+    harness.charm.restart()
+
+    parent_restart.assert_not_called()
+
+
+def test_restart_skipped_still_exposes_workload(
+    harness: Harness, parent_restart: mock.Mock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a running workload restarted with the current environment, in maintenance.
+    act: restart the charm.
+    assert: the ingress and the ports are still provided and the unit set active.
+    """
+    harness.charm._stored.workload_hash = "new"  # pylint: disable=protected-access
+    harness.charm.unit.status = ops.MaintenanceStatus("Preparing service for restart")
+    provide_ingress_requirements = mock.Mock()
+    monkeypatch.setattr(
+        harness.charm._ingress,  # pylint: disable=protected-access
+        "provide_ingress_requirements",
+        provide_ingress_requirements,
+    )
+
+    harness.charm.restart()
+
+    parent_restart.assert_not_called()
+    provide_ingress_requirements.assert_called_once_with(port=11371)
+    assert harness.charm.unit.opened_ports() == {
+        ops.Port(protocol="tcp", port=11371),
+        ops.Port(protocol="tcp", port=11370),
+    }
+    assert isinstance(harness.charm.unit.status, ops.ActiveStatus)
+
+
+def test_workload_hash_ignores_route_options(
+    harness: Harness, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a workload environment.
+    act: change an option only read by the traefik-route, then the reconciliation peers.
+    assert: only the change of the reconciliation peers changes the hash of the environment.
+    """
+    harness.begin()
+    environment = {"APP_EXTERNAL_PEERS": "", "APP_HKP_HOSTNAME": "", "APP_RATE_LIMIT_ADD": "0"}
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_gen_environment", lambda _: environment)
+    initial_hash = harness.charm._workload_hash()  # pylint: disable=protected-access
+
+    environment |= {"APP_HKP_HOSTNAME": "keyserver.example.com", "APP_RATE_LIMIT_ADD": "30"}
+    route_hash = harness.charm._workload_hash()  # pylint: disable=protected-access
+    environment["APP_EXTERNAL_PEERS"] = "keyserver.example.com,11371,11370"
+
+    assert route_hash == initial_hash
+    assert harness.charm._workload_hash() != initial_hash  # pylint: disable=protected-access
+
+
+def test_restart_performed_when_environment_changed(
+    harness: Harness, parent_restart: mock.Mock
+) -> None:
+    """
+    arrange: a running workload restarted with a previous environment.
+    act: restart the charm.
+    assert: the workload is restarted and the new environment recorded.
+    """
+    harness.charm._stored.workload_hash = "old"  # pylint: disable=protected-access
+
+    harness.charm.restart()
+
+    parent_restart.assert_called_once_with(False)
+    assert harness.charm._stored.workload_hash == "new"  # pylint: disable=protected-access
+
+
+def test_restart_environment_not_recorded_when_admin_key_push_fails(
+    harness: Harness, parent_restart: mock.Mock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a running workload restarted with a previous environment, failing to get the
+        admin key pushed.
+    act: restart the charm.
+    assert: the workload is restarted without recording the new environment, so that the
+        next hook retries the restart.
+    """
+    harness.charm._stored.workload_hash = "old"  # pylint: disable=protected-access
+    admin_gpg = mock.Mock(**{"push_admin_key.side_effect": RequestException("down")})
+    monkeypatch.setattr(charm, "get_admin_gpg", mock.Mock(return_value=admin_gpg))
+
+    harness.charm.restart()
+
+    parent_restart.assert_called_once_with(False)
+    assert harness.charm._stored.workload_hash == "old"  # pylint: disable=protected-access
+
+
+def test_publish_blocklist_generation(harness: Harness) -> None:
+    """
+    arrange: a unit in the peer relation.
+    act: publish a blocklist change twice.
+    assert: the blocklist generation of the unit is bumped in the peer relation data, and the
+        unit is recorded as synchronised with it.
+    """
+    relation_id = harness.add_relation("secret-storage", "hockeypuck-k8s")
+    harness.begin()
+
+    harness.charm.publish_blocklist_generation()
+    harness.charm.publish_blocklist_generation()
+
+    unit_data = harness.get_relation_data(relation_id, harness.charm.unit.name)
+    assert unit_data["blocklist-generation"] == "2"
+    assert json.loads(unit_data["blocklist-synced"]) == {"hockeypuck-k8s/0": 2}
+
+
+def test_blocklist_generation_changed_syncs_workload(
+    harness: Harness, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a running workload and another unit in the peer relation.
+    act: a new unit joins without generation, then the other unit bumps its blocklist
+        generation, then the relation changes without it.
+    assert: the blocklist is synchronised and the workload service restarted once, the
+        synchronised generations being published.
+    """
+    relation_id = harness.add_relation("secret-storage", "hockeypuck-k8s")
+    harness.add_relation_unit(relation_id, "hockeypuck-k8s/1")
+    harness.begin()
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_is_workload_running", lambda _: True)
+    restart = mock.Mock()
+    monkeypatch.setattr(ops.Container, "restart", restart)
+    exec_ = mock.Mock()
+    monkeypatch.setattr(ops.Container, "exec", exec_)
+
+    harness.add_relation_unit(relation_id, "hockeypuck-k8s/2")
+    harness.update_relation_data(relation_id, "hockeypuck-k8s/1", {"blocklist-generation": "1"})
+    harness.update_relation_data(relation_id, "hockeypuck-k8s/1", {"other": "value"})
+
+    exec_.assert_called_once_with(charm.actions.SYNC_BLOCKLIST_COMMAND, service_context="go")
+    restart.assert_called_once_with("go")
+    unit_data = harness.get_relation_data(relation_id, harness.charm.unit.name)
+    assert json.loads(unit_data["blocklist-synced"]) == {"hockeypuck-k8s/1": 1}
+
+
+@pytest.mark.parametrize(
+    "synced, expected",
+    [
+        pytest.param(None, False, id="never synchronised"),
+        pytest.param('{"hockeypuck-k8s/1": 1}', False, id="older generation"),
+        pytest.param('{"hockeypuck-k8s/1": 2, "hockeypuck-k8s/2": 1}', True, id="synchronised"),
+        pytest.param('{"hockeypuck-k8s/1": 3, "hockeypuck-k8s/3": 1}', True, id="departed unit"),
+    ],
+)
+def test_is_blocklist_synced(synced: str | None, expected: bool) -> None:
+    """
+    arrange: the blocklist generations a unit synchronised.
+    act: check them against the current generations of the units.
+    assert: the unit is synchronised if no current generation is newer.
+    """
+    generations = {"hockeypuck-k8s/1": 2}
+
+    assert (
+        charm._is_blocklist_synced(synced, generations)  # pylint: disable=protected-access
+        == expected
+    )
+
+
+def test_blocklist_sync_waits_for_lower_units(
+    harness: Harness, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a running workload, the unit coming after another unit not synchronised yet.
+    act: the other unit bumps its blocklist generation, then a lower unit synchronises it.
+    assert: the workload service is only restarted once the lower unit published its
+        synchronised generations.
+    """
+    relation_id = harness.add_relation("secret-storage", "hockeypuck-k8s")
+    harness.add_relation_unit(relation_id, "hockeypuck-k8s/1")
+    harness.add_relation_unit(relation_id, "hockeypuck-k8s/2")
+    harness.update_relation_data(relation_id, "hockeypuck-k8s/1", {"blocklist-synced": "{}"})
+    harness.begin()
+    monkeypatch.setattr(charm.HockeypuckK8SCharm, "_is_workload_running", lambda _: True)
+    monkeypatch.setattr(
+        charm, "_unit_number", lambda unit: 3 if unit is harness.charm.unit else int(unit.name[-1])
+    )
+    restart = mock.Mock()
+    monkeypatch.setattr(ops.Container, "restart", restart)
+    monkeypatch.setattr(ops.Container, "exec", mock.Mock())
+
+    harness.update_relation_data(relation_id, "hockeypuck-k8s/2", {"blocklist-generation": "1"})
+    restart.assert_not_called()
+    harness.update_relation_data(
+        relation_id, "hockeypuck-k8s/1", {"blocklist-synced": '{"hockeypuck-k8s/2": 1}'}
+    )
+
+    restart.assert_called_once_with("go")
+
+
+@pytest.mark.parametrize(
+    "endpoint, expected",
+    [
+        pytest.param("10.0.0.1:5433", ("10.0.0.1", "5433"), id="host and port"),
+        pytest.param("replica.local", ("replica.local", "5432"), id="host only"),
+        pytest.param("replica.local:", ("replica.local", "5432"), id="empty port"),
+        pytest.param("[2001:db8::1]:5433", ("2001:db8::1", "5433"), id="IPv6 and port"),
+        pytest.param("[2001:db8::1]", ("2001:db8::1", "5432"), id="bracketed IPv6 only"),
+        pytest.param("2001:db8::1", ("2001:db8::1", "5432"), id="bare IPv6"),
+    ],
+)
+def test_parse_endpoint(endpoint: str, expected: tuple[str, str]) -> None:
+    """
+    arrange: a read-only endpoint of the postgresql relation.
+    act: parse the endpoint.
+    assert: the hostname is kept and the port defaults to the PostgreSQL one.
+    """
+    assert charm._parse_endpoint(endpoint) == expected  # pylint: disable=protected-access
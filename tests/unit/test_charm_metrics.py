@@ -0,0 +1,49 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the charm metrics module."""
+
+import io
+from unittest import mock
+
+import ops
+
+import charm_metrics
+
+
+def test_metrics_rendered_in_prometheus_format() -> None:
+    """
+    arrange: a workload container without metrics.
+    act: increment a counter twice with different labels and set a gauge.
+    assert: the samples are accumulated and rendered in the Prometheus text format, with a
+        single write per update.
+    """
+    files: dict[str, str] = {}
+    container = mock.MagicMock()
+
+    def pull(path: str) -> io.StringIO:
+        """Fake pulling a file from the workload container."""
+        if path not in files:
+            raise ops.pebble.PathError("not-found", path)
+        return io.StringIO(files[path])
+
+    container.pull.side_effect = pull
+    container.push.side_effect = lambda path, source, make_dirs: files.__setitem__(path, source)
+    metrics = charm_metrics.CharmMetrics(container)
+
+    metrics.inc("restarts_total", "Restarts.", {"outcome": "skipped"})
+    metrics.inc("restarts_total", "Restarts.", {"outcome": "skipped"})
+    metrics.inc("restarts_total", "Restarts.", {"outcome": "performed"})
+    metrics.set("progress", "Progress.", 0.5)
+
+    assert container.push.call_count == 4
+    _, rendered = files[f"{charm_metrics.METRICS_DIR}/charm.prom"].split("\n", 1)
+    assert rendered == (
+        "# HELP progress Progress.\n"
+        "# TYPE progress gauge\n"
+        "progress 0.5\n"
+        "# HELP restarts_total Restarts.\n"
+        "# TYPE restarts_total counter\n"
+        'restarts_total{outcome="performed"} 1\n'
+        'restarts_total{outcome="skipped"} 2\n'
+    )
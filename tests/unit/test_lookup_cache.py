@@ -0,0 +1,293 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the lookup cache proxy."""
+
+import http.client
+import threading
+import typing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import fakeredis
+import lookup_cache
+import pytest
+
+
+class FakeHockeypuck(BaseHTTPRequestHandler):
+    """Backend recording the requests it received."""
+
+    protocol_version = "HTTP/1.1"
+    requests: list[tuple[str, dict[str, str], bytes]] = []
+
+    def _handle(self) -> None:
+        """Record the request and answer a fixed body."""
+        length = int(self.headers.get("Content-Length") or 0)
+        self.requests.append((self.command, dict(self.headers.items()), self.rfile.read(length)))
+        body = b"pub:0123456789abcdef\n"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_GET = do_HEAD = do_POST = _handle  # noqa: N815
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+        """Do not log the requests.
+
+        Args:
+            format: The message format.
+            args: The message arguments.
+        """
+
+
+def _serve(handler: type[BaseHTTPRequestHandler]) -> ThreadingHTTPServer:
+    """Serve a handler on an ephemeral port in a background thread.
+
+    Args:
+        handler: The request handler.
+
+    Returns:
+        The server.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture(name="proxy")
+def proxy_fixture(monkeypatch: pytest.MonkeyPatch) -> typing.Iterator[http.client.HTTPConnection]:
+    """Connection to a proxy without caches in front of a fake Hockeypuck."""
+    FakeHockeypuck.requests = []
+    backend = _serve(FakeHockeypuck)
+    monkeypatch.setattr(lookup_cache, "BACKEND_PORT", backend.server_address[1])
+    monkeypatch.setattr(lookup_cache.ProxyHandler, "_local", threading.local())
+    proxy = _serve(lookup_cache.ProxyHandler)
+    connection = http.client.HTTPConnection("127.0.0.1", proxy.server_address[1], timeout=5)
+    yield connection
+    connection.close()
+    proxy.shutdown()
+    backend.shutdown()
+
+
+def test_normalize_lookup_equivalent_queries() -> None:
+    """
+    arrange: lookups differing by case, spacing and order of the options.
+    act: normalize the lookups.
+    assert: the lookups share their cache key, tagged with the searched hexadecimal ID.
+    """
+    first = lookup_cache.normalize_lookup("op=get&search=0xABCDEF0123456789&options=mr,nm")
+    second = lookup_cache.normalize_lookup(
+        "search=0xabcdef0123456789&options=nm&options=mr&op=GET"
+    )
+
+    assert first is not None
+    assert first == second
+    assert first[1] == "abcdef0123456789"
+
+
+def test_normalize_lookup_text_search() -> None:
+    """
+    arrange: text lookups differing by spacing.
+    act: normalize the lookups.
+    assert: the lookups share their cache key, without hexadecimal ID.
+    """
+    first = lookup_cache.normalize_lookup("op=index&search=Alice%20%20Example")
+    second = lookup_cache.normalize_lookup("op=index&search=alice+example")
+
+    assert first is not None
+    assert first == second
+    assert first[1] is None
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        pytest.param("op=stats", id="uncached op"),
+        pytest.param("op=get&search=", id="empty search"),
+        pytest.param("search=0x12345678", id="missing op"),
+    ],
+)
+def test_normalize_lookup_not_cached(query: str) -> None:
+    """
+    arrange: a lookup that is not cached.
+    act: normalize the lookup.
+    assert: no cache key is returned.
+    """
+    assert lookup_cache.normalize_lookup(query) is None
+
+
+def test_invalidation_tags() -> None:
+    """
+    arrange: a fingerprint with the 0x prefix.
+    act: get the invalidation tags of the fingerprint.
+    assert: the searches by short key ID, long key ID and fingerprint are tagged.
+    """
+    fingerprint = "0x2CF6A6A3B93C138FD51037564415DC328A6C8E00"
+
+    tags = lookup_cache.invalidation_tags(fingerprint)
+
+    assert tags == [
+        f"{lookup_cache.TAG_PREFIX}8a6c8e00",
+        f"{lookup_cache.TAG_PREFIX}4415dc328a6c8e00",
+        f"{lookup_cache.TAG_PREFIX}{fingerprint[2:].lower()}",
+    ]
+
+
+def test_lookup_cache_invalidates_changed_keys() -> None:
+    """
+    arrange: cache a search by key ID of a key and a text search.
+    act: invalidate the fingerprint of the key.
+    assert: both entries are invalidated, while the search of another key is still cached.
+    """
+    cache = lookup_cache.LookupCache(fakeredis.FakeRedis(), ttl=60)
+    searches = {
+        "changed": ("get:changed", "4415dc328a6c8e00"),
+        "text": ("index:text", None),
+        "other": ("get:other", "0123456789abcdef"),
+    }
+    for suffix, hex_search in searches.values():
+        key, _ = cache.get(suffix, hex_search)
+        assert key is not None
+        cache.set(key, hex_search, b"text/plain\nresponse")
+
+    cache.invalidate(["2cf6a6a3b93c138fd51037564415dc328a6c8e00"])
+
+    assert {name: cache.get(*search)[1] for name, search in searches.items()} == {
+        "changed": None,
+        "text": None,
+        "other": b"text/plain\nresponse",
+    }
+    assert cache.counts == {"hit": 1, "miss": 5, "error": 0}
+
+
+def test_lookup_cache_invalidates_every_entry() -> None:
+    """
+    arrange: cache a search by key ID.
+    act: invalidate the cache without fingerprints, as after a deletion.
+    assert: the entry is invalidated.
+    """
+    cache = lookup_cache.LookupCache(fakeredis.FakeRedis(), ttl=60)
+    key, _ = cache.get("get:search", "0123456789abcdef")
+    assert key is not None
+    cache.set(key, "0123456789abcdef", b"text/plain\nresponse")
+
+    cache.invalidate(None)
+
+    assert cache.get("get:search", "0123456789abcdef")[1] is None
+
+
+def test_changed_fingerprints() -> None:
+    """
+    arrange: the responses of Hockeypuck to add requests.
+    act: get the changed fingerprints.
+    assert: the inserted and updated keys are returned, None if the response is not JSON.
+    """
+    assert lookup_cache.changed_fingerprints(b'{"inserted": ["aa"], "updated": ["bb"]}') == [
+        "aa",
+        "bb",
+    ]
+    assert lookup_cache.changed_fingerprints(b"not json") is None
+
+
+def test_proxy_appends_forwarded_for(proxy: http.client.HTTPConnection) -> None:
+    """
+    arrange: a proxy in front of Hockeypuck.
+    act: send a request already forwarded by Traefik.
+    assert: the client address is appended to the X-Forwarded-For header.
+    """
+    proxy.request("GET", "/pks/stats", headers={"X-Forwarded-For": "192.0.2.1"})
+    proxy.getresponse().read()
+
+    _, headers, _ = FakeHockeypuck.requests[0]
+    assert headers["X-Forwarded-For"] == "192.0.2.1, 127.0.0.1"
+
+
+def test_proxy_forwards_chunked_body(proxy: http.client.HTTPConnection) -> None:
+    """
+    arrange: a proxy in front of Hockeypuck.
+    act: send a request with a chunked body.
+    assert: the whole body is forwarded with its length.
+    """
+    proxy.request("POST", "/pks/add", body=iter([b"keytext=", b"armored"]), encode_chunked=True)
+    response = proxy.getresponse()
+    response.read()
+
+    assert response.status == 200
+    _, headers, body = FakeHockeypuck.requests[0]
+    assert body == b"keytext=armored"
+    assert headers["Content-Length"] == str(len(body))
+
+
+def test_proxy_head_keeps_content_length(proxy: http.client.HTTPConnection) -> None:
+    """
+    arrange: a proxy in front of Hockeypuck.
+    act: send a HEAD request.
+    assert: the length of the body of the GET request is returned, without body.
+    """
+    proxy.request("HEAD", "/pks/lookup?op=get&search=0x0123456789abcdef")
+    response = proxy.getresponse()
+
+    assert response.getheader("Content-Length") == str(len(b"pub:0123456789abcdef\n"))
+    assert response.read() == b""
+
+
+def test_proxy_counts_rate_limited_requests_with_token(
+    proxy: http.client.HTTPConnection, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    arrange: a proxy knowing the token of the Traefik errors middleware.
+    act: report a rate limited request with the token, then without it.
+    assert: only the request with the token is counted and answered 429, the other one being
+        answered 404 without reaching Hockeypuck.
+    """
+    monkeypatch.setattr(
+        lookup_cache.ProxyHandler,
+        "rate_limited",
+        dict.fromkeys(lookup_cache.RATE_LIMITED_ENDPOINTS, 0),
+    )
+    token = lookup_cache.rate_limited_token("secret-key")
+    monkeypatch.setattr(lookup_cache.ProxyHandler, "rate_limited_token", token)
+
+    proxy.request("GET", f"{lookup_cache.RATE_LIMITED_PATH}{token}/add")
+    limited = proxy.getresponse()
+    limited.read()
+    proxy.request("GET", f"{lookup_cache.RATE_LIMITED_PATH}forged/add")
+    forged = proxy.getresponse()
+    forged.read()
+
+    assert limited.status == 429
+    assert forged.status == 404
+    assert lookup_cache.ProxyHandler.rate_limited["add"] == 1
+    assert not FakeHockeypuck.requests
+
+
+@pytest.mark.parametrize("redis_related", [True, False])
+def test_main_seeds_negative_cache_with_redis(
+    monkeypatch: pytest.MonkeyPatch, redis_related: bool
+) -> None:
+    """
+    arrange: a proxy started with or without the redis integration.
+    act: run the proxy.
+    assert: the negative cache is only created and seeded with the redis integration.
+    """
+    for attribute in ("cache", "negative_cache", "rate_limited_token"):
+        monkeypatch.setattr(lookup_cache.ProxyHandler, attribute, None)
+    monkeypatch.setattr("sys.argv", ["lookup_cache.py"])
+    client = fakeredis.FakeRedis() if redis_related else None
+    monkeypatch.setattr(lookup_cache, "connect_redis", lambda: client)
+    negative_cache = mock.MagicMock()
+    monkeypatch.setattr(lookup_cache, "NegativeCache", negative_cache)
+    thread = mock.MagicMock()
+    monkeypatch.setattr(lookup_cache.threading, "Thread", thread)
+    monkeypatch.setattr(lookup_cache, "ThreadingHTTPServer", mock.MagicMock())
+
+    lookup_cache.main()
+
+    assert negative_cache.called == redis_related
+    seeded = (
+        mock.call(target=negative_cache.return_value.run, daemon=True) in thread.call_args_list
+    )
+    assert seeded == redis_related
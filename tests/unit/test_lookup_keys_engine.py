@@ -0,0 +1,61 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the lookup keys engine."""
+
+from unittest import mock
+
+import lookup_keys_engine
+import pooled_request_engine
+from tests.unit.fake_keyserver import ERROR_SEARCH, PRESENT_FINGERPRINT, PUBLIC_KEY
+
+SUMMARY = {
+    "keyword": f"0x{PRESENT_FINGERPRINT}",
+    "status": lookup_keys_engine.FOUND,
+    "keys": [
+        {
+            "fingerprint": PRESENT_FINGERPRINT,
+            "algorithm": "1",
+            "bits": "4096",
+            "created": "1700000000",
+            "expires": "",
+            "flags": "",
+            "uids": ["Alice <alice@example.com>"],
+        }
+    ],
+}
+
+
+def test_run_summarizes_each_keyword(session: mock.MagicMock) -> None:
+    """
+    arrange: a keyserver containing a single key.
+    act: look up a present, an absent and a failing keyword.
+    assert: each keyword gets its summary, in the order of the keywords, with a single index
+        lookup per keyword.
+    """
+    engine = lookup_keys_engine.LookupKeysEngine("http://127.0.0.1:11372", max_workers=4)
+
+    result = engine.run([f"0x{PRESENT_FINGERPRINT}", "absent@example.com", ERROR_SEARCH])
+
+    assert result == [
+        SUMMARY,
+        {"keyword": "absent@example.com", "status": lookup_keys_engine.NOT_FOUND},
+        {"keyword": ERROR_SEARCH, "status": f"{pooled_request_engine.FAILED}500"},
+    ]
+    assert session.get.call_count == 3
+    assert all(call.kwargs["params"]["op"] == "index" for call in session.get.call_args_list)
+
+
+def test_run_includes_armored_keys(session: mock.MagicMock) -> None:
+    """
+    arrange: a keyserver containing a single key.
+    act: look up the key with the armored keys.
+    assert: the summary includes the armored keys and their size.
+    """
+    with lookup_keys_engine.LookupKeysEngine(
+        "http://127.0.0.1:11372", max_workers=4, armored=True
+    ) as engine:
+        result = engine.run([f"0x{PRESENT_FINGERPRINT}"])
+
+    assert result == [SUMMARY | {"size": len(PUBLIC_KEY), "armored": PUBLIC_KEY}]
+    session.close.assert_called_once_with()
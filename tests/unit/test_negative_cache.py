@@ -0,0 +1,101 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the negative cache of the key lookups."""
+
+import negative_cache
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    """
+    arrange: a Bloom filter filled up to its capacity.
+    act: check the added elements and elements never added.
+    assert: every added element is found, and the false positives stay around the rate.
+    """
+    bloom_filter = negative_cache.BloomFilter(capacity=1000, false_positive_rate=0.01)
+    added = [f"{i:08x}" for i in range(1000)]
+    for element in added:
+        bloom_filter.add(element)
+
+    false_positives = sum(f"{i:08x}" in bloom_filter for i in range(1000, 11000))
+
+    assert all(element in bloom_filter for element in added)
+    assert false_positives < 300
+    assert bloom_filter.count <= 1000
+
+
+def test_bloom_filter_counts_new_elements_once() -> None:
+    """
+    arrange: an empty Bloom filter.
+    act: add the same element twice.
+    assert: the element is only counted once.
+    """
+    bloom_filter = negative_cache.BloomFilter(capacity=100)
+
+    bloom_filter.add("0123abcd")
+    bloom_filter.add("0123abcd")
+
+    assert bloom_filter.count == 1
+    assert 1234 not in bloom_filter
+
+
+def test_short_key_id() -> None:
+    """
+    arrange: searches by key ID, fingerprint and of an unsupported length.
+    act: get their short key ID.
+    assert: the lowercased last 8 digits are returned for the key IDs and fingerprints only.
+    """
+    assert negative_cache.short_key_id("0123456789ABCDEF") == "89abcdef"
+    assert negative_cache.short_key_id("2cf6a6a3b93c138fd51037564415dc328a6c8e00") == "8a6c8e00"
+    assert negative_cache.short_key_id("0123456789") is None
+
+
+def test_negative_cache_only_answers_confirmed_misses() -> None:
+    """
+    arrange: a negative cache with a filter missing a key, as if added through reconciliation.
+    act: look the key up before and after Hockeypuck confirmed the miss.
+    assert: the lookup is only answered once the miss was confirmed.
+    """
+    cache = negative_cache.NegativeCache(ttl=60)
+    cache._filter = negative_cache.BloomFilter(capacity=100)  # pylint: disable=protected-access
+
+    absent_before = cache.is_absent("get:0123456789abcdef")
+    cache.not_found("get:0123456789abcdef", "0123456789abcdef")
+
+    assert not absent_before
+    assert cache.is_absent("get:0123456789abcdef")
+    assert cache.hits == 1
+
+
+def test_negative_cache_added_keys() -> None:
+    """
+    arrange: a negative cache with confirmed misses of two key IDs and a text search.
+    act: add one of the keys.
+    assert: the misses of the added key and of the text search are dropped, not the other one.
+    """
+    cache = negative_cache.NegativeCache(ttl=60)
+    cache._filter = negative_cache.BloomFilter(capacity=100)  # pylint: disable=protected-access
+    cache.not_found("get:added", "0123456789abcdef")
+    cache.not_found("get:other", "fedcba9876543210")
+    cache.not_found("index:alice", None)
+
+    cache.added(["aaaaaaaaaaaaaaaaaaaaaaaa0123456789abcdef"])
+
+    assert not cache.is_absent("get:added")
+    assert cache.is_absent("get:other")
+    assert not cache.is_absent("index:alice")
+
+
+def test_negative_cache_unknown_added_keys() -> None:
+    """
+    arrange: a negative cache with a confirmed miss of a key ID.
+    act: add keys with unknown fingerprints.
+    assert: the miss is dropped.
+    """
+    cache = negative_cache.NegativeCache(ttl=60)
+    cache._filter = negative_cache.BloomFilter(capacity=100)  # pylint: disable=protected-access
+    cache.not_found("get:key", "0123456789abcdef")
+
+    cache.added(None)
+
+    assert not cache.is_absent("get:key")
@@ -0,0 +1,169 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the prefix tree snapshot script."""
+
+import io
+import pathlib
+import subprocess  # nosec B404
+import typing
+from unittest import mock
+
+import ptree_snapshot
+import pytest
+
+MARKER = {"keys": "2", "mtime": "2026-10-18 00:00:00+00"}
+
+
+@pytest.fixture(name="data_dir", autouse=True)
+def data_dir_fixture(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    """Data directory of the workload, holding a prefix tree, with the bucket configured."""
+    (tmp_path / "ptree").mkdir()
+    (tmp_path / "ptree" / "CURRENT").write_text("MANIFEST-000001\n", encoding="utf-8")
+    for name, path in (
+        ("PTREE_DIR", "ptree"),
+        ("PTREE_NEW_DIR", "ptree.new"),
+        ("PTREE_NEW_MARKER_FILE", "ptree.new.marker"),
+        ("PTREE_SNAPSHOT_DIR", "ptree.snapshot"),
+        ("PTREE_SNAPSHOT_MARKER_FILE", "ptree.snapshot.json"),
+    ):
+        monkeypatch.setattr(ptree_snapshot, name, str(tmp_path / path))
+    monkeypatch.setenv("S3_BUCKET", "bucket")
+    monkeypatch.setenv("S3_PATH", "/backups/")
+    return tmp_path
+
+
+@pytest.fixture(name="cursor", autouse=True)
+def cursor_fixture(monkeypatch: pytest.MonkeyPatch) -> mock.MagicMock:
+    """Cursor of a stubbed database, matching the marker."""
+    cursor = mock.MagicMock()
+    cursor.fetchone.return_value = (int(MARKER["keys"]), MARKER["mtime"])
+    connection = mock.MagicMock()
+    connection.__enter__.return_value = connection
+    connection.cursor.return_value.__enter__.return_value = cursor
+    monkeypatch.setattr(ptree_snapshot.psycopg2, "connect", mock.Mock(return_value=connection))
+    return cursor
+
+
+def _archive(directory: pathlib.Path) -> bytes:
+    """Archive a directory as a snapshot.
+
+    Args:
+        directory: the directory to archive.
+
+    Returns:
+        The compressed tarball of the directory.
+    """
+    return subprocess.run(  # nosec B603 B607
+        ["tar", "-C", str(directory), "-czf", "-", "."], check=True, capture_output=True
+    ).stdout
+
+
+def test_latest_snapshot_under_path() -> None:
+    """
+    arrange: a bucket with snapshots over two pages and another object under the S3 path.
+    act: find the latest snapshot.
+    assert: the snapshots are listed under the S3 path and the latest one is returned.
+    """
+    client = mock.Mock()
+    client.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "backups/ptree/20261017T000000Z.tar.gz"}]},
+        {
+            "Contents": [
+                {"Key": "backups/ptree/20261018T000000Z.tar.gz"},
+                {"Key": "backups/ptree/20261019T000000Z.tar.gz.partial"},
+            ]
+        },
+    ]
+
+    latest = ptree_snapshot._latest_snapshot(client)  # pylint: disable=protected-access
+
+    client.get_paginator.return_value.paginate.assert_called_once_with(
+        Bucket="bucket", Prefix="backups/ptree/"
+    )
+    assert latest == "backups/ptree/20261018T000000Z.tar.gz"
+
+
+def test_upload_without_copy() -> None:
+    """
+    arrange: no copy of the prefix tree.
+    act: upload the snapshot.
+    assert: the upload fails without reaching the bucket.
+    """
+    client = mock.Mock()
+
+    with pytest.raises(ptree_snapshot.SnapshotError):
+        ptree_snapshot._upload(client)  # pylint: disable=protected-access
+
+    client.upload_fileobj.assert_not_called()
+
+
+def test_upload_cleans_up_copy(data_dir: pathlib.Path) -> None:
+    """
+    arrange: a copy of the prefix tree with its database marker.
+    act: upload the snapshot.
+    assert: the tarball of the copy is uploaded with the marker, and the copy is removed.
+    """
+    ptree_snapshot._copy()  # pylint: disable=protected-access
+    uploaded: dict[str, typing.Any] = {}
+    client = mock.Mock()
+    client.upload_fileobj.side_effect = lambda stream, bucket, key, ExtraArgs: uploaded.update(
+        body=stream.read(), key=key, metadata=ExtraArgs["Metadata"]
+    )
+
+    result = ptree_snapshot._upload(client)  # pylint: disable=protected-access
+
+    assert uploaded["key"].startswith("backups/ptree/")
+    assert uploaded["metadata"] == MARKER
+    assert result == {"snapshot": uploaded["key"], **MARKER}
+    assert uploaded["body"][:2] == b"\x1f\x8b"
+    assert not (data_dir / "ptree.snapshot").exists()
+    assert not (data_dir / "ptree.snapshot.json").exists()
+
+
+@pytest.mark.parametrize(
+    "database_keys, stale",
+    [
+        pytest.param(int(MARKER["keys"]), False, id="database unchanged"),
+        pytest.param(3, True, id="database changed"),
+    ],
+)
+def test_download_writes_marker(
+    data_dir: pathlib.Path, cursor: mock.MagicMock, database_keys: int, stale: bool
+) -> None:
+    """
+    arrange: a snapshot in the bucket, the database changed since or not.
+    act: download the snapshot.
+    assert: the snapshot is extracted into ptree.new with the marker of its modification time,
+        and reported stale if the database changed since.
+    """
+    cursor.fetchone.return_value = (database_keys, MARKER["mtime"])
+    client = mock.Mock()
+    client.get_object.return_value = {
+        "Body": io.BytesIO(_archive(data_dir / "ptree")),
+        "Metadata": MARKER,
+    }
+
+    result = ptree_snapshot._download(  # pylint: disable=protected-access
+        client, "snapshot.tar.gz"
+    )
+
+    assert result == {"snapshot": "snapshot.tar.gz", **MARKER, "stale": stale}
+    assert (data_dir / "ptree.new" / "CURRENT").is_file()
+    assert (data_dir / "ptree.new.marker").read_text(encoding="utf-8") == MARKER["mtime"]
+
+
+def test_download_tar_failure_removes_ptree_new(data_dir: pathlib.Path) -> None:
+    """
+    arrange: a corrupted snapshot in the bucket.
+    act: download the snapshot.
+    assert: the download fails, leaving neither ptree.new nor its marker behind.
+    """
+    client = mock.Mock()
+    client.get_object.return_value = {"Body": io.BytesIO(b"not a tarball"), "Metadata": MARKER}
+
+    with pytest.raises(ptree_snapshot.SnapshotError):
+        ptree_snapshot._download(client, "snapshot.tar.gz")  # pylint: disable=protected-access
+
+    assert not (data_dir / "ptree.new").exists()
+    assert not (data_dir / "ptree.new.marker").exists()
@@ -0,0 +1,52 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the signers module."""
+
+import pathlib
+from unittest import mock
+
+import pytest
+
+import admin_gpg
+import signers
+
+
+def test_signing_session_falls_back_to_gpg(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    """
+    arrange: an admin private key that cannot be loaded in-process.
+    act: sign a request within and outside a signing session.
+    assert: the gpg binary signs the requests and the session signer is cleared on exit.
+    """
+    gpg = mock.MagicMock()
+    gpg.list_keys.return_value = [{"fingerprint": "A" * 40}]
+    gpg.sign.return_value = "signature"
+    monkeypatch.setattr(admin_gpg.gnupg, "GPG", mock.Mock(return_value=gpg))
+    model = mock.MagicMock()
+    model.get_secret.return_value.get_content.return_value = {
+        "adminprivatekey": "not a key",
+        "adminfingerprint": "A" * 40,
+        "adminpassword": "password",
+    }
+    instance = admin_gpg.AdminGPG(model, gnupghome=tmp_path)
+
+    with instance.signing_session():
+        assert instance.generate_signature("request") == "signature"
+    assert instance.generate_signature("request") == "signature"
+
+    assert gpg.sign.call_count == 2
+    assert instance._session_signer is None  # pylint: disable=protected-access
+
+
+def test_open_openpgp_signer_without_pgpy(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    arrange: PGPy is not installed.
+    act: open an in-process signer.
+    assert: no signer is returned.
+    """
+    monkeypatch.setattr(signers, "pgpy", None)
+
+    with signers.open_openpgp_signer("private key", "password") as signer:
+        assert signer is None
@@ -5,7 +5,9 @@
 
 """Unit tests for traefik route observer."""
 
+import collections
 import socket
+import typing
 from unittest import mock
 
 import ops
@@ -13,14 +15,31 @@ import pytest
 from ops.testing import Harness
 
 import traefik_route_observer
-from actions import RECONCILIATION_PORT
+from actions import LOOKUP_CACHE_PORT, RECONCILIATION_PORT
 
 REQUIRER_METADATA = """
 name: observer-charm
 requires:
   traefik-route:
     interface: traefik_route
+containers:
+  app: {}
 """
+REQUIRER_CONFIG = """
+options:
+  recon-health-check-interval:
+    type: string
+  hkp-hostname:
+    type: string
+  external-peers:
+    type: string
+  recon-allowed-cidrs:
+    type: string
+  rate-limit-add:
+    type: int
+    default: 0
+"""
+SECRET_KEY = "secret-key"
 
 
 class ObservedCharm(ops.CharmBase):
@@ -33,7 +52,9 @@ class ObservedCharm(ops.CharmBase):
             args: Variable list of positional arguments passed to the parent constructor.
         """
         super().__init__(*args)
-        self.traefik_route = traefik_route_observer.TraefikRouteObserver(self)
+        self.traefik_route = traefik_route_observer.TraefikRouteObserver(
+            self, secret_key=SECRET_KEY
+        )
 
 
 def test_on_traefik_route_relation_joined_when_leader(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -51,6 +72,8 @@ def test_on_traefik_route_relation_joined_when_leader(monkeypatch: pytest.Monkey
     requirer_mock = mock.MagicMock()
     requirer_mock.is_ready.return_value = True
     requirer_mock.units = set()
+    requirer_mock.id = 1
+    requirer_mock.data = collections.defaultdict(dict)
     monkeypatch.setattr(harness.charm.traefik_route, "traefik_route", requirer_mock)
     monkeypatch.setattr(socket, "getfqdn", lambda: "hockeypuck.local")
     monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: requirer_mock)
@@ -60,13 +83,23 @@ def test_on_traefik_route_relation_joined_when_leader(monkeypatch: pytest.Monkey
     requirer_mock.submit_to_traefik.assert_called_once_with(
         {
             "tcp": {
-                "routers": traefik_route_observer.HOCKEYPUCK_TCP_ROUTER,
+                "routers": {},
                 "services": {
-                    "hockeypuck-tcp-service": {
+                    "hockeypuck-tcp-observer-charm-0": {
                         "loadBalancer": {
                             "servers": [{"address": f"hockeypuck.local:{RECONCILIATION_PORT}"}]
                         },
-                    }
+                    },
+                    "hockeypuck-tcp-service": {
+                        "weighted": {
+                            "services": [
+                                {
+                                    "name": "hockeypuck-tcp-observer-charm-0",
+                                    "weight": traefik_route_observer.RECON_WEIGHT_READY,
+                                }
+                            ]
+                        }
+                    },
                 },
             }
         },
@@ -74,6 +107,262 @@ def test_on_traefik_route_relation_joined_when_leader(monkeypatch: pytest.Monkey
     )
 
 
+def test_configure_traefik_route_skips_unchanged_config(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    arrange: instantiate a charm with leadership having submitted its traefik-route config.
+    act: configure the traefik-route again, then with an additional unit.
+    assert: the configuration is only submitted again once it changed.
+    """
+    harness = Harness(ObservedCharm, meta=REQUIRER_METADATA)
+    harness.set_model_name("testing")
+    harness.begin_with_initial_hooks()
+    harness.set_leader(True)
+    harness.add_relation(traefik_route_observer.RELATION_NAME, "traefik-route-provider")
+    requirer_mock = mock.MagicMock()
+    requirer_mock.is_ready.return_value = True
+    requirer_mock.units = set()
+    requirer_mock.id = 1
+    requirer_mock.data = collections.defaultdict(dict)
+    monkeypatch.setattr(harness.charm.traefik_route, "traefik_route", requirer_mock)
+    monkeypatch.setattr(socket, "getfqdn", lambda: "hockeypuck.local")
+    monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: requirer_mock)
+    observer = harness.charm.traefik_route
+    observer._configure_traefik_route()  # pylint: disable=protected-access
+
+    observer._configure_traefik_route()  # pylint: disable=protected-access
+    assert requirer_mock.submit_to_traefik.call_count == 1
+    unit = mock.Mock()
+    unit.name = "hockeypuck-k8s/1"
+    requirer_mock.units = {unit}
+    observer._configure_traefik_route()  # pylint: disable=protected-access
+
+    assert requirer_mock.submit_to_traefik.call_count == 2
+
+
+def test_route_config_weights_units_by_recon_readiness(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    arrange: instantiate a leader charm with a degraded and a draining peer unit.
+    act: get the traefik-route configuration.
+    assert: the draining unit is omitted, and the others are health-checked and weighted by the
+        weight they published, the weighted service propagating their health.
+    """
+    harness = Harness(ObservedCharm, meta=REQUIRER_METADATA, config=REQUIRER_CONFIG)
+    harness.set_model_name("testing")
+    harness.update_config({"recon-health-check-interval": "10s"})
+    harness.begin()
+    harness.set_leader(True)
+    degraded_unit, draining_unit = mock.Mock(), mock.Mock()
+    degraded_unit.name, draining_unit.name = "observer-charm/1", "observer-charm/2"
+    relation_mock = mock.MagicMock()
+    relation_mock.units = {degraded_unit, draining_unit}
+    relation_mock.data = {
+        harness.charm.unit: {},
+        degraded_unit: {traefik_route_observer.RECON_WEIGHT_KEY: "1"},
+        draining_unit: {traefik_route_observer.RECON_WEIGHT_KEY: "0"},
+    }
+    monkeypatch.setattr(socket, "getfqdn", lambda: "hockeypuck.local")
+    monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: relation_mock)
+
+    route_config = typing.cast(
+        dict[str, typing.Any],
+        harness.charm.traefik_route._route_config,  # pylint: disable=protected-access
+    )
+
+    services = route_config["tcp"]["services"]
+    assert services["hockeypuck-tcp-observer-charm-1"] == {
+        "loadBalancer": {
+            "servers": [
+                {
+                    "address": "observer-charm-1.observer-charm-endpoints.testing.svc:"
+                    f"{RECONCILIATION_PORT}"
+                }
+            ],
+            "healthCheck": {
+                "interval": "10s",
+                "timeout": traefik_route_observer.RECON_HEALTH_CHECK_TIMEOUT,
+            },
+        }
+    }
+    assert services["hockeypuck-tcp-service"]["weighted"]["healthCheck"] == {}
+    assert sorted(
+        services["hockeypuck-tcp-service"]["weighted"]["services"], key=lambda s: s["name"]
+    ) == [
+        {"name": "hockeypuck-tcp-observer-charm-0", "weight": 10},
+        {"name": "hockeypuck-tcp-observer-charm-1", "weight": 1},
+    ]
+
+
+def test_route_config_routes_hkp_when_hostname_configured(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    arrange: instantiate a leader charm with the hkp-hostname configured.
+    act: get the traefik-route configuration.
+    assert: the /pks/ requests and the webroot assets are routed with compression to the lookup
+        cache of the unit.
+    """
+    harness = Harness(ObservedCharm, meta=REQUIRER_METADATA, config=REQUIRER_CONFIG)
+    harness.update_config({"hkp-hostname": "keyserver.example.com"})
+    harness.begin()
+    relation_mock = mock.MagicMock()
+    relation_mock.units = set()
+    relation_mock.data = collections.defaultdict(dict)
+    monkeypatch.setattr(socket, "getfqdn", lambda: "hockeypuck.local")
+    monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: relation_mock)
+
+    route_config = typing.cast(
+        dict[str, typing.Any],
+        harness.charm.traefik_route._route_config,  # pylint: disable=protected-access
+    )
+
+    http_config = route_config["http"]
+    assert http_config["routers"]["hockeypuck-hkp-router"] == {
+        "rule": "Host(`keyserver.example.com`) && PathPrefix(`/pks/`)",
+        "priority": traefik_route_observer.HKP_ROUTER_PRIORITY,
+        "service": "hockeypuck-http-service",
+        "middlewares": ["hockeypuck-compress"],
+        "entryPoints": ["web"],
+    }
+    assert http_config["routers"]["hockeypuck-webroot-router-tls"]["tls"] == {}
+    assert "compress" in http_config["middlewares"]["hockeypuck-compress"]
+    assert http_config["services"]["hockeypuck-http-service"]["loadBalancer"]["servers"] == [
+        {"url": f"http://hockeypuck.local:{LOOKUP_CACHE_PORT}"}
+    ]
+
+
+def test_route_config_allows_recon_from_peers_and_allowlist(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    arrange: instantiate a charm with external peers and an allowlist, one of them invalid.
+    act: get the traefik-route configuration.
+    assert: the recon router only matches the resolved peer addresses and the valid networks.
+    """
+    harness = Harness(ObservedCharm, meta=REQUIRER_METADATA, config=REQUIRER_CONFIG)
+    harness.update_config(
+        {
+            "external-peers": "keyserver.example.com,11371,11370\n192.0.2.10,11371,11370\n",
+            "recon-allowed-cidrs": "198.51.100.1/24, invalid",
+        }
+    )
+    harness.begin()
+    relation_mock = mock.MagicMock()
+    relation_mock.units = set()
+    relation_mock.data = collections.defaultdict(dict)
+    monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: relation_mock)
+    monkeypatch.setattr(
+        socket,
+        "getaddrinfo",
+        lambda host, *_, **__: (
+            [(None, None, None, "", ("203.0.113.5", 0))]
+            if host == "keyserver.example.com"
+            else [(None, None, None, "", (host, 0))]
+        ),
+    )
+
+    route_config = typing.cast(
+        dict[str, typing.Any],
+        harness.charm.traefik_route._route_config,  # pylint: disable=protected-access
+    )
+
+    assert route_config["tcp"]["routers"]["hockeypuck-tcp-router"]["rule"] == (
+        "ClientIP(`203.0.113.5/32`) || ClientIP(`192.0.2.10/32`) || ClientIP(`198.51.100.0/24`)"
+    )
+
+
+def test_route_config_keeps_peer_addresses_on_resolution_failure(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    arrange: instantiate a charm with an external peer resolved once.
+    act: get the traefik-route configuration while the resolution of the peer fails.
+    assert: the recon router still matches the last resolved address of the peer.
+    """
+    harness = Harness(ObservedCharm, meta=REQUIRER_METADATA, config=REQUIRER_CONFIG)
+    harness.update_config({"external-peers": "keyserver.example.com,11371,11370"})
+    harness.begin()
+    relation_mock = mock.MagicMock()
+    relation_mock.units = set()
+    relation_mock.data = collections.defaultdict(dict)
+    monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: relation_mock)
+    getaddrinfo = mock.MagicMock(return_value=[(None, None, None, "", ("203.0.113.5", 0))])
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    observer = harness.charm.traefik_route
+    assert observer._route_config["tcp"]["routers"]  # pylint: disable=protected-access
+    getaddrinfo.side_effect = socket.gaierror("Temporary failure in name resolution")
+
+    route_config = typing.cast(
+        dict[str, typing.Any], observer._route_config  # pylint: disable=protected-access
+    )
+
+    assert route_config["tcp"]["routers"]["hockeypuck-tcp-router"]["rule"] == (
+        "ClientIP(`203.0.113.5/32`)"
+    )
+
+
+def test_route_config_closes_recon_without_allowed_clients(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    """
+    arrange: instantiate a charm without external peers nor allowlist.
+    act: get the traefik-route configuration.
+    assert: no recon router is returned and the closed reconciliation is logged.
+    """
+    harness = Harness(ObservedCharm, meta=REQUIRER_METADATA, config=REQUIRER_CONFIG)
+    harness.begin()
+    relation_mock = mock.MagicMock()
+    relation_mock.units = set()
+    relation_mock.data = collections.defaultdict(dict)
+    monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: relation_mock)
+
+    route_config = typing.cast(
+        dict[str, typing.Any],
+        harness.charm.traefik_route._route_config,  # pylint: disable=protected-access
+    )
+
+    assert not route_config["tcp"]["routers"]
+    assert "Reconciliation closed" in caplog.text
+
+
+def test_route_config_rate_limits_configured_endpoints(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    arrange: instantiate a charm routing the HKP requests with a rate limit on /pks/add.
+    act: get the traefik-route configuration.
+    assert: the /pks/add requests are rate limited ahead of the HKP router, itself ahead of the
+        webroot router, their rejections being reported to the lookup cache with its token.
+    """
+    harness = Harness(ObservedCharm, meta=REQUIRER_METADATA, config=REQUIRER_CONFIG)
+    harness.update_config({"hkp-hostname": "keyserver.example.com", "rate-limit-add": 30})
+    harness.begin()
+    relation_mock = mock.MagicMock()
+    relation_mock.units = set()
+    relation_mock.data = collections.defaultdict(dict)
+    monkeypatch.setattr(socket, "getfqdn", lambda: "hockeypuck.local")
+    monkeypatch.setattr(harness.charm.model, "get_relation", lambda _: relation_mock)
+
+    route_config = typing.cast(
+        dict[str, typing.Any],
+        harness.charm.traefik_route._route_config,  # pylint: disable=protected-access
+    )
+
+    routers = route_config["http"]["routers"]
+    middlewares = route_config["http"]["middlewares"]
+    assert routers["hockeypuck-add-router"]["middlewares"] == [
+        "hockeypuck-rate-limited-add",
+        "hockeypuck-rate-limit-add",
+        "hockeypuck-compress",
+    ]
+    assert (
+        routers["hockeypuck-add-router"]["priority"]
+        > routers["hockeypuck-hkp-router"]["priority"]
+        > routers["hockeypuck-webroot-router"]["priority"]
+    )
+    assert middlewares["hockeypuck-rate-limit-add"]["rateLimit"]["average"] == 30
+    token = traefik_route_observer.rate_limited_token(SECRET_KEY)
+    assert middlewares["hockeypuck-rate-limited-add"]["errors"]["query"] == (
+        f"{traefik_route_observer.RATE_LIMITED_PATH}{token}/add"
+    )
+    assert "hockeypuck-lookup-router" not in routers
+
+
 def test_on_traefik_route_relation_joined_when_not_leader(monkeypatch: pytest.MonkeyPatch) -> None:
     """
     arrange: instantiate a charm without leadership implementing the traefik-route relation.